@@ -0,0 +1,181 @@
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_REJECTED
+
+# Off unless RATE_LIMIT_ENABLED=true: clients are told apart by socket address, so behind
+# a proxy every user shares one bucket until RATE_LIMIT_TRUST_FORWARDED_FOR is set too
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "false").lower() in ("1", "true", "yes", "on")
+# Use the first X-Forwarded-For address as the client; only safe behind a proxy that sets it
+TRUST_FORWARDED_FOR = os.environ.get("RATE_LIMIT_TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes", "on")
+# Buckets of the least recently seen clients are dropped beyond this many
+MAX_BUCKETS = int(os.environ.get("RATE_LIMIT_MAX_BUCKETS", "10000"))
+# How long a request may wait for an in-flight slot before getting a 503
+QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_SECONDS", "0.5"))
+OVERLOAD_RETRY_AFTER = 1  # seconds, sent with 503s
+
+# Paths that are never limited: probes, scrapes and the long-lived event stream
+EXEMPT_PATHS = ("/api/health", "/api/metrics", "/api/events")
+UPLOAD_PATHS = ("/api/upload-image", "/api/upload-base64-image")
+
+class Policy(NamedTuple):
+    per_minute: float  # sustained requests per client and route
+    burst: int  # requests a client may make at once before the rate applies
+    max_in_flight: int  # concurrent requests of this class across all clients
+
+def _policy(name: str, per_minute: float, burst: int, max_in_flight: int) -> Policy:
+    prefix = name.upper()
+    return Policy(
+        float(os.environ.get(f"RATE_LIMIT_{prefix}_PER_MINUTE", per_minute)),
+        int(os.environ.get(f"RATE_LIMIT_{prefix}_BURST", burst)),
+        int(os.environ.get(f"MAX_IN_FLIGHT_{prefix}", max_in_flight)),
+    )
+
+# Uploads buffer up to 5MB each, so they get the smallest share
+POLICIES = {
+    "upload": _policy("upload", 30, 10, 16),
+    "write": _policy("write", 300, 60, 64),
+    "read": _policy("read", 1200, 200, 256),
+}
+
+class TokenBucket:
+    """Refills at rate tokens per second up to capacity; each request takes one"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: int, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take a token; returns 0 on success, else the seconds until one is available"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    """Token buckets keyed by client and route, bounded to the most recent clients"""
+
+    def __init__(self, max_buckets: int = MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[Tuple, TokenBucket]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def check(self, key: Tuple, policy: Policy) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(policy.per_minute / 60, policy.burst, now)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(now)
+
+class AdmissionMiddleware:
+    """ASGI middleware applying per-client rate limits and per-class in-flight caps.
+
+    Requests are classified as uploads, writes or reads. Each client gets a
+    token bucket per route (429 when empty) and each class a semaphore
+    (503 when no slot frees up within ADMISSION_QUEUE_TIMEOUT_SECONDS), so
+    an upload burst cannot starve cheap reads. Both answer with
+    Retry-After before the request body is read. Limits are per process.
+    """
+
+    def __init__(self, app, routes=()):
+        self.app = app
+        self.routes = routes
+        self.limiter = RateLimiter()
+        self.slots: Dict[str, asyncio.Semaphore] = {
+            name: asyncio.Semaphore(policy.max_in_flight) for name, policy in POLICIES.items()
+        }
+
+    @staticmethod
+    def classify(method: str, path: str) -> Optional[str]:
+        if method == "OPTIONS" or not path.startswith("/api/") or path in EXEMPT_PATHS:
+            return None
+        if path in UPLOAD_PATHS:
+            return "upload"
+        return "read" if method in ("GET", "HEAD") else "write"
+
+    @staticmethod
+    def client_id(scope) -> str:
+        if TRUST_FORWARDED_FOR:
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    def route_template(self, scope) -> str:
+        """The matching route's path template, so /memos/{memo_id} is one bucket per client"""
+        from starlette.routing import Match
+
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match != Match.NONE:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        kind = self.classify(scope["method"], scope["path"])
+        if kind is None:
+            await self.app(scope, receive, send)
+            return
+        policy = POLICIES[kind]
+
+        key = (self.client_id(scope), scope["method"], self.route_template(scope))
+        wait = self.limiter.check(key, policy)
+        if wait:
+            ADMISSION_REJECTED.inc(kind, "rate_limited")
+            await self._reject(send, 429, "Too many requests", math.ceil(wait))
+            return
+
+        slots = self.slots[kind]
+        if slots.locked():
+            try:
+                # asyncio.timeout cancels the acquire itself, so a timed-out wait never holds a permit
+                async with asyncio.timeout(QUEUE_TIMEOUT):
+                    await slots.acquire()
+            except TimeoutError:
+                ADMISSION_REJECTED.inc(kind, "overloaded")
+                await self._reject(send, 503, "Server is busy, try again shortly", OVERLOAD_RETRY_AFTER)
+                return
+        else:
+            await slots.acquire()
+
+        ADMISSION_IN_FLIGHT.inc(kind)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            ADMISSION_IN_FLIGHT.dec(kind)
+            slots.release()
+
+    @staticmethod
+    async def _reject(send, status: int, detail: str, retry_after: int):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
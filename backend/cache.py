@@ -0,0 +1,173 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = float(os.environ.get("MEMO_CACHE_TTL", "300"))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("MEMO_CACHE_SIZE", "10000"))
+
+class CacheBackend:
+    """Minimal async key/value interface, a subset of redis.asyncio.Redis.
+
+    Cached values must be treated as read-only by callers.
+    """
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ex: Optional[float] = None):
+        raise NotImplementedError
+
+    async def delete(self, *keys: str):
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+class InMemoryCache(CacheBackend):
+    """Per-process LRU cache with per-entry TTL"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, default_ttl: float = DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ex: Optional[float] = None):
+        ttl = ex if ex is not None else self.default_ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "evictions": self.evictions}
+
+def _encode_default(value: Any):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"Type is not cacheable: {type(value).__name__}")
+
+def _restore(value: Any) -> Any:
+    if isinstance(value, dict):
+        if len(value) == 1 and "$date" in value:
+            return datetime.fromisoformat(value["$date"])
+        return {key: _restore(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_restore(item) for item in value]
+    return value
+
+def encode_value(value: Any) -> bytes:
+    """JSON bytes for a cached value; datetimes are tagged so they come back as datetimes"""
+    return orjson.dumps(value, default=_encode_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+def decode_value(raw: bytes) -> Any:
+    """Inverse of encode_value (tuples come back as lists)"""
+    return _restore(orjson.loads(raw))
+
+class RedisCache(CacheBackend):
+    """Shares the cache between workers through a redis.asyncio-compatible client.
+
+    Values are stored as JSON, never pickled, so whoever can write to the
+    shared Redis cannot make the API run code.
+    """
+
+    def __init__(self, client, prefix: str = "time-notes:", default_ttl: float = DEFAULT_TTL):
+        self.client = client
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.client.get(self.prefix + key)
+        return decode_value(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ex: Optional[float] = None):
+        ttl = ex if ex is not None else self.default_ttl
+        await self.client.set(self.prefix + key, encode_value(value), px=int(ttl * 1000))
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self.client.delete(*(self.prefix + key for key in keys))
+
+class MemoCache:
+    """Memos by id plus versioned snapshots of list pages.
+
+    Pages are keyed by the collection version kept in MongoDB, which every
+    write bumps, so pages cached under an older version are simply never
+    read again and age out of the backend.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float = DEFAULT_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def memo_key(memo_id: str) -> str:
+        return f"memo:{memo_id}"
+
+    async def _get(self, key: str) -> Optional[Any]:
+        value = await self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def get_memo(self, memo_id: str) -> Optional[dict]:
+        return await self._get(self.memo_key(memo_id))
+
+    async def set_memo(self, memo: dict):
+        await self.backend.set(self.memo_key(memo["id"]), memo, ex=self.ttl)
+
+    async def invalidate_memo(self, memo_id: str):
+        await self.backend.delete(self.memo_key(memo_id))
+
+    async def get_page(self, version: int, page_key: str) -> Optional[Any]:
+        return await self._get(f"list:{version}:{page_key}")
+
+    async def set_page(self, version: int, page_key: str, page: Any):
+        await self.backend.set(f"list:{version}:{page_key}", page, ex=self.ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            **self.backend.stats(),
+        }
+
+def create_cache_backend() -> CacheBackend:
+    """In-memory cache, or Redis when MEMO_CACHE_URL is set"""
+    url = os.environ.get("MEMO_CACHE_URL")
+    if not url:
+        return InMemoryCache()
+    try:
+        import redis.asyncio as redis
+    except ImportError:
+        logger.warning("MEMO_CACHE_URL is set but redis is not installed; using the in-memory cache")
+        return InMemoryCache()
+    return RedisCache(redis.from_url(url))
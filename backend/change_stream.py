@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# auto: tail the memo change stream when MongoDB supports it; off: in-process bus only
+CHANGE_STREAM_MODE = os.environ.get("MEMO_CHANGE_STREAM", "auto").lower()
+# Resume tokens are saved at most this often while changes flow
+TOKEN_SAVE_INTERVAL = 1.0
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+# InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost
+RESUME_FAILED_CODES = (260, 280, 286)
+# Each worker holds one numbered token slot; a slot whose owner has not
+# heartbeated for SLOT_TIMEOUT is free for the next worker that starts
+SLOT_HEARTBEAT_INTERVAL = 10.0
+SLOT_TIMEOUT = timedelta(seconds=60)
+# Slots no worker has touched for this long are dropped by a TTL index
+SYNC_STATE_TTL_SECONDS = int(os.environ.get("MEMO_SYNC_STATE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+class MemoChange(NamedTuple):
+    operation: str  # "insert", "update", "delete" or "resync"
+    memo_id: Optional[str] = None
+    memo: Optional[dict] = None  # the memo after the change; None for deletes
+    local: bool = False  # written by this process rather than read from the stream
+
+ChangeListener = Callable[[MemoChange], Awaitable[None]]
+
+class ChangeFeed:
+    """Fan-out of memo writes to in-process listeners (caches, scheduler, SSE clients).
+
+    When MongoDB supports change streams (replica set or sharded cluster),
+    every worker tails ``db.memos`` and so sees the writes of every other
+    worker, resuming from a persisted token after reconnects. Tokens live
+    in numbered slots per host (or MEMO_CHANGE_STREAM_NAME) that workers
+    claim at startup, so a restarted worker picks up where a stopped one
+    left off. Otherwise the feed is an in-memory bus carrying this process's own writes.
+    """
+
+    def __init__(self, name: Optional[str] = None):
+        # Workers sharing a name share its token slots, one slot per live worker
+        self.name = name or os.environ.get("MEMO_CHANGE_STREAM_NAME") or socket.gethostname()
+        self.slot: Optional[int] = None
+        self.streaming = False
+        self._owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        self._listeners: List[ChangeListener] = []
+        self._task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._collection = None
+        self._state = None
+        self._token: Optional[dict] = None
+        self._token_saved_at = 0.0
+        self._token_dirty = False
+
+    @property
+    def _state_id(self) -> str:
+        return f"memos:{self.name}:{self.slot}"
+
+    def add_listener(self, listener: ChangeListener):
+        """Register a coroutine called with every MemoChange"""
+        self._listeners.append(listener)
+
+    async def publish(self, change: MemoChange):
+        for listener in self._listeners:
+            try:
+                await listener(change)
+            except Exception:
+                logger.exception(f"Change listener failed for {change.operation} of memo {change.memo_id}")
+
+    async def record(self, operation: str, memo_id: str, memo: Optional[dict] = None):
+        """Publish a write made by this process; while streaming it arrives from MongoDB instead"""
+        if not self.streaming:
+            await self.publish(MemoChange(operation, memo_id, memo, local=True))
+
+    async def start(self, collection, state_collection, mode: str = CHANGE_STREAM_MODE):
+        """Tail the collection's change stream, or stay an in-memory bus if that is unavailable"""
+        if mode == "off":
+            logger.info("Memo change stream disabled; using the in-process change bus")
+            return
+        if not await self._supports_change_streams(collection):
+            logger.info("MongoDB does not support change streams; using the in-process change bus")
+            return
+
+        self._collection = collection
+        self._state = state_collection
+        try:
+            await state_collection.create_index("updated_at", expireAfterSeconds=SYNC_STATE_TTL_SECONDS)
+        except OperationFailure as e:
+            logger.warning(f"Could not create the sync_state TTL index: {e}")
+        self._token = await self._claim_slot()
+        self.streaming = True
+        self._task = asyncio.create_task(self._run())
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        logger.info(f"Tailing the {collection.name} change stream as {self._state_id}")
+
+    async def _claim_slot(self) -> Optional[dict]:
+        """Take the lowest numbered token slot no live worker holds and return its saved token"""
+        slot = 0
+        while True:
+            now = datetime.utcnow()
+            self.slot = slot
+            try:
+                claimed = await self._state.find_one_and_update(
+                    {"_id": self._state_id, "$or": [{"owner": None}, {"heartbeat_at": {"$lt": now - SLOT_TIMEOUT}}]},
+                    {"$set": {"owner": self._owner, "heartbeat_at": now, "updated_at": now}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                slot += 1  # held by a live worker
+                continue
+            return claimed.get("token")
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(SLOT_HEARTBEAT_INTERVAL)
+            try:
+                now = datetime.utcnow()
+                result = await self._state.update_one(
+                    {"_id": self._state_id, "owner": self._owner},
+                    {"$set": {"heartbeat_at": now, "updated_at": now}}
+                )
+                if result.matched_count == 0:
+                    # Stalled past SLOT_TIMEOUT and taken over; our token is still in memory
+                    logger.warning(f"Lost change stream token slot {self._state_id}; claiming another")
+                    await self._claim_slot()
+            except PyMongoError as e:
+                logger.warning(f"Could not refresh change stream token slot {self._state_id}: {e}")
+
+    @staticmethod
+    async def _supports_change_streams(collection) -> bool:
+        try:
+            hello = await collection.database.command("hello")
+        except Exception as e:
+            logger.info(f"Could not check for change stream support: {e}")
+            return False
+        return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+    async def stop(self):
+        if self._task is not None:
+            for task in (self._task, self._heartbeat_task):
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+            self._task = None
+            self._heartbeat_task = None
+            if self._token_dirty:
+                await self._save_token(force=True)
+            # Hand the slot, and its token, to the next worker that starts
+            await self._state.update_one({"_id": self._state_id, "owner": self._owner}, {"$set": {"owner": None}})
+        self.streaming = False
+
+    async def _run(self):
+        delay = RETRY_DELAY
+        while True:
+            try:
+                async with self._collection.watch(full_document="updateLookup", resume_after=self._token) as stream:
+                    delay = RETRY_DELAY
+                    async for event in stream:
+                        await self._dispatch(event)
+                        self._token = stream.resume_token
+                        await self._save_token()
+            except OperationFailure as e:
+                if e.code in RESUME_FAILED_CODES:
+                    # Changes since the saved token are gone: start over and let listeners reload
+                    logger.warning(f"Cannot resume the memo change stream ({e}); resyncing")
+                    self._token = None
+                    await self.publish(MemoChange("resync"))
+                    continue
+                logger.warning(f"Memo change stream failed: {e}")
+            except PyMongoError as e:
+                logger.warning(f"Memo change stream failed: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    async def _dispatch(self, event: dict):
+        operation = event["operationType"]
+        if operation in ("insert", "update", "replace"):
+            memo = event.get("fullDocument")
+            if memo is None:
+                return  # deleted before the lookup; its delete event follows
+            memo = {**memo, "id": str(memo["_id"])}
+            memo.pop("_id")
+            await self.publish(MemoChange("insert" if operation == "insert" else "update", memo["id"], memo))
+        elif operation == "delete":
+            await self.publish(MemoChange("delete", str(event["documentKey"]["_id"])))
+        elif operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            self._token = None
+            await self.publish(MemoChange("resync"))
+
+    async def _save_token(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._token_saved_at < TOKEN_SAVE_INTERVAL:
+            self._token_dirty = True
+            return
+        await self._state.update_one(
+            {"_id": self._state_id, "owner": self._owner},
+            {"$set": {"token": self._token, "updated_at": datetime.utcnow()}}
+        )
+        self._token_saved_at = now
+        self._token_dirty = False
+
+# Global change feed instance
+change_feed = ChangeFeed()
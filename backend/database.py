@@ -1,91 +1,684 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Set, Tuple
+import asyncio
 import os
+import time
+import uuid
 from pathlib import Path
 
 # Database connection (reusing existing connection from server.py)
 from server import db
+import indexes
+from cache import MemoCache, create_cache_backend
+from search import MemoSearchIndex
+from change_stream import MemoChange, change_feed
+from metrics import DB_OPERATION_SECONDS
+from mongo_settings import list_read_preference
+from memo_query import MemoFilters, build_memo_query, decode_cursor, encode_cursor, keyset_query
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+LIST_SORT = [("created_at", -1), ("_id", -1)]
+PREVIEW_LENGTH = 200
+# Delta sync returns at most this many changes; clients further behind refetch the list
+DELTA_LIMIT = 500
+TOMBSTONE_MAX_AGE = timedelta(days=30)
+COUNTER_ID = "memos"
+# Counter fields lease_<ms>_<id> hold the first version of a write in progress
+LEASE_PREFIX = "lease_"
+# A lease older than this belongs to a worker that died mid-write and no longer holds back the version
+WRITE_LEASE_TIMEOUT = float(os.environ.get("MEMO_WRITE_LEASE_TIMEOUT_SECONDS", "60"))
+# How often a bulk write looks for the tombstones of memos deleted under it, and how long it waits between
+BULK_RECONCILE_ATTEMPTS = 3
+BULK_RECONCILE_DELAY = 0.05
+
+# Summary list view: content is truncated by Mongo so the full text never leaves the server
+SUMMARY_PROJECTION = {
+    "title": 1,
+    "content_preview": {"$substrCP": [{"$ifNull": ["$content", ""]}, 0, PREVIEW_LENGTH]},
+    "content_truncated": {"$gt": [{"$strLenCP": {"$ifNull": ["$content", ""]}}, PREVIEW_LENGTH]},
+    "image": 1,
+    "alarm": 1,
+    "type": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "version": 1,
+}
+
+def to_response(memo: dict, summary: bool = False) -> dict:
+    """Shape a stored memo like MemoResponse (or MemoSummary for the summary view).
+
+    Documents written before a field existed get the model's default, and
+    fields the models do not declare are dropped.
+    """
+    alarm = memo.get("alarm") or {}
+    shaped = {"id": str(memo.get("_id", memo.get("id", ""))), "title": memo.get("title", "")}
+    if summary:
+        shaped["content_preview"] = memo.get("content_preview", "")
+        shaped["content_truncated"] = bool(memo.get("content_truncated", False))
+    else:
+        shaped["content"] = memo.get("content", "")
+    shaped.update(
+        image=memo.get("image"),
+        alarm={"enabled": bool(alarm.get("enabled", False)), "time": alarm.get("time")},
+        type=memo.get("type") or "text",
+        created_at=memo.get("created_at"),
+        updated_at=memo.get("updated_at"),
+        version=memo.get("version"),
+    )
+    return shaped
+
+class VersionLease:
+    """Collection versions allocated to one write: first, first + 1, ... first + count - 1"""
+    
+    __slots__ = ("first", "count", "used")
+    
+    def __init__(self, first: int, count: int):
+        self.first = first
+        self.count = count
+        self.used = True
+    
+    def unused(self):
+        """The write matched nothing, so its versions can be given back"""
+        self.used = False
 
 class MemoDatabase:
-    def __init__(self):
+    def __init__(self, cache: Optional[MemoCache] = None):
+        from pymongo.read_preferences import Primary
+        
         self.collection = db.memos
+        # List pages may be served by secondaries (MONGO_LIST_READ_PREFERENCE)
+        read_preference = list_read_preference()
+        self.list_collection = db.get_collection(self.collection.name, read_preference=read_preference)
+        # A secondary may lag the version a page would be cached under, so only primary reads are cached
+        self.cache_pages = isinstance(read_preference, Primary)
+        self.cache = cache or MemoCache(create_cache_backend())
+        self.search_index = MemoSearchIndex()
+        # Collection change counter and tombstones of deleted memos, for delta sync
+        self.counters = db.counters
+        self.tombstones = db.memo_tombstones
+        # Writes are announced to the scheduler, SSE clients and other workers through here
+        self.changes = change_feed
+    
+    async def ensure_indexes(self):
+        """Create the indexes backing the memo query paths"""
+        names = await indexes.ensure_indexes(self.collection)
+        await indexes.ensure_tombstone_indexes(self.tombstones)
+        return names
     
-    async def get_all_memos(self) -> List[dict]:
-        """Get all memos sorted by creation date (newest first)"""
-        cursor = self.collection.find({}).sort("created_at", -1)
-        memos = await cursor.to_list(length=1000)
+    def query_shapes(self) -> List[Tuple[str, dict, list]]:
+        """Representative (name, filter, sort) of every query this class issues"""
+        from bson import ObjectId
+        now = datetime.utcnow()
+        return [
+            ("list_first_page", {}, LIST_SORT),
+            ("list_next_page", self._page_query(now, ObjectId()), LIST_SORT),
+            ("list_by_type", build_memo_query(MemoFilters(type="text")).filter, LIST_SORT),
+            ("updated_range", build_memo_query(MemoFilters(updated_after=now)).filter, [("updated_at", -1), ("_id", -1)]),
+            ("alarm_window", build_memo_query(MemoFilters(alarm_after=now, alarm_before=now)).filter, [("alarm.time", 1), ("_id", 1)]),
+            ("get_by_object_id", {"_id": ObjectId()}, None),
+            ("get_by_legacy_id", {"id": "legacy-id"}, None),
+            ("due_alarms", {"alarm.enabled": True, "alarm.time": {"$lte": now}}, [("alarm.time", 1)]),
+            ("changed_since", {"version": {"$gt": 0}}, [("version", 1)]),
+            ("referenced_images", {"image": {"$in": ["example.jpg"]}}, [("image", 1)]),
+        ]
+    
+    async def verify_query_plans(self, fail: bool = False) -> List[str]:
+        """Explain every query shape and report the ones doing a collection scan"""
+        return await indexes.verify_query_plans(self.collection, self.query_shapes(), fail=fail)
+    
+    @asynccontextmanager
+    async def _versioned_write(self, count: int = 1) -> AsyncIterator[VersionLease]:
+        """Allocate count change-counter values for a write and yield their VersionLease.
+
+        The allocation also leaves a lease holding the first version on the
+        counter document until the write finishes, so current_version() in
+        any worker never reports a version whose write is not visible yet.
+        A write that matched nothing calls lease.unused(); the counter then
+        goes back down unless another write allocated after it.
+        """
+        from pymongo import ReturnDocument
         
-        # Convert ObjectId to string and ensure proper format
-        for memo in memos:
-            memo["id"] = str(memo.pop("_id", memo.get("id", "")))
+        lease = f"{LEASE_PREFIX}{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+        counter = await self.counters.find_one_and_update(
+            {"_id": COUNTER_ID},
+            [{"$set": {
+                "seq": {"$add": [{"$ifNull": ["$seq", 0]}, count]},
+                lease: {"$add": [{"$ifNull": ["$seq", 0]}, 1]},
+            }}],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        allocation = VersionLease(counter[lease], count)
+        try:
+            yield allocation
+        finally:
+            released = None
+            if not allocation.used:
+                # Readers never saw these versions (the lease held them back), so a miss leaves ETags alone
+                released = await self.counters.update_one(
+                    {"_id": COUNTER_ID, "seq": allocation.first + count - 1},
+                    {"$inc": {"seq": -count}, "$unset": {lease: ""}}
+                )
+            if released is None or not released.modified_count:
+                await self.counters.update_one({"_id": COUNTER_ID}, {"$unset": {lease: ""}})
+    
+    @staticmethod
+    def _live_leases(counter: dict) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+        """(field, first version) of the write leases on a counter document, split into live and expired"""
+        expired_before = (time.time() - WRITE_LEASE_TIMEOUT) * 1000
+        live, expired = [], []
+        for field, value in counter.items():
+            if field.startswith(LEASE_PREFIX):
+                started = int(field[len(LEASE_PREFIX):].split("_")[0])
+                (live if started >= expired_before else expired).append((field, value))
+        return live, expired
+    
+    async def _read_counter(self) -> Tuple[int, int]:
+        """(current collection version, highest version whose tombstones were pruned)"""
+        counter = await self.counters.find_one({"_id": COUNTER_ID}) or {}
+        version = counter.get("seq", 0)
+        live, _ = self._live_leases(counter)
+        if live:
+            version = min(version, min(first for _, first in live) - 1)
+        return version, counter.get("pruned_through", 0)
+    
+    @DB_OPERATION_SECONDS.time("current_version")
+    async def current_version(self) -> int:
+        """Version of the memo collection; it increases with every write"""
+        version, _ = await self._read_counter()
+        return version
+    
+    @DB_OPERATION_SECONDS.time("changes_since")
+    async def changes_since(self, since: int, summary: bool = False) -> dict:
+        """Memos created or updated and ids deleted after version since.
+
+        Returns {"version", "memos", "deleted", "resync"}; resync is True when
+        the changes can no longer be reconstructed and the client must refetch.
+        """
+        version, pruned_through = await self._read_counter()
+        delta = {"version": version, "memos": [], "deleted": [], "resync": False}
+        if since > version or since < pruned_through:
+            delta["resync"] = True
+            return delta
+        if since == version:
+            return delta
+        
+        projection = SUMMARY_PROJECTION if summary else None
+        memos = await self.collection.find({"version": {"$gt": since}}, projection).sort("version", 1).to_list(length=DELTA_LIMIT + 1)
+        tombstones = await self.tombstones.find({"version": {"$gt": since}}, {"_id": 1}).to_list(length=DELTA_LIMIT + 1)
+        if len(memos) > DELTA_LIMIT or len(tombstones) > DELTA_LIMIT:
+            delta["resync"] = True
+            return delta
+        
+        delta["memos"] = [to_response(memo, summary) for memo in memos]
+        delta["deleted"] = [tombstone["_id"] for tombstone in tombstones]
+        return delta
+    
+    @DB_OPERATION_SECONDS.time("prune_tombstones")
+    async def prune_tombstones(self, max_age: timedelta = TOMBSTONE_MAX_AGE) -> int:
+        """Drop old tombstones and remember the newest version they covered"""
+        # Leases of workers that died mid-write are ignored already; clear them out too
+        counter = await self.counters.find_one({"_id": COUNTER_ID}) or {}
+        _, expired = self._live_leases(counter)
+        if expired:
+            await self.counters.update_one({"_id": COUNTER_ID}, {"$unset": {field: "" for field, _ in expired}})
+        
+        cutoff = datetime.utcnow() - max_age
+        newest = await self.tombstones.find_one({"deleted_at": {"$lt": cutoff}}, sort=[("version", -1)])
+        if newest is None:
+            return 0
+        
+        # Record the horizon first so no client is told a partial delta is complete
+        await self.counters.update_one(
+            {"_id": COUNTER_ID},
+            {"$max": {"pruned_through": newest["version"]}},
+            upsert=True
+        )
+        result = await self.tombstones.delete_many({"version": {"$lte": newest["version"]}})
+        return result.deleted_count
+    
+    @staticmethod
+    def _page_query(created_at: datetime, last_id) -> dict:
+        """Filter for the memos strictly after a (created_at, _id) position"""
+        return keyset_query("created_at", created_at, last_id)
+    
+    @DB_OPERATION_SECONDS.time("get_memos_page")
+    async def get_memos_page(
+        self,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        summary: bool = False,
+        version: Optional[int] = None,
+        filters: Optional[MemoFilters] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """Get one page of memos and the cursor for the next page.
+
+        Without filters memos come newest first; filtered pages follow the
+        order of the index serving them (see memo_query.QUERY_PLANS).
+        """
+        # Raises UnindexedQueryError or a cursor ValueError before touching the cache or Mongo
+        memo_query = build_memo_query(filters)
+        position = decode_cursor(cursor, memo_query.plan.index) if cursor else None
         
-        return memos
+        # Pages are cached per collection version, which every write bumps
+        if version is None:
+            version = await self.current_version()
+        page_key = f"{'summary' if summary else 'full'}:{limit}:{cursor or ''}"
+        if filters is not None and not filters.is_empty():
+            page_key += f":{filters.cache_key()}"
+        page = await self.cache.get_page(version, page_key)
+        if page is not None:
+            return page
+        
+        query = memo_query.filter
+        if position:
+            query = memo_query.after(*position)
+        
+        # Fetch one extra document to know whether another page exists
+        projection = SUMMARY_PROJECTION if summary else None
+        results = (
+            self.list_collection.find(query, projection)
+            .sort(memo_query.sort)
+            .hint(memo_query.plan.index)
+            .limit(limit + 1)
+        )
+        memos = await results.to_list(length=limit + 1)
+        
+        next_cursor = None
+        if len(memos) > limit:
+            memos = memos[:limit]
+            next_cursor = encode_cursor(memo_query.position(memos[-1]), memos[-1]["_id"], memo_query.plan.index)
+        
+        memos = [to_response(memo, summary) for memo in memos]
+        
+        if self.cache_pages:
+            await self.cache.set_page(version, page_key, (memos, next_cursor))
+        return memos, next_cursor
     
+    @DB_OPERATION_SECONDS.time("create_memo")
     async def create_memo(self, memo_data: dict) -> dict:
         """Create a new memo"""
         memo_data["created_at"] = datetime.utcnow()
         memo_data["updated_at"] = datetime.utcnow()
         
-        result = await self.collection.insert_one(memo_data)
+        async with self._versioned_write() as lease:
+            memo_data["version"] = lease.first
+            result = await self.collection.insert_one(memo_data)
         memo_data["id"] = str(result.inserted_id)
         memo_data.pop("_id", None)
         
+        await self.cache.set_memo(memo_data)
+        self.search_index.upsert(memo_data)
+        await self.changes.record("insert", memo_data["id"], memo_data)
         return memo_data
     
+    @DB_OPERATION_SECONDS.time("get_memo_by_id")
     async def get_memo_by_id(self, memo_id: str) -> Optional[dict]:
         """Get a memo by ID"""
-        from bson import ObjectId
+        cached = await self.cache.get_memo(memo_id)
+        if cached is not None:
+            return to_response(cached)
+        
         try:
-            if len(memo_id) == 24:  # MongoDB ObjectId
-                query = {"_id": ObjectId(memo_id)}
-            else:
-                query = {"id": memo_id}
-            
-            memo = await self.collection.find_one(query)
+            memo = await self.collection.find_one(self._id_query(memo_id))
             if memo:
                 memo["id"] = str(memo.pop("_id", memo.get("id", "")))
+                # Only canonical ids are cached so invalidation by id is exact
+                if memo["id"] == memo_id:
+                    await self.cache.set_memo(memo)
+                memo = to_response(memo)
             return memo
         except Exception:
             return None
     
+    @staticmethod
+    def _id_query(memo_id: str) -> dict:
+        """Query matching a memo by ObjectId or by legacy string id"""
+        from bson import ObjectId
+        if len(memo_id) == 24:  # MongoDB ObjectId
+            return {"_id": ObjectId(memo_id)}
+        return {"id": memo_id}
+    
+    async def _after_write(self, memo: dict) -> dict:
+        """Normalize a written document and refresh the cache with it"""
+        memo["id"] = str(memo.pop("_id", memo.get("id", "")))
+        await self.cache.set_memo(memo)
+        self.search_index.upsert(memo)
+        await self.changes.record("update", memo["id"], memo)
+        return memo
+    
     async def update_memo(self, memo_id: str, update_data: dict) -> Optional[dict]:
         """Update a memo"""
-        from bson import ObjectId
+        updated, _ = await self.update_memo_and_replaced_image(memo_id, update_data)
+        return updated
+    
+    @DB_OPERATION_SECONDS.time("update_memo")
+    async def update_memo_and_replaced_image(self, memo_id: str, update_data: dict) -> Tuple[Optional[dict], Optional[str]]:
+        """Update a memo and return (updated memo, image it no longer uses)"""
+        from pymongo import ReturnDocument
         
         update_data["updated_at"] = datetime.utcnow()
+        query = self._id_query(memo_id)
         
         try:
-            if len(memo_id) == 24:  # MongoDB ObjectId
-                query = {"_id": ObjectId(memo_id)}
-            else:
-                query = {"id": memo_id}
-            
-            result = await self.collection.update_one(
-                query, 
-                {"$set": update_data}
-            )
+            # Only image swaps need the old value; the collector re-checks references before deleting
+            previous_image = None
+            if "image" in update_data:
+                previous = await self.collection.find_one(query, {"image": 1})
+                previous_image = previous.get("image") if previous else None
             
-            if result.modified_count > 0:
-                return await self.get_memo_by_id(memo_id)
+            async with self._versioned_write() as lease:
+                update_data["version"] = lease.first
+                memo = await self.collection.find_one_and_update(
+                    query,
+                    {"$set": update_data},
+                    return_document=ReturnDocument.AFTER
+                )
+                if memo is None:
+                    lease.unused()
+        except Exception:
+            return None, None
+        if memo is None:
+            return None, None
+        
+        # Cache the stored document, not one rebuilt locally, so concurrent updates cannot clobber each other
+        updated = await self._after_write(memo)
+        replaced_image = previous_image if previous_image != updated.get("image") else None
+        return updated, replaced_image
+    
+    @DB_OPERATION_SECONDS.time("toggle_alarm")
+    async def toggle_alarm(self, memo_id: str) -> Optional[dict]:
+        """Flip alarm.enabled server-side, atomically, and return the updated memo"""
+        from pymongo import ReturnDocument
+        
+        try:
+            async with self._versioned_write() as lease:
+                memo = await self.collection.find_one_and_update(
+                    self._id_query(memo_id),
+                    [{"$set": {
+                        "alarm.enabled": {"$not": {"$ifNull": ["$alarm.enabled", False]}},
+                        "updated_at": datetime.utcnow(),
+                        "version": lease.first,
+                    }}],
+                    return_document=ReturnDocument.AFTER
+                )
+                if memo is None:
+                    lease.unused()
+        except Exception:
             return None
+        return await self._after_write(memo) if memo else None
+    
+    @DB_OPERATION_SECONDS.time("delete_memo")
+    async def delete_memo(self, memo_id: str) -> Optional[dict]:
+        """Delete a memo and return the deleted document"""
+        try:
+            async with self._versioned_write() as lease:
+                memo = await self.collection.find_one_and_delete(self._id_query(memo_id))
+                if memo is None:
+                    lease.unused()
+                else:
+                    await self._write_tombstones([(str(memo["_id"]), lease.first)])
         except Exception:
             return None
+        if memo is None:
+            return None
+        
+        memo["id"] = str(memo.pop("_id", memo.get("id", "")))
+        await self.cache.invalidate_memo(memo["id"])
+        self.search_index.remove(memo["id"])
+        await self.changes.record("delete", memo["id"])
+        return memo
+
+    async def _write_tombstones(self, deletions: List[Tuple[str, int]]):
+        """Record (memo_id, version) deletions so delta sync can report them"""
+        from pymongo import UpdateOne
+        now = datetime.utcnow()
+        # $max keeps the newest version when concurrent deletes of one memo race
+        await self.tombstones.bulk_write([
+            UpdateOne({"_id": memo_id}, {"$max": {"version": version}, "$set": {"deleted_at": now}}, upsert=True)
+            for memo_id, version in deletions
+        ])
+    
+    @DB_OPERATION_SECONDS.time("search_memos")
+    async def search_memos(
+        self,
+        query: str,
+        memo_type: Optional[str] = None,
+        alarm_enabled: Optional[bool] = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> Tuple[int, List[Tuple[dict, float]]]:
+        """Rank memos matching query and return (total, [(memo, score)]) for one page"""
+        total, ranked = self.search_index.search(query, memo_type, alarm_enabled, limit, offset)
+        
+        # Serve what we can from the cache and fetch the rest in one query
+        memos = {}
+        for memo_id, _ in ranked:
+            cached = await self.cache.get_memo(memo_id)
+            if cached is not None:
+                memos[memo_id] = cached
+        missing = [memo_id for memo_id, _ in ranked if memo_id not in memos]
+        for memo_id, memo in (await self._find_by_ids(missing)).items():
+            if memo_id == str(memo["_id"]):
+                memos[memo_id] = {**memo, "id": memo_id}
+                memos[memo_id].pop("_id", None)
+        
+        return total, [(memos[memo_id], score) for memo_id, score in ranked if memo_id in memos]
     
-    async def delete_memo(self, memo_id: str) -> bool:
-        """Delete a memo"""
+    async def _find_by_ids(self, memo_ids) -> dict:
+        """Fetch memos by ObjectId or legacy id in one query, keyed by the id used to ask"""
         from bson import ObjectId
+        object_ids = [ObjectId(memo_id) for memo_id in memo_ids if ObjectId.is_valid(memo_id) and len(memo_id) == 24]
+        legacy_ids = [memo_id for memo_id in memo_ids if len(memo_id) != 24]
+        if not object_ids and not legacy_ids:
+            return {}
         
-        try:
-            if len(memo_id) == 24:  # MongoDB ObjectId
-                query = {"_id": ObjectId(memo_id)}
-            else:
-                query = {"id": memo_id}
-            
-            result = await self.collection.delete_one(query)
-            return result.deleted_count > 0
-        except Exception:
-            return False
+        found = {}
+        query = {"$or": [{"_id": {"$in": object_ids}}, {"id": {"$in": legacy_ids}}]}
+        async for memo in self.collection.find(query):
+            found[str(memo["_id"])] = memo
+            if memo.get("id"):
+                found[memo["id"]] = memo
+        return found
+    
+    @DB_OPERATION_SECONDS.time("bulk_write")
+    async def bulk_write(self, operations: List[dict], ordered: bool = True) -> List[dict]:
+        """Apply create/update/delete/toggle_alarm operations in a single bulk_write.
+
+        Each operation is {"op", "id", "data"}. Returns one result per
+        operation with "status" (ok, not_found, error or skipped), the
+        canonical "id", the resulting "memo" and, for updates, toggles and
+        deletes, the "previous" document. Unknown ids are reported as
+        not_found, as are operations on a memo deleted earlier in the
+        batch, and an ordered batch stops there: later operations are
+        skipped. A memo deleted by someone else between the lookup and the
+        bulk write is found from the write's counts and also reported as
+        not_found; operations after it have already been applied.
+        """
+        from bson import ObjectId
+        from pymongo import InsertOne, UpdateOne, DeleteOne
+        from pymongo.errors import BulkWriteError
+        
+        now = datetime.utcnow()
+        results = [
+            {"index": i, "op": op["op"], "status": "skipped", "id": op.get("id"),
+             "memo": None, "previous": None, "error": None}
+            for i, op in enumerate(operations)
+        ]
+        
+        # One read resolves every targeted memo (and its image) up front
+        existing = await self._find_by_ids({op["id"] for op in operations if op["op"] != "create"})
+        
+        # A memo deleted earlier in the batch is gone for the operations after it
+        targets = []
+        deleted_in_batch = set()
+        for i, op in enumerate(operations):
+            target = existing.get(op["id"]) if op["op"] != "create" else None
+            if op["op"] != "create" and (target is None or target["_id"] in deleted_in_batch):
+                results[i]["status"] = "not_found"
+                if ordered:
+                    break
+                continue
+            if op["op"] == "delete":
+                deleted_in_batch.add(target["_id"])
+            targets.append(i)
+        
+        requests = []
+        request_index = []
+        failed = {}
+        if targets:
+            # Every write gets its own version from one counter allocation
+            async with self._versioned_write(len(targets)) as lease:
+                first_version = lease.first
+                for position, i in enumerate(targets):
+                    op, result = operations[i], results[i]
+                    version = first_version + position
+                    if op["op"] == "create":
+                        memo = {**op["data"], "_id": ObjectId(), "created_at": now, "updated_at": now, "version": version}
+                        requests.append(InsertOne(memo))
+                        result["memo"] = memo
+                    else:
+                        previous = existing[op["id"]]
+                        query = {"_id": previous["_id"]}
+                        result["previous"] = previous
+                        if op["op"] == "update":
+                            requests.append(UpdateOne(query, {"$set": {**op["data"], "updated_at": now, "version": version}}))
+                        elif op["op"] == "toggle_alarm":
+                            requests.append(UpdateOne(query, [{"$set": {
+                                "alarm.enabled": {"$not": {"$ifNull": ["$alarm.enabled", False]}},
+                                "updated_at": now,
+                                "version": version,
+                            }}]))
+                        else:
+                            requests.append(DeleteOne(query))
+                    request_index.append(i)
+                
+                try:
+                    outcome = await self.collection.bulk_write(requests, ordered=ordered)
+                    matched, removed = outcome.matched_count, outcome.deleted_count
+                except BulkWriteError as e:
+                    for error in e.details.get("writeErrors", []):
+                        failed[error["index"]] = error.get("errmsg", "Write failed")
+                    matched, removed = e.details.get("nMatched", 0), e.details.get("nRemoved", 0)
+                
+                # An ordered bulk write stops at its first error
+                first_failure = min(failed) if failed else None
+                for position, i in enumerate(request_index):
+                    if position in failed:
+                        results[i]["status"] = "error"
+                        results[i]["error"] = failed[position]
+                    elif ordered and first_failure is not None and position > first_failure:
+                        results[i]["status"] = "skipped"
+                    else:
+                        results[i]["status"] = "ok"
+                
+                deleted = {
+                    i: first_version + position for position, i in enumerate(request_index)
+                    if results[i]["status"] == "ok" and operations[i]["op"] == "delete"
+                }
+                
+                # One more read returns the final state of every updated memo
+                changed = await self._find_changed(results)
+                await self._reconcile_bulk_counts(results, changed, matched, removed)
+                
+                # Deletes we cannot attribute still get a tombstone and cleanup: the memo is gone either way
+                gone = {i for i in deleted if results[i]["status"] != "not_found"}
+                deletions = [(str(results[i]["previous"]["_id"]), deleted[i]) for i in gone]
+                if deletions:
+                    await self._write_tombstones(deletions)
+        else:
+            changed, gone = {}, set()
+        
+        for r in results:
+            if r["previous"] is not None:
+                previous_id = r["previous"]["_id"]
+                if r["op"] in ("update", "toggle_alarm") and r["status"] == "ok":
+                    r["memo"] = changed.get(previous_id)
+                r["previous"] = {**r["previous"], "id": str(previous_id)}
+                r["previous"].pop("_id", None)
+                r["id"] = str(previous_id)
+            if r["status"] != "ok":
+                r["memo"] = None
+            if r["memo"] is not None:
+                r["memo"] = {**r["memo"], "id": str(r["memo"]["_id"])}
+                r["memo"].pop("_id", None)
+                r["id"] = r["memo"]["id"]
+                await self.cache.set_memo(r["memo"])
+                self.search_index.upsert(r["memo"])
+                await self.changes.record("insert" if r["op"] == "create" else "update", r["id"], r["memo"])
+            elif r["op"] == "delete" and r["index"] in gone:
+                await self.cache.invalidate_memo(r["id"])
+                self.search_index.remove(r["id"])
+                await self.changes.record("delete", r["id"])
+        return results
+    
+    async def _find_changed(self, results: List[dict]) -> dict:
+        """Current documents of the memos a bulk write updated or toggled, by _id"""
+        changed_ids = [
+            r["previous"]["_id"] for r in results
+            if r["status"] == "ok" and r["op"] in ("update", "toggle_alarm")
+        ]
+        if not changed_ids:
+            return {}
+        return {memo["_id"]: memo async for memo in self.collection.find({"_id": {"$in": changed_ids}})}
+    
+    async def _reconcile_bulk_counts(self, results: List[dict], changed: dict, matched: int, removed: int):
+        """Mark operations whose memo vanished before the bulk write ran as not_found.
+
+        The lookup saw every targeted memo, so any shortfall in the write's
+        matched or removed counts comes from concurrent deletes.
+        """
+        updates = [r for r in results if r["status"] == "ok" and r["op"] in ("update", "toggle_alarm")]
+        if matched < len(updates):
+            for r in updates:
+                if r["previous"]["_id"] not in changed:
+                    r["status"] = "not_found"
+        
+        deletes = [r for r in results if r["status"] == "ok" and r["op"] == "delete"]
+        missing = len(deletes) - removed
+        if missing <= 0:
+            return
+        # The other delete leaves a tombstone (ours are not written yet); give it a moment to land
+        ids = [r["previous"]["_id"] for r in deletes]
+        for attempt in range(BULK_RECONCILE_ATTEMPTS):
+            foreign = {t["_id"] async for t in self.tombstones.find({"_id": {"$in": [str(i) for i in ids]}}, {"_id": 1})}
+            if len(foreign) >= missing:
+                break
+            await asyncio.sleep(BULK_RECONCILE_DELAY)
+        for r in deletes:
+            if str(r["previous"]["_id"]) in foreign:
+                r["status"] = "not_found"
+                missing -= 1
+        if missing > 0:
+            # Still unattributed: we cannot tell which delete was ours
+            for r in deletes:
+                if r["status"] == "ok":
+                    r["status"] = "error"
+                    r["error"] = "Memo was deleted concurrently"
+    
+    @DB_OPERATION_SECONDS.time("referenced_images")
+    async def referenced_images(self, filenames: List[str]) -> Set[str]:
+        """The subset of filenames attached to at least one memo (covered by the image index)"""
+        if not filenames:
+            return set()
+        cursor = self.collection.find({"image": {"$in": filenames}}, {"image": 1, "_id": 0})
+        return {memo["image"] async for memo in cursor}
+    
+    async def apply_change(self, change: MemoChange):
+        """ChangeFeed listener: bring the cache and search index up to date with another worker's write"""
+        if change.local:
+            return  # already applied by the write itself
+        if change.operation == "resync":
+            await self.search_index.load(self.collection)
+        elif change.operation == "delete":
+            await self.cache.invalidate_memo(change.memo_id)
+            self.search_index.remove(change.memo_id)
+        else:
+            await self.cache.set_memo(change.memo)
+            self.search_index.upsert(change.memo)
 
 # Global database instance
-memo_db = MemoDatabase()
\ No newline at end of file
+memo_db = MemoDatabase()
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+
+logger = logging.getLogger(__name__)
+
+# Frames buffered per client before it is considered stalled and dropped
+SUBSCRIBER_QUEUE_SIZE = 256
+# Interval between SSE comment frames that keep idle connections open
+KEEPALIVE_SECONDS = 15
+
+def format_sse(event: str, data) -> str:
+    """Render one Server-Sent Events frame"""
+    payload = json.dumps(jsonable_encoder(data), separators=(",", ":"))
+    return f"event: {event}\ndata: {payload}\n\n"
+
+class Subscription:
+    """A client connection's bounded queue of pending SSE frames"""
+
+    def __init__(self, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = False
+
+    def offer(self, frame: str) -> bool:
+        """Queue a frame without waiting; False if the client has fallen behind"""
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self, reason: str):
+        """Replace the backlog with a final frame telling the client to resync"""
+        self.dropped = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(format_sse("resync", {"reason": reason}))
+        self.queue.put_nowait(None)
+
+class EventHub:
+    """In-process fan-out of memo and alarm events to streaming clients.
+
+    Each frame is serialized once and offered to every subscriber without
+    blocking the publisher. A subscriber whose queue is full is dropped
+    with a ``resync`` event, so a stalled client costs at most
+    ``SUBSCRIBER_QUEUE_SIZE`` frames of memory.
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Set[Subscription] = set()
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def publish(self, event: str, data):
+        """Send an event to every connected client"""
+        if not self._subscribers:
+            return
+        frame = format_sse(event, data)
+        for subscription in list(self._subscribers):
+            if not subscription.offer(frame):
+                logger.warning("Dropping slow event subscriber")
+                self._subscribers.discard(subscription)
+                subscription.close("slow consumer")
+
+    def memo_created(self, memo: dict):
+        self.publish("memo.created", memo)
+
+    def memo_updated(self, memo: dict):
+        self.publish("memo.updated", memo)
+
+    def memo_deleted(self, memo_id: str):
+        self.publish("memo.deleted", {"id": memo_id})
+
+    async def memo_changed(self, change):
+        """ChangeFeed listener"""
+        if change.operation == "insert":
+            self.memo_created(change.memo)
+        elif change.operation == "update":
+            self.memo_updated(change.memo)
+        elif change.operation == "delete":
+            self.memo_deleted(change.memo_id)
+        elif change.operation == "resync":
+            self.publish("resync", {"reason": "memo changes were lost"})
+
+    async def alarm_due(self, memo_id: str, alarm_time: datetime):
+        """AlarmScheduler listener"""
+        self.publish("alarm.due", {"memo_id": memo_id, "time": alarm_time})
+
+    async def stream(self) -> AsyncIterator[str]:
+        """Yield SSE frames for one client until it disconnects or is dropped"""
+        subscription = self.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    frame: Optional[str] = await asyncio.wait_for(
+                        subscription.queue.get(), timeout=KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            self.unsubscribe(subscription)
+
+# Global event hub instance
+event_hub = EventHub()
@@ -1,18 +1,183 @@
 import os
 import uuid
-import aiofiles
+import mimetypes
+import base64
+import binascii
+import hashlib
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional
-from fastapi import UploadFile, HTTPException
+from typing import AsyncIterator, NamedTuple, Optional, Tuple
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import RedirectResponse
 
-# Create uploads directory
-UPLOAD_DIR = Path("/app/backend/uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+from image_variants import ImageVariants
+from storage import storage, create_storage_backend
+from http_cache import cached_file_response
+from metrics import FILE_OPERATION_SECONDS, FILE_BYTES_WRITTEN
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Uploads directory, created at startup by FileHandler.prepare_storage(); with
+# IMAGE_STORAGE=s3 it only stages uploads before they are sent to the bucket
+UPLOAD_DIR = Path(os.environ.get("UPLOAD_DIR", "/app/backend/uploads"))
+image_storage = create_storage_backend(UPLOAD_DIR)
 
 # Allowed image types
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
 
+# Name images by content hash so identical uploads share one file
+CONTENT_ADDRESSED_UPLOADS = os.environ.get("CONTENT_ADDRESSED_UPLOADS", "false").lower() in ("1", "true", "yes")
+
+# Positive stat() results are reused for this long; uploaded files never change in place
+STAT_CACHE_TTL = 60.0
+STAT_CACHE_SIZE = 4096
+_stat_cache: "OrderedDict[str, Tuple[float, os.stat_result]]" = OrderedDict()
+
+# How long clients may reuse a redirect to a presigned or CDN image URL
+REDIRECT_MAX_AGE = 600
+CHUNK_SIZE = 64 * 1024  # bytes read per upload chunk
+# Largest multipart bodies that can still hold a MAX_FILE_SIZE image, raw or as base64
+MAX_UPLOAD_REQUEST_SIZE = MAX_FILE_SIZE + 64 * 1024
+MAX_BASE64_REQUEST_SIZE = MAX_FILE_SIZE * 4 // 3 + 64 * 1024
+
+# Resized WebP variants of uploaded images
+image_variants = ImageVariants(image_storage, UPLOAD_DIR / ".variant-work")
+
+class TempUpload(NamedTuple):
+    """A fully written upload waiting to be moved into UPLOAD_DIR"""
+    path: Path
+    size: int
+    sha256: str
+
+class Base64TooLarge(ValueError):
+    """The encoded length already guarantees the decoded image is too large"""
+
+class Base64StreamDecoder:
+    """Incrementally decode base64 text (optionally a data: URL) fed in arbitrary chunks.
+
+    Input is decoded in multiples of 4 characters; the remainder is carried
+    over to the next chunk.
+    """
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.encoded_length = 0
+        self._head = b""
+        self._prefix_done = False
+        self._pending = b""
+    
+    def feed(self, data: bytes) -> bytes:
+        if not self._prefix_done:
+            data = self._strip_prefix(data)
+            if not self._prefix_done:
+                return b""
+        
+        data = data.translate(None, b" \t\r\n")
+        self.encoded_length += len(data)
+        if (self.encoded_length // 4) * 3 - 2 > self.max_size:
+            raise Base64TooLarge("Image too large")
+        
+        data = self._pending + data
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        return base64.b64decode(data[:usable], validate=True)
+    
+    def finish(self) -> bytes:
+        if not self._prefix_done:
+            self._prefix_done = True
+            head, self._head = self._head, b""
+            return self.feed(head) + self.finish()
+        
+        pending, self._pending = self._pending, b""
+        if not pending:
+            return b""
+        if len(pending) == 1:
+            raise ValueError("Truncated base64 data")
+        return base64.b64decode(pending + b"=" * (-len(pending) % 4), validate=True)
+    
+    def _strip_prefix(self, data: bytes) -> bytes:
+        """Drop a leading "data:image/...;base64," header, which may span chunks"""
+        head = self._head + data
+        if head.startswith(b"data:"):
+            comma = head.find(b",")
+            if comma == -1:
+                if len(head) > 256:
+                    raise ValueError("Invalid data URL header")
+                self._head = head
+                return b""
+            self._prefix_done = True
+            self._head = b""
+            return head[comma + 1:]
+        if len(head) < 5 and b"data:".startswith(head):
+            self._head = head
+            return b""
+        self._prefix_done = True
+        self._head = b""
+        return head
+
+async def iter_multipart_fields(request: Request, filenames: Optional[dict] = None) -> AsyncIterator[Tuple[str, bytes]]:
+    """Yield (field name, data chunk) pairs from a multipart body as it arrives.
+
+    File fields have their client filename recorded in ``filenames`` by
+    field name before their first chunk is yielded.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+    
+    pending = []
+    state = {"name": None, "header_field": b"", "header_value": b"", "headers": {}}
+    
+    def on_part_begin():
+        state["headers"] = {}
+        state["name"] = None
+    
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+    
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+    
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+    
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        state["name"] = options.get(b"name", b"").decode("latin-1")
+        if filenames is not None and b"filename" in options:
+            filenames[state["name"]] = options[b"filename"].decode("utf-8", "replace")
+        # Announce every field, even one whose value turns out to be empty
+        pending.append((state["name"], b""))
+    
+    def on_part_data(data, start, end):
+        pending.append((state["name"], bytes(data[start:end])))
+    
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+    })
+    
+    async for chunk in request.stream():
+        parser.write(chunk)
+        for item in pending:
+            yield item
+        pending.clear()
+    parser.finalize()
+    for item in pending:
+        yield item
+
 class FileHandler:
     @staticmethod
     def get_file_extension(filename: str) -> str:
@@ -27,92 +192,250 @@ class FileHandler:
         return f"{unique_id}{extension}"
     
     @staticmethod
-    def validate_image_file(file: UploadFile) -> bool:
-        """Validate if file is a valid image"""
-        if not file.filename:
+    def content_addressed_filename(sha256: str, original_filename: str) -> str:
+        """Filename derived from the file content while preserving extension"""
+        extension = FileHandler.get_file_extension(original_filename)
+        return f"{sha256}{extension}"
+    
+    @staticmethod
+    def validate_image_file(filename: Optional[str]) -> bool:
+        """Validate if the uploaded filename is a valid image"""
+        if not filename:
             return False
         
-        extension = FileHandler.get_file_extension(file.filename)
+        extension = FileHandler.get_file_extension(filename)
         return extension in ALLOWED_EXTENSIONS
     
     @staticmethod
-    async def save_uploaded_file(file: UploadFile) -> str:
-        """Save uploaded file and return filename"""
-        # Validate file
-        if not FileHandler.validate_image_file(file):
-            raise HTTPException(
-                status_code=400, 
-                detail="Invalid file type. Only images are allowed."
-            )
-        
-        # Check file size
-        file_content = await file.read()
-        if len(file_content) > MAX_FILE_SIZE:
+    @FILE_OPERATION_SECONDS.time("save_upload")
+    async def save_uploaded_file(request: Request) -> str:
+        """Stream the file field of a multipart request straight to disk and return filename"""
+        # Reject before reading when the body cannot hold an image small enough
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_REQUEST_SIZE:
             raise HTTPException(
                 status_code=400,
                 detail="File too large. Maximum size is 5MB."
             )
         
-        # Generate unique filename
-        filename = FileHandler.generate_unique_filename(file.filename)
-        file_path = UPLOAD_DIR / filename
+        filenames = {}
+        
+        async def file_chunks():
+            received = 0
+            async for name, data in iter_multipart_fields(request, filenames):
+                # Bodies sent without a Content-Length are capped as they arrive
+                received += len(data)
+                if received > MAX_UPLOAD_REQUEST_SIZE:
+                    raise HTTPException(status_code=400, detail="File too large. Maximum size is 5MB.")
+                if name != "file":
+                    continue
+                # The part headers come before its data, so the type is checked before anything is written
+                if not FileHandler.validate_image_file(filenames.get("file")):
+                    raise HTTPException(
+                        status_code=400,
+                        detail="Invalid file type. Only images are allowed."
+                    )
+                yield data
         
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(file_content)
+        upload = await FileHandler.write_temp_file(file_chunks(), "File too large. Maximum size is 5MB.")
+        if "file" not in filenames:
+            await FileHandler.discard_temp_file(upload.path)
+            raise HTTPException(status_code=422, detail="Field file is required")
+        if upload.size == 0:
+            await FileHandler.discard_temp_file(upload.path)
+            raise HTTPException(status_code=400, detail="Field file is empty")
+        return await FileHandler.commit_temp_file(upload, filenames["file"])
+    
+    @staticmethod
+    @FILE_OPERATION_SECONDS.time("write")
+    async def write_temp_file(chunks: AsyncIterator[bytes], too_large_detail: str) -> TempUpload:
+        """Stream chunks to a temp file in UPLOAD_DIR, enforcing MAX_FILE_SIZE and hashing as it goes"""
+        temp_path = UPLOAD_DIR / f".{uuid.uuid4()}.part"
+        digest = hashlib.sha256()
+        size = 0
+        
+        try:
+            async with storage.open(temp_path, 'wb') as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > MAX_FILE_SIZE:
+                        raise HTTPException(status_code=400, detail=too_large_detail)
+                    digest.update(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            await FileHandler.discard_temp_file(temp_path)
+            raise
         
+        FILE_BYTES_WRITTEN.inc(amount=size)
+        return TempUpload(temp_path, size, digest.hexdigest())
+    
+    @staticmethod
+    @FILE_OPERATION_SECONDS.time("commit")
+    async def commit_temp_file(upload: TempUpload, original_filename: str) -> str:
+        """Hand a finished upload to the image storage backend and return its filename"""
+        if CONTENT_ADDRESSED_UPLOADS:
+            filename = FileHandler.content_addressed_filename(upload.sha256, original_filename)
+            # Identical content is already stored: restart its garbage collection grace period.
+            # If the collector removed it in the meantime, store this copy instead
+            if await image_storage.touch(filename):
+                await FileHandler.discard_temp_file(upload.path)
+                return filename
+        else:
+            filename = FileHandler.generate_unique_filename(original_filename)
+        
+        try:
+            await image_storage.put_file(filename, upload.path, mimetypes.guess_type(filename)[0])
+        except BaseException:
+            await FileHandler.discard_temp_file(upload.path)
+            raise
+        image_variants.schedule(filename)
         return filename
     
     @staticmethod
+    async def discard_temp_file(temp_path: Path):
+        try:
+            await storage.remove(temp_path)
+        except OSError:
+            pass
+    
+    @staticmethod
+    @FILE_OPERATION_SECONDS.time("save_base64")
     async def save_base64_image(base64_data: str, original_filename: str = "image.jpg") -> str:
         """Save base64 image data and return filename"""
-        import base64
+        async def chunks():
+            for start in range(0, len(base64_data), CHUNK_SIZE):
+                yield base64_data[start:start + CHUNK_SIZE].encode("ascii")
+        
+        upload = await FileHandler.write_base64_temp_file(chunks())
+        return await FileHandler.commit_temp_file(upload, original_filename)
+    
+    @staticmethod
+    @FILE_OPERATION_SECONDS.time("save_base64")
+    async def save_base64_form(request: Request) -> str:
+        """Decode the image_data field of a multipart request straight to disk and return filename"""
+        # Reject before reading when even the encoded body cannot fit
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_BASE64_REQUEST_SIZE:
+            raise HTTPException(
+                status_code=400,
+                detail="Image too large. Maximum size is 5MB."
+            )
+        
+        filename_parts = []
+        fields_seen = set()
+        
+        async def image_chunks():
+            async for name, data in iter_multipart_fields(request):
+                fields_seen.add(name)
+                if name == "image_data":
+                    yield data
+                elif name == "filename" and sum(map(len, filename_parts)) < 255:
+                    filename_parts.append(data)
+        
+        upload = await FileHandler.write_base64_temp_file(image_chunks())
+        if upload.size == 0:
+            # Form(...) used to reject a missing field with 422; an empty one is no image either
+            await FileHandler.discard_temp_file(upload.path)
+            if "image_data" not in fields_seen:
+                raise HTTPException(status_code=422, detail="Field image_data is required")
+            raise HTTPException(status_code=400, detail="Field image_data is empty")
+        
+        # The filename field may arrive after the image data, so name the file last
+        original_filename = b"".join(filename_parts).decode("utf-8", "replace") or "image.jpg"
+        return await FileHandler.commit_temp_file(upload, original_filename)
+    
+    @staticmethod
+    async def write_base64_temp_file(chunks: AsyncIterator[bytes]) -> TempUpload:
+        """Decode a stream of base64 text into a temp file"""
+        decoder = Base64StreamDecoder(MAX_FILE_SIZE)
+        
+        async def decoded_chunks():
+            async for chunk in chunks:
+                decoded = decoder.feed(chunk)
+                if decoded:
+                    yield decoded
+            decoded = decoder.finish()
+            if decoded:
+                yield decoded
         
         try:
-            # Remove data URL prefix if present
-            if base64_data.startswith('data:image/'):
-                base64_data = base64_data.split(',')[1]
-            
-            # Decode base64
-            image_data = base64.b64decode(base64_data)
-            
-            # Check file size
-            if len(image_data) > MAX_FILE_SIZE:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Image too large. Maximum size is 5MB."
-                )
-            
-            # Generate unique filename
-            filename = FileHandler.generate_unique_filename(original_filename)
-            file_path = UPLOAD_DIR / filename
-            
-            # Save file
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(image_data)
-            
-            return filename
-            
-        except Exception as e:
+            upload = await FileHandler.write_temp_file(
+                decoded_chunks(), "Image too large. Maximum size is 5MB."
+            )
+        except Base64TooLarge:
+            raise HTTPException(
+                status_code=400,
+                detail="Image too large. Maximum size is 5MB."
+            )
+        except (ValueError, binascii.Error) as e:
             raise HTTPException(
                 status_code=400,
                 detail=f"Failed to process image: {str(e)}"
             )
+        return upload
     
     @staticmethod
-    def delete_file(filename: str) -> bool:
-        """Delete a file"""
+    async def prepare_storage():
+        """Create the staging directory and prepare the image storage backend"""
+        await storage.makedirs(UPLOAD_DIR)
+        await image_storage.prepare()
+    
+    @staticmethod
+    @FILE_OPERATION_SECONDS.time("delete")
+    async def delete_file(filename: str) -> bool:
+        """Delete a file and its resized variants"""
+        keys = [filename, *image_variants.variant_keys(filename)]
         try:
-            file_path = UPLOAD_DIR / filename
-            if file_path.exists():
-                file_path.unlink()
-                return True
-            return False
+            for key in keys:
+                _stat_cache.pop(key, None)
+            await image_storage.delete(*keys)
+            return True
         except Exception:
             return False
     
     @staticmethod
-    def get_file_path(filename: str) -> Optional[Path]:
-        """Get file path if file exists"""
-        file_path = UPLOAD_DIR / filename
-        return file_path if file_path.exists() else None
\ No newline at end of file
+    async def get_file_path(filename: str) -> Optional[Path]:
+        """Get file path if the file is stored locally and exists"""
+        return image_storage.local_path(filename) if await FileHandler.stat_file(filename) else None
+    
+    @staticmethod
+    async def image_exists(key: str) -> bool:
+        if image_storage.local_path(key) is not None:
+            return await FileHandler.stat_file(key) is not None
+        return await image_storage.exists(key)
+    
+    @staticmethod
+    async def image_response(request: Request, key: str, media_type: Optional[str] = None) -> Response:
+        """Redirect to the image when storage can serve it directly, else serve the local file"""
+        url = await image_storage.download_url(key)
+        if url:
+            return RedirectResponse(url, status_code=307, headers={"Cache-Control": f"private, max-age={REDIRECT_MAX_AGE}"})
+        
+        stat_result = await FileHandler.stat_file(key)
+        if stat_result is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+        return cached_file_response(request, image_storage.local_path(key), stat_result, media_type)
+    
+    @staticmethod
+    @FILE_OPERATION_SECONDS.time("stat")
+    async def stat_file(key: str) -> Optional[os.stat_result]:
+        """stat() a locally stored file through a small TTL cache; None if it does not exist"""
+        path = image_storage.local_path(key)
+        if path is None:
+            return None
+        now = time.monotonic()
+        cached = _stat_cache.get(key)
+        if cached and now - cached[0] < STAT_CACHE_TTL:
+            _stat_cache.move_to_end(key)
+            return cached[1]
+        
+        stat_result = await storage.stat(path)
+        if stat_result is None:
+            _stat_cache.pop(key, None)
+            return None
+        
+        _stat_cache[key] = (time.monotonic(), stat_result)
+        _stat_cache.move_to_end(key)
+        if len(_stat_cache) > STAT_CACHE_SIZE:
+            _stat_cache.popitem(last=False)
+        return stat_result
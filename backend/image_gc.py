@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from database import memo_db
+from file_handler import FileHandler, UPLOAD_DIR, image_storage
+from metrics import IMAGE_GC_DELETED
+from storage import StorageBackend, storage
+
+logger = logging.getLogger(__name__)
+
+# Run the collector in this process; with several workers one collector is enough
+IMAGE_GC_ENABLED = os.environ.get("IMAGE_GC_ENABLED", "true").lower() not in ("0", "false", "no", "off")
+# Files younger than this are never collected, so an upload has time to be attached to a memo
+GRACE_SECONDS = float(os.environ.get("IMAGE_GC_GRACE_SECONDS", str(24 * 3600)))
+# Full sweeps of the image store run this often; detached images are checked sooner
+SWEEP_INTERVAL = float(os.environ.get("IMAGE_GC_INTERVAL_SECONDS", "3600"))
+BATCH_SIZE = int(os.environ.get("IMAGE_GC_BATCH_SIZE", "200"))
+DELETES_PER_SECOND = float(os.environ.get("IMAGE_GC_DELETES_PER_SECOND", "20"))
+# Delay before enqueued candidates are checked, so bursts of detaches share one batch
+ENQUEUE_DELAY = 5.0
+
+class ImageGarbageCollector:
+    """Deletes stored images that no memo references, off the request path.
+
+    Routes only enqueue images a memo stopped using; a periodic sweep also
+    lists the whole store, so uploads that were never attached are found
+    too. A file is deleted only when no memo's ``image`` names it (one
+    indexed ``$in`` query per batch) and it was last modified more than
+    the grace period ago. Deletions are paced to a fixed rate.
+    """
+
+    def __init__(
+        self,
+        backend: StorageBackend,
+        referenced: Callable[[List[str]], Awaitable[Set[str]]],
+        delete: Callable[[str], Awaitable[bool]],
+        staging_dir: Optional[Path] = None,
+        grace: float = GRACE_SECONDS,
+        interval: float = SWEEP_INTERVAL,
+        batch_size: int = BATCH_SIZE,
+        deletes_per_second: float = DELETES_PER_SECOND
+    ):
+        self.backend = backend
+        self.referenced = referenced
+        self.delete = delete
+        self.staging_dir = staging_dir
+        self.grace = grace
+        self.interval = interval
+        self.batch_size = batch_size
+        self.deletes_per_second = deletes_per_second
+        self._pending: Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def enqueue(self, filename: Optional[str]):
+        """Ask for a detached image to be checked soon; returns immediately.
+
+        A no-op when the collector is not running (IMAGE_GC_ENABLED=false),
+        so the queue cannot grow without anything draining it.
+        """
+        if filename and self._task is not None:
+            self._pending.add(filename)
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        next_sweep = time.monotonic()
+        while True:
+            timeout = max(0.0, next_sweep - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                await asyncio.sleep(ENQUEUE_DELAY)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            try:
+                await self.collect_pending()
+                if time.monotonic() >= next_sweep:
+                    await self.sweep()
+                    next_sweep = time.monotonic() + self.interval
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Image garbage collection failed")
+                next_sweep = time.monotonic() + self.interval
+
+    async def collect_pending(self) -> int:
+        """Check the images enqueued by routes"""
+        pending, self._pending = list(self._pending), set()
+        deleted = 0
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            deleted += await self._collect([(key, None) for key in batch])
+        return deleted
+
+    async def sweep(self) -> int:
+        """Walk the whole image store in batches and delete what is orphaned"""
+        deleted = 0
+        async for page in self.backend.list_keys(self.batch_size):
+            deleted += await self._collect(page)
+        deleted += await self._sweep_staging()
+        if deleted:
+            logger.info(f"Image garbage collection deleted {deleted} files")
+        return deleted
+
+    async def _collect(self, candidates: List[Tuple[str, Optional[float]]]) -> int:
+        cutoff = time.time() - self.grace
+        old = [key for key, modified in candidates if modified is None or modified < cutoff]
+        if not old:
+            return 0
+        referenced = await self.referenced(old)
+
+        deleted = 0
+        for key in old:
+            if key in referenced:
+                continue
+            # The backend re-checks the age as it deletes: a deduplicated upload may have just touched it
+            if not await self.backend.delete_if_older(key, time.time() - self.grace):
+                continue
+            # Variants and cached stats go with it
+            await self.delete(key)
+            deleted += 1
+            IMAGE_GC_DELETED.inc()
+            await asyncio.sleep(1 / self.deletes_per_second)
+        return deleted
+
+    async def _sweep_staging(self) -> int:
+        """Remove upload temp files left behind by crashed requests"""
+        if self.staging_dir is None:
+            return 0
+        cutoff = time.time() - self.grace
+
+        def stale_parts() -> List[Path]:
+            with os.scandir(self.staging_dir) as entries:
+                return [
+                    Path(entry.path) for entry in entries
+                    if entry.is_file() and entry.name.endswith(".part") and entry.stat().st_mtime < cutoff
+                ]
+
+        removed = 0
+        for path in await storage.run(stale_parts):
+            removed += await storage.remove(path)
+        return removed
+
+# Global image garbage collector instance
+image_gc = ImageGarbageCollector(image_storage, memo_db.referenced_images, FileHandler.delete_file, UPLOAD_DIR)
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from storage import StorageBackend, storage
+
+logger = logging.getLogger(__name__)
+
+# Widths generated for every upload; the smallest doubles as the list thumbnail
+VARIANT_WIDTHS = (160, 320, 640, 1280)
+WEBP_QUALITY = 80
+
+def variant_name(filename: str, width: int) -> str:
+    return f"{Path(filename).stem}_w{width}.webp"
+
+def variant_key(filename: str, width: int) -> str:
+    """Storage key of a variant"""
+    return f"variants/{variant_name(filename, width)}"
+
+def _render_variants(source_path: str, variant_dir: str, widths: Tuple[int, ...]) -> List[int]:
+    """Resize one image to each width and save it as WebP (runs in a worker process)"""
+    rendered = []
+    with Image.open(source_path) as image:
+        # Animated images are served as-is
+        if getattr(image, "is_animated", False):
+            return rendered
+
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        for width in widths:
+            target = Path(variant_dir) / variant_name(Path(source_path).name, width)
+            if width < image.width:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+            else:
+                resized = image
+            temp_target = target.with_suffix(".webp.part")
+            resized.save(temp_target, "WEBP", quality=WEBP_QUALITY, method=4)
+            os.replace(temp_target, target)
+            rendered.append(width)
+    return rendered
+
+class ImageVariants:
+    """Thumbnails and width variants of uploaded images, rendered in a process pool.
+
+    Variants are generated in the background when an image is saved and
+    lazily, on first request, for images uploaded before this existed.
+    With a remote storage backend the original is downloaded to a scratch
+    directory, rendered there and the variants are uploaded.
+    """
+
+    def __init__(self, backend: StorageBackend, scratch_dir: Path, widths: Tuple[int, ...] = VARIANT_WIDTHS, max_workers: Optional[int] = None):
+        self.backend = backend
+        self.scratch_dir = scratch_dir
+        self.widths = tuple(sorted(widths))
+        self.max_workers = max_workers or int(os.environ.get("IMAGE_WORKERS", "2"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight: Dict[Tuple[str, Tuple[int, ...]], asyncio.Future] = {}
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def closest_width(self, width: int) -> int:
+        """Smallest pre-generated width that covers the request, else the largest"""
+        for candidate in self.widths:
+            if candidate >= width:
+                return candidate
+        return self.widths[-1]
+
+    def variant_keys(self, filename: str) -> List[str]:
+        return [variant_key(filename, width) for width in self.widths]
+
+    async def generate(self, filename: str, widths: Optional[Tuple[int, ...]] = None) -> List[int]:
+        """Render variants of an uploaded image, sharing work with identical in-flight requests"""
+        widths = widths or self.widths
+        key = (filename, widths)
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._generate(filename, widths))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _render(self, source: Path, target_dir: Path, widths: Tuple[int, ...]) -> List[int]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _render_variants, str(source), str(target_dir), widths)
+
+    async def _generate(self, filename: str, widths: Tuple[int, ...]) -> List[int]:
+        source = self.backend.local_path(filename)
+        if source is not None:
+            return await self._render(source, source.parent / "variants", widths)
+
+        work_dir = self.scratch_dir / uuid.uuid4().hex
+        await storage.makedirs(work_dir)
+        try:
+            source = work_dir / filename
+            await self.backend.download_to(filename, source)
+            rendered = await self._render(source, work_dir, widths)
+            await asyncio.gather(*(
+                self.backend.put_file(variant_key(filename, width), work_dir / variant_name(filename, width), "image/webp")
+                for width in rendered
+            ))
+            return rendered
+        finally:
+            await storage.rmtree(work_dir)
+
+    def schedule(self, filename: str, widths: Optional[Tuple[int, ...]] = None):
+        """Generate variants of an image in the background"""
+        task = asyncio.ensure_future(self.generate(filename, widths))
+        task.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Failed to generate image variants: {task.exception()}")
+
+    async def resolve(self, filename: str, width: int) -> Optional[str]:
+        """Key of the variant closest to width; None to serve the original.
+
+        Missing local variants are rendered on demand; remote ones are
+        rendered in the background while the original is served.
+        """
+        closest = self.closest_width(width)
+        key = variant_key(filename, closest)
+        if await self.backend.exists(key):
+            return key
+        if self.backend.local_path(filename) is None:
+            self.schedule(filename, (closest,))
+            return None
+        try:
+            rendered = await self.generate(filename, (closest,))
+        except Exception as e:
+            logger.warning(f"Failed to generate {closest}px variant of {filename}: {e}")
+            return None
+        return key if closest in rendered else None
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,106 @@
+import logging
+from typing import List, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+logger = logging.getLogger(__name__)
+
+# Indexes required by the MemoDatabase query paths
+MEMO_INDEXES = [
+    # Newest-first list and keyset pagination
+    IndexModel(
+        [("created_at", DESCENDING), ("_id", DESCENDING)],
+        name="created_at_id_desc"
+    ),
+    # Newest-first list of one memo type
+    IndexModel(
+        [("type", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+        name="type_created_at_id_desc"
+    ),
+    # Recently changed memos (updated_at range filters)
+    IndexModel(
+        [("updated_at", DESCENDING), ("_id", DESCENDING)],
+        name="updated_at_id_desc"
+    ),
+    # Fallback lookups by the legacy string id (documents without it are skipped)
+    IndexModel(
+        [("id", ASCENDING)],
+        name="id_unique",
+        unique=True,
+        sparse=True
+    ),
+    # Enabled alarms ordered by due time; _id makes alarm windows pageable
+    IndexModel(
+        [("alarm.enabled", ASCENDING), ("alarm.time", ASCENDING), ("_id", ASCENDING)],
+        name="alarm_enabled_time_id",
+        partialFilterExpression={"alarm.enabled": True}
+    ),
+    # Image garbage collection: which stored files are still attached to a memo
+    IndexModel(
+        [("image", ASCENDING)],
+        name="image"
+    ),
+    # Delta sync: memos changed after a collection version
+    IndexModel(
+        [("version", ASCENDING)],
+        name="version"
+    ),
+]
+
+# Indexes replaced by the ones above, dropped by ensure_indexes
+OBSOLETE_INDEXES = ["alarm_enabled_time"]
+
+# Indexes on the tombstones of deleted memos
+TOMBSTONE_INDEXES = [
+    IndexModel([("version", ASCENDING)], name="version"),
+    IndexModel([("deleted_at", ASCENDING)], name="deleted_at"),
+]
+
+class QueryPlanError(RuntimeError):
+    """Raised when a memo query is planned as a collection scan"""
+
+async def ensure_indexes(collection) -> List[str]:
+    """Create the memo indexes (no-op for indexes that already exist)"""
+    names = await collection.create_indexes(MEMO_INDEXES)
+    existing = await collection.index_information()
+    for name in OBSOLETE_INDEXES:
+        if name in existing:
+            await collection.drop_index(name)
+            logger.info(f"Dropped obsolete index {name} on {collection.name}")
+    logger.info(f"Ensured indexes on {collection.name}: {', '.join(names)}")
+    return names
+
+async def ensure_tombstone_indexes(collection) -> List[str]:
+    return await collection.create_indexes(TOMBSTONE_INDEXES)
+
+def find_collscans(plan) -> List[str]:
+    """Return the stages of an explain() plan that scan the whole collection"""
+    stages = []
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            stages.append("COLLSCAN")
+        for value in plan.values():
+            stages.extend(find_collscans(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(find_collscans(item))
+    return stages
+
+async def verify_query_plans(collection, shapes: List[Tuple[str, dict, list]], fail: bool = False) -> List[str]:
+    """Explain each query shape and report the ones that fall back to a COLLSCAN"""
+    offending = []
+    for name, query, sort in shapes:
+        cursor = collection.find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+        if find_collscans(winning_plan):
+            offending.append(name)
+            logger.warning(f"Query '{name}' on {collection.name} uses a COLLSCAN: {query}")
+        else:
+            logger.debug(f"Query '{name}' on {collection.name} is index-backed")
+
+    if offending and fail:
+        raise QueryPlanError(f"Unindexed memo queries: {', '.join(offending)}")
+    return offending
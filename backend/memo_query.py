@@ -0,0 +1,158 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+class UnindexedQueryError(ValueError):
+    """Raised for a filter combination that no memo index can serve"""
+
+class MemoFilters(NamedTuple):
+    """Optional /api/memos filters; ranges are half-open [after, before)"""
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    updated_after: Optional[datetime] = None
+    updated_before: Optional[datetime] = None
+    alarm_enabled: Optional[bool] = None
+    alarm_after: Optional[datetime] = None
+    alarm_before: Optional[datetime] = None
+    type: Optional[str] = None
+
+    def is_empty(self) -> bool:
+        return all(value is None for value in self)
+
+    def cache_key(self) -> str:
+        """Stable string form, for keying cached pages"""
+        return ",".join(
+            f"{name}={value.isoformat() if isinstance(value, datetime) else value}"
+            for name, value in zip(self._fields, self) if value is not None
+        )
+
+class QueryPlan(NamedTuple):
+    index: str  # name of the index in indexes.MEMO_INDEXES that serves the query
+    equality: Tuple[str, ...]  # fields the index prefix matches exactly
+    range_field: str  # field ranged over and sorted by, then _id
+    descending: bool
+
+# Every filterable query the list endpoint runs, one per index
+QUERY_PLANS = [
+    QueryPlan("created_at_id_desc", (), "created_at", True),
+    QueryPlan("type_created_at_id_desc", ("type",), "created_at", True),
+    QueryPlan("updated_at_id_desc", (), "updated_at", True),
+    QueryPlan("alarm_enabled_time_id", ("alarm.enabled",), "alarm.time", False),
+]
+
+# Cursors without a recorded plan are positions in the default newest-first order
+DEFAULT_CURSOR_PLAN = QUERY_PLANS[0].index
+
+RANGE_FILTERS = {
+    "created_at": ("created_after", "created_before"),
+    "updated_at": ("updated_after", "updated_before"),
+    "alarm.time": ("alarm_after", "alarm_before"),
+}
+
+def encode_cursor(position: datetime, last_id, plan: str = DEFAULT_CURSOR_PLAN) -> str:
+    """Encode a (sort value, _id) position in the order of a query plan as an opaque cursor"""
+    from bson import ObjectId
+    payload = {
+        "t": position.isoformat(),
+        "id": str(last_id),
+        "oid": isinstance(last_id, ObjectId),
+        "p": plan,
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, plan: str = DEFAULT_CURSOR_PLAN) -> Tuple[datetime, object]:
+    """Decode an opaque cursor, raising ValueError if it is malformed or from another query plan"""
+    from bson import ObjectId
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        position = datetime.fromisoformat(payload["t"])
+        last_id = ObjectId(payload["id"]) if payload.get("oid") else payload["id"]
+        cursor_plan = payload.get("p", DEFAULT_CURSOR_PLAN)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    # A position in one sort order means nothing in another
+    if cursor_plan != plan:
+        raise ValueError("Cursor belongs to a query with different filters")
+    return position, last_id
+
+def keyset_query(field: str, value, last_id, descending: bool = True) -> dict:
+    """Filter for the documents strictly after a (field, _id) position in sort order"""
+    inclusive, strict = ("$lte", "$lt") if descending else ("$gte", "$gt")
+    return {
+        # Top-level bound keeps the scan on the field's index
+        field: {inclusive: value},
+        "$or": [
+            {field: {strict: value}},
+            {field: value, "_id": {strict: last_id}},
+        ]
+    }
+
+class MemoQuery(NamedTuple):
+    filter: dict
+    plan: QueryPlan
+
+    @property
+    def sort(self) -> List[Tuple[str, int]]:
+        direction = -1 if self.plan.descending else 1
+        return [(self.plan.range_field, direction), ("_id", direction)]
+
+    def after(self, value, last_id) -> dict:
+        """The filter restricted to documents after a cursor position"""
+        page = keyset_query(self.plan.range_field, value, last_id, self.plan.descending)
+        return {"$and": [self.filter, page]} if self.filter else page
+
+    def position(self, memo: dict):
+        """The sort value of a fetched memo, for the next page cursor"""
+        value = memo
+        for part in self.plan.range_field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+
+def build_memo_query(filters: Optional[MemoFilters] = None) -> MemoQuery:
+    """Translate list filters into a Mongo query served by one of QUERY_PLANS.
+
+    Raises UnindexedQueryError for combinations without a matching index,
+    rather than letting them fall back to a collection scan.
+    """
+    filters = filters or MemoFilters()
+
+    ranges = {}
+    for field, (after_name, before_name) in RANGE_FILTERS.items():
+        after, before = getattr(filters, after_name), getattr(filters, before_name)
+        bounds = {}
+        if after is not None:
+            bounds["$gte"] = after
+        if before is not None:
+            bounds["$lt"] = before
+        if bounds:
+            ranges[field] = bounds
+    if len(ranges) > 1:
+        raise UnindexedQueryError("Only one of the created, updated and alarm time ranges can be used at a time")
+
+    equality = {}
+    if filters.type is not None:
+        equality["type"] = filters.type
+    if filters.alarm_enabled is not None or "alarm.time" in ranges:
+        # Only enabled alarms are indexed (partial index)
+        if filters.alarm_enabled is False:
+            raise UnindexedQueryError("Filtering on disabled alarms is not supported")
+        equality["alarm.enabled"] = True
+
+    range_field = next(iter(ranges), None)
+    for plan in QUERY_PLANS:
+        if set(plan.equality) == set(equality) and range_field in (None, plan.range_field):
+            break
+    else:
+        filtered = ", ".join([*equality, *ranges])
+        raise UnindexedQueryError(f"No index supports filtering on {filtered} together")
+
+    query = dict(equality)
+    if plan.range_field in ranges:
+        query[plan.range_field] = ranges[plan.range_field]
+    elif plan.range_field == "alarm.time":
+        # Enabled alarms without a time have no position in the alarm order
+        query["alarm.time"] = {"$ne": None}
+    return MemoQuery(query, plan)
@@ -0,0 +1,341 @@
+import bisect
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# METRICS_ENABLED=false turns every timer into the undecorated function and skips the middleware
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() not in ("0", "false", "no", "off")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    """A labelled metric family rendered in the Prometheus text format"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in values]
+
+class Gauge(Metric):
+    """A value that goes up and down, or is read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labels)
+        self.function = function
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value: float, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def samples(self) -> List[str]:
+        if self.function is not None:
+            try:
+                return [f"{self.name} {self.function()}"]
+            except Exception as e:
+                logger.warning(f"Failed to read gauge {self.name}: {e}")
+                return []
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in values]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._series: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def time(self, *label_values):
+        """Decorator observing the duration of a sync or async function"""
+        def decorator(func):
+            if not METRICS_ENABLED:
+                return func
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        self.observe(time.perf_counter() - start, *label_values)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, *label_values)
+            return wrapper
+        return decorator
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total[0]) for key, (counts, total) in self._series.items()]
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+registry = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+))
+HTTP_RESPONSE_BYTES = registry.register(Histogram(
+    "http_response_size_bytes", "HTTP response body size by route", ("method", "route"), buckets=SIZE_BUCKETS
+))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"
+))
+DB_OPERATION_SECONDS = registry.register(Histogram(
+    "db_operation_duration_seconds", "MemoDatabase method latency", ("operation",)
+))
+MONGO_COMMAND_SECONDS = registry.register(Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency reported by the driver", ("command",)
+))
+MONGO_COMMAND_FAILURES = registry.register(Counter(
+    "mongo_command_failures_total", "MongoDB commands that failed", ("command",)
+))
+MONGO_POOL_CONNECTIONS = registry.register(Gauge(
+    "mongo_pool_connections", "Open connections in the MongoDB pool", ("address",)
+))
+MONGO_POOL_IN_USE = registry.register(Gauge(
+    "mongo_pool_connections_in_use", "MongoDB connections checked out by operations", ("address",)
+))
+MONGO_POOL_WAITING = registry.register(Gauge(
+    "mongo_pool_waiting", "Operations waiting for a MongoDB connection", ("address",)
+))
+MONGO_POOL_CHECKOUT_SECONDS = registry.register(Histogram(
+    "mongo_pool_checkout_duration_seconds", "Time spent waiting for a pooled MongoDB connection", ("address",)
+))
+MONGO_POOL_CHECKOUT_FAILURES = registry.register(Counter(
+    "mongo_pool_checkout_failures_total", "MongoDB connection checkouts that failed", ("address", "reason")
+))
+MONGO_POOL_CLEARED = registry.register(Counter(
+    "mongo_pool_cleared_total", "Times a MongoDB pool was cleared after a server error", ("address",)
+))
+FILE_OPERATION_SECONDS = registry.register(Histogram(
+    "file_operation_duration_seconds", "FileHandler I/O latency", ("operation",)
+))
+FILE_IO_WAITING = registry.register(Gauge(
+    "file_io_waiting", "Filesystem calls waiting for a free slot in the storage queue"
+))
+FILE_IO_QUEUED = registry.register(Gauge(
+    "file_io_queue_depth", "Filesystem calls queued for a storage thread"
+))
+FILE_IO_ACTIVE = registry.register(Gauge(
+    "file_io_active", "Filesystem calls running on storage threads"
+))
+FILE_IO_QUEUE_WAIT_SECONDS = registry.register(Histogram(
+    "file_io_queue_wait_seconds", "Time filesystem calls spent queued before a storage thread picked them up"
+))
+FILE_BYTES_WRITTEN = registry.register(Counter(
+    "file_bytes_written_total", "Bytes of uploaded images written to disk"
+))
+ADMISSION_IN_FLIGHT = registry.register(Gauge(
+    "admission_in_flight", "Admitted requests currently being served, by class", ("class",)
+))
+ADMISSION_REJECTED = registry.register(Counter(
+    "admission_rejected_total", "Requests turned away with 429 (rate_limited) or 503 (overloaded)", ("class", "reason")
+))
+IMAGE_GC_DELETED = registry.register(Counter(
+    "image_gc_deleted_total", "Orphaned images (with their variants) deleted by the garbage collector"
+))
+
+def gauge_function(name: str, documentation: str, function: Callable[[], float]):
+    """Expose a value computed at scrape time, e.g. the number of SSE clients"""
+    registry.register(Gauge(name, documentation, function=function))
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and body size per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method, route_label, str(status))
+            HTTP_RESPONSE_BYTES.observe(size, method, route_label)
+
+def mongo_event_listeners() -> list:
+    """Driver event listeners to pass to AsyncIOMotorClient (none when metrics are off)"""
+    if not METRICS_ENABLED:
+        return []
+    from pymongo import monitoring
+
+    class CommandMetrics(monitoring.CommandListener):
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name)
+
+        def failed(self, event):
+            MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name)
+            MONGO_COMMAND_FAILURES.inc(event.command_name)
+
+    class PoolMetrics(monitoring.ConnectionPoolListener):
+        """Pool occupancy and checkout wait times, for sizing maxPoolSize from data"""
+
+        def __init__(self):
+            # Checkouts start and finish on the same driver thread
+            self._checkout_started = threading.local()
+
+        @staticmethod
+        def _address(event) -> str:
+            host, port = event.address
+            return f"{host}:{port}"
+
+        def pool_created(self, event):
+            pass
+
+        def pool_ready(self, event):
+            pass
+
+        def pool_cleared(self, event):
+            MONGO_POOL_CLEARED.inc(self._address(event))
+
+        def pool_closed(self, event):
+            pass
+
+        def connection_created(self, event):
+            MONGO_POOL_CONNECTIONS.inc(self._address(event))
+
+        def connection_ready(self, event):
+            pass
+
+        def connection_closed(self, event):
+            MONGO_POOL_CONNECTIONS.dec(self._address(event))
+
+        def connection_check_out_started(self, event):
+            self._checkout_started.value = time.perf_counter()
+            MONGO_POOL_WAITING.inc(self._address(event))
+
+        def _check_out_finished(self, event):
+            address = self._address(event)
+            MONGO_POOL_WAITING.dec(address)
+            started = getattr(self._checkout_started, "value", None)
+            if started is not None:
+                MONGO_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started, address)
+                self._checkout_started.value = None
+            return address
+
+        def connection_check_out_failed(self, event):
+            address = self._check_out_finished(event)
+            MONGO_POOL_CHECKOUT_FAILURES.inc(address, event.reason)
+
+        def connection_checked_out(self, event):
+            address = self._check_out_finished(event)
+            MONGO_POOL_IN_USE.inc(address)
+
+        def connection_checked_in(self, event):
+            MONGO_POOL_IN_USE.dec(self._address(event))
+
+    return [CommandMetrics(), PoolMetrics()]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 from datetime import datetime
 import uuid
 
@@ -28,10 +28,64 @@ class MemoResponse(MemoBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    version: Optional[int] = None  # collection version of the last write
     
     class Config:
         from_attributes = True
 
+class MemoSummary(BaseModel):
+    """Lightweight list representation; the full memo is at /api/memos/{id}"""
+    id: str
+    title: str
+    content_preview: str = ""
+    content_truncated: bool = False
+    image: Optional[str] = None
+    alarm: AlarmModel = Field(default_factory=AlarmModel)
+    type: Literal["text", "image"] = "text"
+    created_at: datetime
+    updated_at: datetime
+    version: Optional[int] = None
+
+class MemoDelta(BaseModel):
+    """Changes to the memo list after a collection version (GET /api/memos?since=)"""
+    version: int
+    memos: List[MemoResponse] = []
+    deleted: List[str] = []
+    resync: bool = False  # too far behind: refetch the full list
+
 class ImageUploadResponse(BaseModel):
     filename: str
-    url: str
\ No newline at end of file
+    url: str
+
+class BatchOperation(BaseModel):
+    op: Literal["create", "update", "delete", "toggle_alarm"]
+    id: Optional[str] = None  # required for update, delete and toggle_alarm
+    memo: Optional[MemoCreate] = None  # required for create
+    changes: Optional[MemoUpdate] = None  # required for update
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=1000)
+    ordered: bool = True
+
+class BatchItemResult(BaseModel):
+    index: int
+    op: str
+    status: Literal["ok", "not_found", "error", "skipped"]
+    id: Optional[str] = None
+    memo: Optional[MemoResponse] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchItemResult]
+    created: int = 0
+    updated: int = 0
+    deleted: int = 0
+    failed: int = 0
+
+class SearchHit(BaseModel):
+    memo: MemoResponse
+    score: float
+
+class SearchResponse(BaseModel):
+    total: int
+    results: List[SearchHit]
@@ -0,0 +1,94 @@
+import importlib.util
+import logging
+import os
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Compressors in order of preference, with the Python package each one needs
+COMPRESSOR_PACKAGES = {"zstd": "zstandard", "snappy": "snappy", "zlib": None}
+
+def _int_env(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+def _bool_env(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+def available_compressors(requested: str) -> List[str]:
+    """Requested wire compressors whose Python packages are installed"""
+    compressors = []
+    for name in (item.strip().lower() for item in requested.split(",")):
+        if not name:
+            continue
+        if name not in COMPRESSOR_PACKAGES:
+            logger.warning(f"Unknown MongoDB compressor {name!r} ignored")
+            continue
+        package = COMPRESSOR_PACKAGES[name]
+        if package and importlib.util.find_spec(package) is None:
+            logger.info(f"MongoDB compressor {name} needs the {package} package; skipping it")
+            continue
+        compressors.append(name)
+    return compressors
+
+def mongo_client_options() -> dict:
+    """AsyncIOMotorClient keyword arguments from MONGO_* environment variables.
+
+    Defaults bound every wait: a burst queues for at most
+    MONGO_WAIT_QUEUE_TIMEOUT_MS for a pooled connection, and an
+    unreachable or slow primary fails after the selection and socket
+    timeouts instead of hanging the request.
+    """
+    options = {
+        "maxPoolSize": _int_env("MONGO_MAX_POOL_SIZE", 100),
+        "minPoolSize": _int_env("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _int_env("MONGO_MAX_IDLE_TIME_MS", 300000),
+        "maxConnecting": _int_env("MONGO_MAX_CONNECTING", 2),
+        "waitQueueTimeoutMS": _int_env("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000),
+        "serverSelectionTimeoutMS": _int_env("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "connectTimeoutMS": _int_env("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "socketTimeoutMS": _int_env("MONGO_SOCKET_TIMEOUT_MS", 20000),
+        "retryWrites": _bool_env("MONGO_RETRY_WRITES", True),
+        "retryReads": _bool_env("MONGO_RETRY_READS", True),
+        "appname": os.environ.get("MONGO_APP_NAME", "time-notes-api"),
+    }
+    # Client-side operation timeout (MongoDB 4.4+ drivers); overrides the socket timeout when set
+    timeout_ms = _int_env("MONGO_TIMEOUT_MS", None)
+    if timeout_ms is not None:
+        options["timeoutMS"] = timeout_ms
+
+    compressors = available_compressors(os.environ.get("MONGO_COMPRESSORS", "zstd,snappy,zlib"))
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+        if "zlib" in compressors:
+            options["zlibCompressionLevel"] = _int_env("MONGO_ZLIB_LEVEL", 6)
+    return options
+
+def list_read_preference():
+    """Read preference for memo list pages (MONGO_LIST_READ_PREFERENCE, default primary).
+
+    Secondary reads take list traffic off the primary at the price of
+    replication lag; MONGO_LIST_MAX_STALENESS_S bounds how stale they may be.
+    """
+    from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+    modes = {
+        "primary": Primary,
+        "primarypreferred": PrimaryPreferred,
+        "secondary": Secondary,
+        "secondarypreferred": SecondaryPreferred,
+        "nearest": Nearest,
+    }
+    name = os.environ.get("MONGO_LIST_READ_PREFERENCE", "primary")
+    mode = modes.get(name.lower())
+    if mode is None:
+        raise ValueError(f"Invalid MONGO_LIST_READ_PREFERENCE: {name}")
+    if mode is Primary:
+        return Primary()
+    max_staleness = _int_env("MONGO_LIST_MAX_STALENESS_S", -1)
+    return mode(max_staleness=max_staleness)
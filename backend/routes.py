@@ -1,20 +1,77 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from fastapi.responses import FileResponse
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from datetime import datetime
+from typing import List, Literal, Optional, Union
 import json
 
-from models import MemoCreate, MemoUpdate, MemoResponse, ImageUploadResponse, AlarmModel
-from database import memo_db
-from file_handler import FileHandler
+from models import (
+    MemoCreate, MemoUpdate, MemoResponse, MemoSummary, MemoDelta, ImageUploadResponse, AlarmModel,
+    BatchRequest, BatchResponse, BatchItemResult, SearchResponse, SearchHit
+)
+from database import memo_db, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from memo_query import MemoFilters
+from file_handler import FileHandler, image_variants
+from image_gc import image_gc
+from events import event_hub
+from http_cache import etag_matches
+from serialization import FastJSONResponse
 
 router = APIRouter(prefix="/api", tags=["memos"])
 
-@router.get("/memos", response_model=List[MemoResponse])
-async def get_memos():
-    """Get all memos"""
+@router.get("/memos", response_model=Union[List[MemoResponse], List[MemoSummary], MemoDelta])
+async def get_memos(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    view: Literal["full", "summary"] = "full",
+    since: Optional[int] = Query(None, ge=0),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+    alarm: Optional[bool] = None,
+    alarm_after: Optional[datetime] = None,
+    alarm_before: Optional[datetime] = None,
+    type: Optional[Literal["text", "image"]] = None
+):
+    """Get a page of memos (newest first); the next page cursor is sent in X-Next-Cursor
+
+    ``view=summary`` returns MemoSummary items with a truncated content preview.
+    The ETag carries the collection version: If-None-Match answers 304 when
+    nothing changed, and ``since=<version>`` returns only the changes (MemoDelta).
+    Range filters are half-open ``[after, before)``; ``alarm_after``/``alarm_before``
+    select enabled alarms in a window, soonest first. Filter combinations
+    without a backing index are rejected with 400.
+    """
+    filters = MemoFilters(
+        created_after=created_after, created_before=created_before,
+        updated_after=updated_after, updated_before=updated_before,
+        alarm_enabled=alarm, alarm_after=alarm_after, alarm_before=alarm_before,
+        type=type
+    )
+    if since is not None and not filters.is_empty():
+        raise HTTPException(status_code=400, detail="since cannot be combined with filters")
     try:
-        memos = await memo_db.get_all_memos()
-        return memos
+        version = await memo_db.current_version()
+        etag = f'"memos-{version}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        
+        if since is not None:
+            delta = await memo_db.changes_since(since, summary=view == "summary")
+            headers["ETag"] = f'"memos-{delta["version"]}"'
+            return FastJSONResponse(delta, headers=headers)
+        
+        memos, next_cursor = await memo_db.get_memos_page(
+            limit=limit, cursor=cursor, summary=view == "summary", version=version, filters=filters
+        )
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        return FastJSONResponse(memos, headers=headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch memos: {str(e)}")
 
@@ -28,13 +85,77 @@ async def create_memo(memo: MemoCreate):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create memo: {str(e)}")
 
+@router.post("/memos:batch", response_model=BatchResponse)
+async def batch_memos(batch: BatchRequest):
+    """Create, update, delete and toggle alarms of many memos in one bulk write"""
+    operations = []
+    for index, operation in enumerate(batch.operations):
+        if operation.op == "create":
+            if operation.memo is None:
+                raise HTTPException(status_code=400, detail=f"Operation {index}: create requires memo")
+            operations.append({"op": "create", "data": operation.memo.dict()})
+            continue
+        
+        if not operation.id:
+            raise HTTPException(status_code=400, detail=f"Operation {index}: {operation.op} requires id")
+        data = None
+        if operation.op == "update":
+            data = {k: v for k, v in (operation.changes.dict() if operation.changes else {}).items() if v is not None}
+            if not data:
+                raise HTTPException(status_code=400, detail=f"Operation {index}: no data provided for update")
+        operations.append({"op": operation.op, "id": operation.id, "data": data})
+    
+    try:
+        results = await memo_db.bulk_write(operations, ordered=batch.ordered)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to apply batch: {str(e)}")
+    
+    # Images a memo stopped using are left to the garbage collector
+    for result in results:
+        if result["status"] != "ok" or not result["previous"]:
+            continue
+        old_image = result["previous"].get("image")
+        new_image = result["memo"].get("image") if result["memo"] else None
+        if old_image != new_image:
+            image_gc.enqueue(old_image)
+    
+    counts = {"created": 0, "updated": 0, "deleted": 0, "failed": 0}
+    for result in results:
+        if result["status"] == "ok":
+            counts[{"create": "created", "delete": "deleted"}.get(result["op"], "updated")] += 1
+        elif result["status"] in ("error", "not_found"):
+            counts["failed"] += 1
+    
+    return BatchResponse(
+        results=[
+            BatchItemResult(**{k: v for k, v in result.items() if k != "previous"})
+            for result in results
+        ],
+        **counts
+    )
+
+@router.get("/memos/search", response_model=SearchResponse)
+async def search_memos(
+    q: str = Query(..., min_length=1, max_length=200),
+    type: Optional[Literal["text", "image"]] = None,
+    alarm: Optional[bool] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    """Full-text search over memo titles and content, best matches first"""
+    total, hits = await memo_db.search_memos(q, memo_type=type, alarm_enabled=alarm, limit=limit, offset=offset)
+    return SearchResponse(
+        total=total,
+        results=[SearchHit(memo=memo, score=round(score, 4)) for memo, score in hits]
+    )
+
 @router.get("/memos/{memo_id}", response_model=MemoResponse)
 async def get_memo(memo_id: str):
     """Get a specific memo"""
     memo = await memo_db.get_memo_by_id(memo_id)
     if not memo:
         raise HTTPException(status_code=404, detail="Memo not found")
-    return memo
+    return FastJSONResponse(memo)
 
 @router.put("/memos/{memo_id}", response_model=MemoResponse)
 async def update_memo(memo_id: str, memo_update: MemoUpdate):
@@ -45,51 +166,61 @@ async def update_memo(memo_id: str, memo_update: MemoUpdate):
     if not update_data:
         raise HTTPException(status_code=400, detail="No data provided for update")
     
-    updated_memo = await memo_db.update_memo(memo_id, update_data)
+    updated_memo, replaced_image = await memo_db.update_memo_and_replaced_image(memo_id, update_data)
     if not updated_memo:
         raise HTTPException(status_code=404, detail="Memo not found")
     
+    # The replaced image is deleted later if no other memo uses it
+    image_gc.enqueue(replaced_image)
+    
     return updated_memo
 
 @router.delete("/memos/{memo_id}")
 async def delete_memo(memo_id: str):
     """Delete a memo"""
-    # Get memo to delete associated image
-    memo = await memo_db.get_memo_by_id(memo_id)
-    
-    # Delete the memo
-    success = await memo_db.delete_memo(memo_id)
-    if not success:
+    # The deleted document tells us which image to release
+    memo = await memo_db.delete_memo(memo_id)
+    if not memo:
         raise HTTPException(status_code=404, detail="Memo not found")
     
-    # Delete associated image if exists
-    if memo and memo.get("image"):
-        FileHandler.delete_file(memo["image"])
+    # The associated image is deleted later if no other memo uses it
+    image_gc.enqueue(memo.get("image"))
     
     return {"message": "Memo deleted successfully"}
 
 @router.post("/memos/{memo_id}/toggle-alarm", response_model=MemoResponse)
 async def toggle_memo_alarm(memo_id: str):
     """Toggle alarm for a memo"""
-    memo = await memo_db.get_memo_by_id(memo_id)
-    if not memo:
+    # Flipped atomically in Mongo, so concurrent toggles cannot lose updates
+    updated_memo = await memo_db.toggle_alarm(memo_id)
+    if not updated_memo:
         raise HTTPException(status_code=404, detail="Memo not found")
     
-    # Toggle alarm
-    current_alarm = memo.get("alarm", {"enabled": False, "time": None})
-    new_alarm = {
-        "enabled": not current_alarm.get("enabled", False),
-        "time": current_alarm.get("time")
-    }
-    
-    updated_memo = await memo_db.update_memo(memo_id, {"alarm": new_alarm})
     return updated_memo
 
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Memo cache hit, miss and eviction counters"""
+    return memo_db.cache.stats()
+
+@router.get("/events")
+async def stream_events():
+    """Stream memo changes and due alarms as Server-Sent Events"""
+    return StreamingResponse(
+        event_hub.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/upload-image", response_model=ImageUploadResponse)
-async def upload_image(file: UploadFile = File(...)):
-    """Upload an image file"""
+async def upload_image(request: Request):
+    """Upload an image file
+
+    Expects the multipart form field ``file``; the body is streamed to disk
+    instead of being spooled by File(), so oversized uploads stop early.
+    """
     try:
-        filename = await FileHandler.save_uploaded_file(file)
+        filename = await FileHandler.save_uploaded_file(request)
         url = f"/api/images/{filename}"
         return ImageUploadResponse(filename=filename, url=url)
     except HTTPException:
@@ -98,13 +229,14 @@ async def upload_image(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e)}")
 
 @router.post("/upload-base64-image", response_model=ImageUploadResponse)
-async def upload_base64_image(
-    image_data: str = Form(...),
-    filename: str = Form(default="image.jpg")
-):
-    """Upload a base64 encoded image (for camera captures)"""
+async def upload_base64_image(request: Request):
+    """Upload a base64 encoded image (for camera captures)
+
+    Expects multipart form fields ``image_data`` and optional ``filename``;
+    the body is parsed and decoded incrementally instead of through Form().
+    """
     try:
-        saved_filename = await FileHandler.save_base64_image(image_data, filename)
+        saved_filename = await FileHandler.save_base64_form(request)
         url = f"/api/images/{saved_filename}"
         return ImageUploadResponse(filename=saved_filename, url=url)
     except HTTPException:
@@ -113,10 +245,14 @@ async def upload_base64_image(
         raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e)}")
 
 @router.get("/images/{filename}")
-async def get_image(filename: str):
-    """Serve an uploaded image"""
-    file_path = FileHandler.get_file_path(filename)
-    if not file_path:
+async def get_image(request: Request, filename: str, w: Optional[int] = Query(None, ge=1, le=4096)):
+    """Serve an uploaded image, or with ?w= the closest resized WebP variant"""
+    if not await FileHandler.image_exists(filename):
         raise HTTPException(status_code=404, detail="Image not found")
     
-    return FileResponse(file_path)
\ No newline at end of file
+    key, media_type = filename, None
+    if w is not None:
+        variant_key = await image_variants.resolve(filename, w)
+        if variant_key:
+            key, media_type = variant_key, "image/webp"
+    return await FileHandler.image_response(request, key, media_type)
@@ -0,0 +1,179 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Alarms that came due while the server was down are still fired within this window
+MISSED_ALARM_GRACE = timedelta(minutes=1)
+
+AlarmListener = Callable[[str, datetime], Awaitable[None]]
+
+def to_utc_naive(value) -> Optional[datetime]:
+    """Normalize an alarm time to the naive UTC datetimes stored by Mongo"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class AlarmScheduler:
+    """Fires memo alarms from a min-heap of due times.
+
+    The heap may hold stale entries for alarms that were rescheduled or
+    removed; ``_due`` is the source of truth and stale entries are skipped
+    when they reach the top.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int, str]] = []
+        self._due: Dict[str, datetime] = {}
+        # Alarm times already fired per memo, so later edits of the memo do not fire them again
+        self._fired: Dict[str, datetime] = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[AlarmListener] = []
+        self._collection = None
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def add_listener(self, listener: AlarmListener):
+        """Register a coroutine called with (memo_id, alarm_time) when an alarm fires"""
+        self._listeners.append(listener)
+
+    async def load(self, collection):
+        """Load every enabled upcoming alarm through the alarm.time index"""
+        self._collection = collection
+        since = datetime.utcnow() - MISSED_ALARM_GRACE
+        cursor = collection.find(
+            {"alarm.enabled": True, "alarm.time": {"$gte": since}},
+            {"alarm.time": 1}
+        ).sort("alarm.time", 1)
+
+        self._heap = []
+        self._due = {}
+        async for memo in cursor:
+            memo_id = str(memo["_id"])
+            alarm_time = to_utc_naive(memo["alarm"]["time"])
+            if self._fired.get(memo_id) == alarm_time:
+                continue
+            self._due[memo_id] = alarm_time
+            self._heap.append((alarm_time, next(self._counter), memo_id))
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+        logger.info(f"Alarm scheduler loaded {len(self._due)} alarms")
+
+    def schedule(self, memo_id: str, alarm_time: datetime):
+        """Add or move the alarm of a memo; alarms already fired or long past are dropped"""
+        alarm_time = to_utc_naive(alarm_time)
+        if self._due.get(memo_id) == alarm_time:
+            return
+        if self._fired.get(memo_id) == alarm_time or alarm_time < datetime.utcnow() - MISSED_ALARM_GRACE:
+            self.unschedule(memo_id)
+            return
+        self._due[memo_id] = alarm_time
+        heapq.heappush(self._heap, (alarm_time, next(self._counter), memo_id))
+        self._compact()
+        if self._heap[0][2] == memo_id:
+            self._wakeup.set()
+
+    def unschedule(self, memo_id: str):
+        """Drop the alarm of a memo (its heap entry becomes stale)"""
+        if self._due.pop(memo_id, None) is not None:
+            self._compact()
+
+    def sync(self, memo: Optional[dict]):
+        """Bring the schedule in line with the current state of a memo"""
+        if not memo:
+            return
+        alarm = memo.get("alarm") or {}
+        if alarm.get("enabled") and alarm.get("time"):
+            self.schedule(memo["id"], alarm["time"])
+        else:
+            self.unschedule(memo["id"])
+
+    async def memo_changed(self, change):
+        """ChangeFeed listener"""
+        if change.operation == "delete":
+            self.unschedule(change.memo_id)
+        elif change.operation == "resync":
+            if self._collection is not None:
+                await self.load(self._collection)
+        else:
+            self.sync(change.memo)
+
+    def next_due(self) -> Optional[Tuple[datetime, str]]:
+        """Earliest live (alarm_time, memo_id), discarding stale heap entries"""
+        while self._heap:
+            alarm_time, _, memo_id = self._heap[0]
+            if self._due.get(memo_id) == alarm_time:
+                return alarm_time, memo_id
+            heapq.heappop(self._heap)
+        return None
+
+    def _compact(self):
+        """Rebuild the heap once stale entries outnumber live ones"""
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [entry for entry in self._heap if self._due.get(entry[2]) == entry[0]]
+            heapq.heapify(self._heap)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            entry = self.next_due()
+            if entry is None:
+                await self._wakeup.wait()
+                continue
+
+            alarm_time, memo_id = entry
+            delay = (alarm_time - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                # Re-check the top: it may have changed while we slept
+                continue
+
+            heapq.heappop(self._heap)
+            del self._due[memo_id]
+            self._remember_fired(memo_id, alarm_time)
+            await self._fire(memo_id, alarm_time)
+
+    def _remember_fired(self, memo_id: str, alarm_time: datetime):
+        """Record a fired alarm; entries past the grace window are covered by the age check"""
+        self._fired[memo_id] = alarm_time
+        cutoff = datetime.utcnow() - MISSED_ALARM_GRACE
+        if len(self._fired) > 2 * len(self._due) + 64:
+            self._fired = {key: value for key, value in self._fired.items() if value >= cutoff}
+
+    async def _fire(self, memo_id: str, alarm_time: datetime):
+        logger.info(f"Alarm due for memo {memo_id} at {alarm_time.isoformat()}")
+        for listener in self._listeners:
+            try:
+                await listener(memo_id, alarm_time)
+            except Exception:
+                logger.exception(f"Alarm listener failed for memo {memo_id}")
+
+# Global scheduler instance
+alarm_scheduler = AlarmScheduler()
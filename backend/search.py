@@ -0,0 +1,146 @@
+import bisect
+import heapq
+import logging
+import math
+import re
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+TITLE_WEIGHT = 2  # title terms count as this many occurrences
+MAX_PREFIX_EXPANSIONS = 64
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+class DocumentInfo(NamedTuple):
+    terms: Counter
+    length: int
+    type: str
+    alarm_enabled: bool
+
+class MemoSearchIndex:
+    """In-process inverted index over memo titles and content, ranked with BM25.
+
+    The last query term also matches as a prefix so results update while
+    the user types. MemoDatabase keeps the index in sync on every write.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._vocabulary: List[str] = []  # sorted, for prefix lookups
+        self._documents: Dict[str, DocumentInfo] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    async def load(self, collection):
+        """Build the index from every memo in the collection"""
+        self.__init__()
+        projection = {"title": 1, "content": 1, "type": 1, "alarm.enabled": 1}
+        async for memo in collection.find({}, projection):
+            memo["id"] = str(memo.pop("_id"))
+            self.upsert(memo)
+        logger.info(f"Search index loaded {len(self)} memos ({len(self._vocabulary)} terms)")
+
+    def upsert(self, memo: dict):
+        """Index a memo, replacing any previous version of it"""
+        memo_id = memo["id"]
+        self.remove(memo_id)
+
+        terms = Counter(tokenize(memo.get("content")))
+        for term in tokenize(memo.get("title")):
+            terms[term] += TITLE_WEIGHT
+        alarm = memo.get("alarm") or {}
+        document = DocumentInfo(terms, sum(terms.values()), memo.get("type", "text"), bool(alarm.get("enabled")))
+
+        self._documents[memo_id] = document
+        self._total_length += document.length
+        for term, frequency in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._vocabulary, term)
+            postings[memo_id] = frequency
+
+    def remove(self, memo_id: str):
+        document = self._documents.pop(memo_id, None)
+        if document is None:
+            return
+        self._total_length -= document.length
+        for term in document.terms:
+            postings = self._postings[term]
+            del postings[memo_id]
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+
+    def _expand(self, term: str, prefix: bool) -> List[str]:
+        if not prefix:
+            return [term] if term in self._postings else []
+        start = bisect.bisect_left(self._vocabulary, term)
+        matches = []
+        for candidate in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not candidate.startswith(term):
+                break
+            matches.append(candidate)
+        return matches
+
+    def search(
+        self,
+        query: str,
+        memo_type: Optional[str] = None,
+        alarm_enabled: Optional[bool] = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> Tuple[int, List[Tuple[str, float]]]:
+        """Return (total matches, [(memo_id, score)]) for one page, best first.
+
+        Every query term must match; the last one may match as a prefix.
+        """
+        query_terms = tokenize(query)
+        if not query_terms or not self._documents:
+            return 0, []
+
+        document_count = len(self._documents)
+        average_length = self._total_length / document_count or 1.0
+        scores: Optional[Dict[str, float]] = None
+
+        for position, query_term in enumerate(query_terms):
+            is_last = position == len(query_terms) - 1
+            term_scores: Dict[str, float] = {}
+            for term in self._expand(query_term, prefix=is_last):
+                postings = self._postings[term]
+                idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for memo_id, frequency in postings.items():
+                    if scores is not None and memo_id not in scores:
+                        continue
+                    length = self._documents[memo_id].length
+                    weight = frequency * (BM25_K1 + 1) / (
+                        frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    )
+                    # A prefix expanding to several terms scores its best match
+                    term_scores[memo_id] = max(term_scores.get(memo_id, 0.0), idf * weight)
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {memo_id: scores[memo_id] + score for memo_id, score in term_scores.items()}
+            if not scores:
+                return 0, []
+
+        if memo_type is not None or alarm_enabled is not None:
+            scores = {
+                memo_id: score for memo_id, score in scores.items()
+                if (memo_type is None or self._documents[memo_id].type == memo_type)
+                and (alarm_enabled is None or self._documents[memo_id].alarm_enabled == alarm_enabled)
+            }
+
+        # Only the requested page needs to be ordered
+        ranked = heapq.nsmallest(offset + limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return len(scores), ranked[offset:]
@@ -0,0 +1,25 @@
+from typing import Any
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import Response
+
+def _default(value: Any):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    """Serialize Mongo documents straight to JSON bytes (datetimes natively, ObjectIds as strings)"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+class FastJSONResponse(Response):
+    """JSON response for documents that were validated when they were written.
+
+    Returning it from a route skips FastAPI's response_model validation and
+    jsonable_encoder pass; the response_model is still used for the docs.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,8 +1,8 @@
-from fastapi import FastAPI, APIRouter
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, APIRouter, HTTPException, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 import os
 import logging
 from pathlib import Path
@@ -10,9 +10,17 @@ from pathlib import Path
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Imported after load_dotenv so METRICS_ENABLED can come from .env
+import metrics
+from mongo_settings import mongo_client_options
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    event_listeners=metrics.mongo_event_listeners(),
+    **mongo_client_options()
+)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app
@@ -22,9 +30,10 @@ app = FastAPI(title="Time Notes API", version="1.0.0")
 from routes import router as memo_router
 app.include_router(memo_router)
 
-# Serve static files (uploaded images)
-uploads_dir = ROOT_DIR / "uploads"
-uploads_dir.mkdir(exist_ok=True)
+# Rate limits and in-flight caps; added first so CORS headers wrap its 429/503 answers
+import admission
+if admission.RATE_LIMIT_ENABLED:
+    app.add_middleware(admission.AdmissionMiddleware, routes=app.routes)
 
 # CORS middleware
 app.add_middleware(
@@ -33,13 +42,25 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Retry-After"],
 )
 
+# Outermost, so its latency includes CORS handling
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
 # Health check endpoint
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy", "service": "time-notes-api"}
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """Prometheus text exposition of request, database and file I/O metrics"""
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -47,11 +68,75 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+TOMBSTONE_PRUNE_INTERVAL = 3600  # seconds
+tombstone_pruner = None
+
+async def prune_tombstones_periodically():
+    """Drop tombstones of long-deleted memos; clients older than that resync"""
+    from database import memo_db
+    while True:
+        try:
+            pruned = await memo_db.prune_tombstones()
+            if pruned:
+                logger.info(f"Pruned {pruned} memo tombstones")
+        except Exception as e:
+            logger.warning(f"Failed to prune memo tombstones: {e}")
+        await asyncio.sleep(TOMBSTONE_PRUNE_INTERVAL)
+
 @app.on_event("startup")
 async def startup_db_client():
     logger.info("Starting up Time Notes API...")
+    from database import memo_db
+    from file_handler import FileHandler
+    await FileHandler.prepare_storage()
+    await memo_db.ensure_indexes()
+    if admission.RATE_LIMIT_ENABLED and not admission.TRUST_FORWARDED_FOR:
+        logger.warning("Rate limits key clients by socket address; behind a proxy set RATE_LIMIT_TRUST_FORWARDED_FOR=true")
+    
+    # QUERY_PLAN_CHECK=log|fail explains every memo query and reports collection scans
+    plan_check = os.environ.get("QUERY_PLAN_CHECK", "off").lower()
+    if plan_check in ("log", "fail"):
+        await memo_db.verify_query_plans(fail=plan_check == "fail")
+    
+    await memo_db.search_index.load(memo_db.collection)
+    
+    from scheduler import alarm_scheduler
+    from events import event_hub
+    alarm_scheduler.add_listener(event_hub.alarm_due)
+    await alarm_scheduler.load(memo_db.collection)
+    alarm_scheduler.start()
+    
+    # Memo writes (from this or, with a change stream, any worker) reach in-process state here
+    from change_stream import change_feed
+    change_feed.add_listener(memo_db.apply_change)
+    change_feed.add_listener(alarm_scheduler.memo_changed)
+    change_feed.add_listener(event_hub.memo_changed)
+    await change_feed.start(memo_db.collection, db.sync_state)
+    
+    metrics.gauge_function("sse_clients", "Connected event stream clients", lambda: len(event_hub))
+    metrics.gauge_function("scheduled_alarms", "Alarms waiting in the scheduler", lambda: len(alarm_scheduler))
+    metrics.gauge_function("search_index_documents", "Memos in the search index", lambda: len(memo_db.search_index))
+    
+    global tombstone_pruner
+    tombstone_pruner = asyncio.create_task(prune_tombstones_periodically())
+    
+    from image_gc import image_gc, IMAGE_GC_ENABLED
+    if IMAGE_GC_ENABLED:
+        image_gc.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if tombstone_pruner is not None:
+        tombstone_pruner.cancel()
+    from image_gc import image_gc
+    await image_gc.stop()
+    from change_stream import change_feed
+    await change_feed.stop()
+    from scheduler import alarm_scheduler
+    await alarm_scheduler.stop()
+    from file_handler import image_variants
+    image_variants.shutdown()
+    from storage import storage
+    storage.shutdown()
     client.close()
     logger.info("Shutting down Time Notes API...")
\ No newline at end of file
@@ -0,0 +1,448 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+
+from metrics import FILE_IO_ACTIVE, FILE_IO_QUEUED, FILE_IO_QUEUE_WAIT_SECONDS, FILE_IO_WAITING
+
+logger = logging.getLogger(__name__)
+
+# Threads doing filesystem I/O, and calls allowed to wait for one before callers queue in the event loop
+FILE_IO_WORKERS = int(os.environ.get("FILE_IO_WORKERS", "8"))
+FILE_IO_MAX_PENDING = int(os.environ.get("FILE_IO_MAX_PENDING", "256"))
+
+class AsyncFile:
+    """A file whose reads and writes run on the storage executor"""
+
+    def __init__(self, storage: "LocalFileStorage", path: Path, mode: str):
+        self._storage = storage
+        self._path = path
+        self._mode = mode
+        self._file = None
+
+    async def __aenter__(self) -> "AsyncFile":
+        self._file = await self._storage.run(open, self._path, self._mode)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._storage.run(self._file.close)
+
+    async def read(self, size: int = -1) -> bytes:
+        return await self._storage.run(self._file.read, size)
+
+    async def write(self, data: bytes) -> int:
+        return await self._storage.run(self._file.write, data)
+
+    async def seek(self, offset: int) -> int:
+        return await self._storage.run(self._file.seek, offset)
+
+class LocalFileStorage:
+    """Async access to the local filesystem through a dedicated, bounded thread pool.
+
+    Blocking calls never run on the event loop, and a slow disk only ties
+    up this pool: at most ``max_pending`` calls are handed to the threads,
+    further callers wait asynchronously, and the queue depth is exported
+    as metrics.
+    """
+
+    def __init__(self, max_workers: int = FILE_IO_WORKERS, max_pending: int = FILE_IO_MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="file-io")
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """Call func(*args) on the storage thread pool"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        FILE_IO_WAITING.inc()
+        try:
+            await self._slots.acquire()
+        finally:
+            FILE_IO_WAITING.dec()
+        try:
+            submitted = time.perf_counter()
+
+            def call():
+                FILE_IO_QUEUED.dec()
+                FILE_IO_ACTIVE.inc()
+                FILE_IO_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - submitted)
+                try:
+                    return func(*args)
+                finally:
+                    FILE_IO_ACTIVE.dec()
+
+            FILE_IO_QUEUED.inc()
+            future = self.executor.submit(call)
+            future.add_done_callback(self._dequeue_cancelled)
+            return await asyncio.wrap_future(future)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _dequeue_cancelled(future: Future):
+        # A call cancelled before it started never ran its own bookkeeping
+        if future.cancelled():
+            FILE_IO_QUEUED.dec()
+
+    def open(self, path: Path, mode: str = "rb") -> AsyncFile:
+        return AsyncFile(self, path, mode)
+
+    async def stat(self, path: Path) -> Optional[os.stat_result]:
+        """stat() a path; None if it does not exist"""
+        try:
+            return await self.run(os.stat, path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    async def exists(self, path: Path) -> bool:
+        return await self.run(os.path.exists, path)
+
+    async def replace(self, source: Path, target: Path):
+        await self.run(os.replace, source, target)
+
+    async def remove(self, path: Path) -> bool:
+        """Delete a file; False if it did not exist"""
+        try:
+            await self.run(os.remove, path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    async def makedirs(self, path: Path):
+        await self.run(lambda: Path(path).mkdir(parents=True, exist_ok=True))
+
+    async def rmtree(self, path: Path):
+        await self.run(shutil.rmtree, path, True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Global storage instance shared by FileHandler, image variants and file responses
+storage = LocalFileStorage()
+
+# Uploaded files are never rewritten under the same key, so clients and CDNs may keep them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+EXISTS_CACHE_TTL = 60.0
+EXISTS_CACHE_SIZE = 4096
+
+class StorageBackend:
+    """Where uploaded images and their variants live, addressed by key.
+
+    Keys are flat names such as ``photo.jpg`` or ``variants/photo_w320.webp``.
+    Files are staged on local disk first and handed over with put_file().
+    """
+
+    async def prepare(self):
+        """Create whatever the backend needs before the first request"""
+
+    async def put_file(self, key: str, source: Path, content_type: Optional[str] = None):
+        """Store a finished local file under key, consuming the file"""
+        raise NotImplementedError
+
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    async def delete(self, *keys: str):
+        """Delete keys; missing ones are ignored"""
+        raise NotImplementedError
+
+    async def download_to(self, key: str, target: Path):
+        """Copy an object to a local file"""
+        raise NotImplementedError
+
+    async def modified(self, key: str) -> Optional[float]:
+        """Last modification time (epoch seconds), or None if the key does not exist"""
+        raise NotImplementedError
+
+    async def touch(self, key: str) -> bool:
+        """Bump the modification time, e.g. when a deduplicated upload reuses the object; False if it is gone"""
+        raise NotImplementedError
+
+    async def delete_if_older(self, key: str, cutoff: float) -> bool:
+        """Delete an original last modified before cutoff (epoch seconds); False if it is newer or gone.
+
+        This default checks and then deletes, so a touch landing in between
+        is lost; backends that can do better override it.
+        """
+        modified = await self.modified(key)
+        if modified is None or modified >= cutoff:
+            return False
+        await self.delete(key)
+        return True
+
+    def list_keys(self, page_size: int = 1000) -> AsyncIterator[List[Tuple[str, float]]]:
+        """Pages of (key, modified) for every original image; variants are not listed"""
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Path of the object on this machine's disk, if it lives there"""
+        return None
+
+    async def download_url(self, key: str) -> Optional[str]:
+        """URL the client can fetch the object from directly, or None to serve it from this process"""
+        return None
+
+class LocalStorageBackend(StorageBackend):
+    """Objects as files under one directory.
+
+    With ``public_base_url`` (e.g. a CDN or nginx location serving the
+    directory), downloads are redirected there instead of streamed by Python.
+    """
+
+    def __init__(self, root: Path, public_base_url: Optional[str] = None, io: LocalFileStorage = storage):
+        self.root = root
+        self.public_base_url = public_base_url.rstrip("/") if public_base_url else None
+        self.io = io
+
+    async def prepare(self):
+        await self.io.makedirs(self.root / "variants")
+
+    async def put_file(self, key: str, source: Path, content_type: Optional[str] = None):
+        # Atomic rename so readers never see a partial image
+        await self.io.replace(source, self.root / key)
+
+    async def exists(self, key: str) -> bool:
+        return await self.io.exists(self.root / key)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            await self.io.remove(self.root / key)
+
+    async def download_to(self, key: str, target: Path):
+        await self.io.run(shutil.copyfile, self.root / key, target)
+
+    async def modified(self, key: str) -> Optional[float]:
+        stat_result = await self.io.stat(self.root / key)
+        return stat_result.st_mtime if stat_result else None
+
+    async def touch(self, key: str) -> bool:
+        try:
+            await self.io.run(os.utime, self.root / key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    async def delete_if_older(self, key: str, cutoff: float) -> bool:
+        # Move the file aside first: a touch from now on finds it gone and stores it again,
+        # and a touch that came just before shows up in the moved file's mtime
+        path = self.root / key
+        parked = self.root / f".{uuid.uuid4()}.part"
+        try:
+            await self.io.replace(path, parked)
+        except FileNotFoundError:
+            return False
+        stat_result = await self.io.stat(parked)
+        if stat_result is not None and stat_result.st_mtime >= cutoff:
+            await self.io.replace(parked, path)
+            return False
+        await self.io.remove(parked)
+        return True
+
+    def _scan(self) -> List[Tuple[str, float]]:
+        # Dotfiles are staged uploads and scratch space, not images
+        with os.scandir(self.root) as entries:
+            return [
+                (entry.name, entry.stat().st_mtime) for entry in entries
+                if entry.is_file() and not entry.name.startswith(".")
+            ]
+
+    async def list_keys(self, page_size: int = 1000) -> AsyncIterator[List[Tuple[str, float]]]:
+        entries = await self.io.run(self._scan)
+        for start in range(0, len(entries), page_size):
+            yield entries[start:start + page_size]
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self.root / key
+
+    async def download_url(self, key: str) -> Optional[str]:
+        return f"{self.public_base_url}/{key}" if self.public_base_url else None
+
+class S3StorageBackend(StorageBackend):
+    """Objects in an S3-compatible bucket (AWS S3, MinIO, ...).
+
+    boto3 calls run on the storage thread pool through one client, whose
+    connection pool is sized to match. Downloads are presigned GET URLs
+    (or ``public_base_url`` for a public bucket or CDN), so image bytes
+    never pass through this process.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        prefix: str = "",
+        presign_expiry: int = 3600,
+        public_base_url: Optional[str] = None,
+        io: LocalFileStorage = storage
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.presign_expiry = presign_expiry
+        self.public_base_url = public_base_url.rstrip("/") if public_base_url else None
+        self.io = io
+        # Positive HEAD results and presigned URLs are reused to save round trips
+        self._exists: "OrderedDict[str, float]" = OrderedDict()
+        self._urls: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def _object_key(self, key: str) -> str:
+        return self.prefix + key
+
+    @staticmethod
+    def _remember(cache: OrderedDict, key: str, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > EXISTS_CACHE_SIZE:
+            cache.popitem(last=False)
+
+    async def prepare(self):
+        try:
+            await self.io.run(lambda: self.client.head_bucket(Bucket=self.bucket))
+        except Exception as e:
+            logger.warning(f"S3 bucket {self.bucket} is not reachable yet: {e}")
+
+    async def put_file(self, key: str, source: Path, content_type: Optional[str] = None):
+        extra_args = {"CacheControl": IMMUTABLE_CACHE_CONTROL}
+        if content_type:
+            extra_args["ContentType"] = content_type
+        # upload_file streams from disk; uploads are capped at MAX_FILE_SIZE (5MB), the S3 minimum
+        # part size, so they always go up in a single PUT and multipart settings would never apply
+        await self.io.run(lambda: self.client.upload_file(
+            str(source), self.bucket, self._object_key(key), ExtraArgs=extra_args
+        ))
+        await self.io.remove(source)
+        self._remember(self._exists, key, time.monotonic())
+
+    async def exists(self, key: str) -> bool:
+        checked_at = self._exists.get(key)
+        if checked_at is not None and time.monotonic() - checked_at < EXISTS_CACHE_TTL:
+            return True
+
+        from botocore.exceptions import ClientError
+        try:
+            await self.io.run(lambda: self.client.head_object(Bucket=self.bucket, Key=self._object_key(key)))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                self._exists.pop(key, None)
+                return False
+            raise
+        self._remember(self._exists, key, time.monotonic())
+        return True
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._exists.pop(key, None)
+            self._urls.pop(key, None)
+        # delete_objects takes at most 1000 keys per request
+        for start in range(0, len(keys), 1000):
+            objects = [{"Key": self._object_key(key)} for key in keys[start:start + 1000]]
+            await self.io.run(lambda: self.client.delete_objects(
+                Bucket=self.bucket, Delete={"Objects": objects, "Quiet": True}
+            ))
+
+    async def download_to(self, key: str, target: Path):
+        await self.io.run(lambda: self.client.download_file(self.bucket, self._object_key(key), str(target)))
+
+    async def modified(self, key: str) -> Optional[float]:
+        from botocore.exceptions import ClientError
+        try:
+            head = await self.io.run(lambda: self.client.head_object(Bucket=self.bucket, Key=self._object_key(key)))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head["LastModified"].timestamp()
+
+    async def touch(self, key: str) -> bool:
+        # S3 has no utime; copying an object onto itself refreshes LastModified
+        from botocore.exceptions import ClientError
+        object_key = self._object_key(key)
+        try:
+            head = await self.io.run(lambda: self.client.head_object(Bucket=self.bucket, Key=object_key))
+            await self.io.run(lambda: self.client.copy_object(
+                Bucket=self.bucket, Key=object_key,
+                CopySource={"Bucket": self.bucket, "Key": object_key},
+                MetadataDirective="REPLACE",
+                CacheControl=IMMUTABLE_CACHE_CONTROL,
+                ContentType=head.get("ContentType", "binary/octet-stream"),
+            ))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                self._exists.pop(key, None)
+                return False
+            raise
+        return True
+
+    async def list_keys(self, page_size: int = 1000) -> AsyncIterator[List[Tuple[str, float]]]:
+        # The delimiter keeps variants/ (a "directory") out of the listing
+        request = {"Bucket": self.bucket, "Prefix": self.prefix, "Delimiter": "/", "MaxKeys": page_size}
+        while True:
+            response = await self.io.run(lambda: self.client.list_objects_v2(**request))
+            yield [
+                (item["Key"][len(self.prefix):], item["LastModified"].timestamp())
+                for item in response.get("Contents", [])
+            ]
+            if not response.get("IsTruncated"):
+                return
+            request["ContinuationToken"] = response["NextContinuationToken"]
+
+    async def download_url(self, key: str) -> Optional[str]:
+        if self.public_base_url:
+            return f"{self.public_base_url}/{self._object_key(key)}"
+
+        # Reusing a URL for half its lifetime lets browsers cache the image under it
+        now = time.monotonic()
+        cached = self._urls.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+        url = self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+            ExpiresIn=self.presign_expiry
+        )
+        self._remember(self._urls, key, (now + self.presign_expiry / 2, url))
+        return url
+
+def create_storage_backend(upload_dir: Path) -> StorageBackend:
+    """Local disk under upload_dir, or S3 when IMAGE_STORAGE=s3"""
+    kind = os.environ.get("IMAGE_STORAGE", "local").lower()
+    if kind == "local":
+        return LocalStorageBackend(upload_dir, public_base_url=os.environ.get("IMAGE_PUBLIC_BASE_URL"))
+    if kind != "s3":
+        raise ValueError(f"Unknown IMAGE_STORAGE: {kind}")
+
+    import boto3
+    from botocore.config import Config
+
+    client = boto3.client(
+        "s3",
+        endpoint_url=os.environ.get("S3_ENDPOINT_URL") or None,
+        region_name=os.environ.get("S3_REGION") or None,
+        config=Config(
+            max_pool_connections=int(os.environ.get("S3_MAX_POOL_CONNECTIONS", str(FILE_IO_WORKERS * 2))),
+            retries={"max_attempts": 3, "mode": "standard"},
+            s3={"addressing_style": os.environ.get("S3_ADDRESSING_STYLE", "auto")},
+        )
+    )
+    return S3StorageBackend(
+        client,
+        bucket=os.environ["S3_BUCKET"],
+        prefix=os.environ.get("S3_PREFIX", ""),
+        presign_expiry=int(os.environ.get("S3_PRESIGN_EXPIRY", "3600")),
+        public_base_url=os.environ.get("S3_PUBLIC_BASE_URL"),
+    )
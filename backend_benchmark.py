@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Load-testing benchmark for the Time Notes API.
+Runs concurrent async clients over a weighted mix of memo and image
+operations and reports throughput and latency percentiles as JSON.
+
+By default the FastAPI app is driven in-process against mongomock-motor;
+pass --url to benchmark a running server (e.g. local uvicorn) instead.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+
+DEFAULT_MIX = "list=50,get=10,create=10,update=10,toggle=10,upload=5,download=5"
+# Admission control rejections are reported apart from errors
+THROTTLED_STATUSES = (429, 503)
+
+def parse_mix(text):
+    """Parse "op=weight,..." into a dict of weights"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit(f"Unknown operations in mix: {', '.join(sorted(unknown))}")
+    return mix
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def make_png(width=800, height=600):
+    """Build a realistic-size photo-like PNG"""
+    from PIL import Image
+    image = Image.effect_noise((width, height), 64).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+def random_memo(rng):
+    alarm_enabled = rng.random() < 0.3
+    return {
+        "title": f"Benchmark memo {rng.randrange(10**6)}",
+        "content": "Lorem ipsum dolor sit amet. " * rng.randint(1, 60),
+        "type": "text",
+        "alarm": {
+            "enabled": alarm_enabled,
+            "time": (datetime.utcnow() + timedelta(hours=rng.randint(1, 240))).isoformat() if alarm_enabled else None
+        }
+    }
+
+class BenchmarkState:
+    """Memo ids and image filenames the clients can act on"""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.memo_ids = []
+        self.images = []
+        self.png = None
+
+async def op_list(client, state):
+    return await client.get("/api/memos", params={"limit": 50})
+
+async def op_get(client, state):
+    if not state.memo_ids:
+        return await op_create(client, state)
+    return await client.get(f"/api/memos/{state.rng.choice(state.memo_ids)}")
+
+async def op_create(client, state):
+    response = await client.post("/api/memos", json=random_memo(state.rng))
+    if response.status_code == 200:
+        state.memo_ids.append(response.json()["id"])
+    return response
+
+async def op_update(client, state):
+    if not state.memo_ids:
+        return await op_create(client, state)
+    memo_id = state.rng.choice(state.memo_ids)
+    return await client.put(f"/api/memos/{memo_id}", json={"content": f"Updated at {time.time()}"})
+
+async def op_toggle(client, state):
+    if not state.memo_ids:
+        return await op_create(client, state)
+    return await client.post(f"/api/memos/{state.rng.choice(state.memo_ids)}/toggle-alarm")
+
+async def op_upload(client, state):
+    files = {"file": ("bench.png", state.png, "image/png")}
+    response = await client.post("/api/upload-image", files=files)
+    if response.status_code == 200:
+        state.images.append(response.json()["filename"])
+    return response
+
+async def op_download(client, state):
+    if not state.images:
+        return await op_upload(client, state)
+    return await client.get(f"/api/images/{state.rng.choice(state.images)}")
+
+OPERATIONS = {
+    "list": op_list,
+    "get": op_get,
+    "create": op_create,
+    "update": op_update,
+    "toggle": op_toggle,
+    "upload": op_upload,
+    "download": op_download,
+}
+
+async def seed(client, state, count):
+    for _ in range(count):
+        response = await op_create(client, state)
+        response.raise_for_status()
+    await op_upload(client, state)
+
+def outcome_of(status_code):
+    """ok, throttled (429/503 from admission control) or error"""
+    if status_code in THROTTLED_STATUSES:
+        return "throttled"
+    return "ok" if status_code < 400 else "error"
+
+async def worker(client, state, mix, deadline, remaining, samples):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.perf_counter() < deadline:
+        if remaining is not None:
+            if remaining[0] <= 0:
+                return
+            remaining[0] -= 1
+        name = state.rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = await OPERATIONS[name](client, state)
+            outcome = outcome_of(response.status_code)
+            size = len(response.content)
+        except httpx.HTTPError:
+            outcome, size = "error", 0
+        samples.append((name, time.perf_counter() - start, outcome, size))
+
+def summarize(samples, elapsed):
+    def stats(entries):
+        latencies = sorted(latency for _, latency, _, _ in entries)
+        return {
+            "count": len(entries),
+            "errors": sum(1 for _, _, outcome, _ in entries if outcome == "error"),
+            "throttled": sum(1 for _, _, outcome, _ in entries if outcome == "throttled"),
+            "rps": round(len(entries) / elapsed, 2) if elapsed else None,
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else None,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+            "max_ms": round(latencies[-1] * 1000, 3) if latencies else None,
+            "bytes_in": sum(size for _, _, _, size in entries),
+        }
+
+    operations = {}
+    for name in sorted({name for name, _, _, _ in samples}):
+        operations[name] = stats([sample for sample in samples if sample[0] == name])
+    return {"overall": stats(samples), "operations": operations}
+
+def benchmark_serialization(sizes, rounds):
+    """Per-request CPU of the response_model path versus FastJSONResponse for large lists"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from typing import List
+    from bson import ObjectId
+    from pydantic import TypeAdapter
+    from models import MemoResponse
+    from serialization import dumps
+
+    rng = random.Random(1)
+    adapter = TypeAdapter(List[MemoResponse])
+
+    def response_model_path(memos):
+        # What FastAPI does for response_model=List[MemoResponse]
+        validated = adapter.validate_python(memos)
+        return json.dumps(adapter.dump_python(validated, mode="json")).encode()
+
+    results = {}
+    for size in sizes:
+        memos = []
+        for _ in range(size):
+            memo = random_memo(rng)
+            if memo["alarm"]["time"]:
+                memo["alarm"]["time"] = datetime.fromisoformat(memo["alarm"]["time"])
+            memos.append({**memo, "id": str(ObjectId()), "image": None,
+                          "created_at": datetime.utcnow(), "updated_at": datetime.utcnow()})
+
+        timings = {}
+        for name, serialize in (("response_model", response_model_path), ("orjson", dumps)):
+            serialize(memos)  # warm up
+            start = time.process_time()
+            for _ in range(rounds):
+                body = serialize(memos)
+            timings[name] = {
+                "cpu_ms_per_request": round((time.process_time() - start) / rounds * 1000, 3),
+                "bytes": len(body),
+            }
+        timings["speedup"] = round(
+            timings["response_model"]["cpu_ms_per_request"] / max(timings["orjson"]["cpu_ms_per_request"], 1e-6), 1
+        )
+        results[str(size)] = timings
+        print(f"{size:>6} memos: response_model {timings['response_model']['cpu_ms_per_request']:>8.2f} ms"
+              f"   orjson {timings['orjson']['cpu_ms_per_request']:>8.2f} ms   x{timings['speedup']}")
+    return {"timestamp": datetime.utcnow().isoformat() + "Z", "serialization": results}
+
+def load_app(mongo):
+    """Import the FastAPI app in-process, backed by mongomock-motor unless a Mongo URL is given"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="time-notes-bench-"))
+    os.environ.setdefault("DB_NAME", "time_notes_benchmark")
+    # Even if the environment enables it: one in-process client would exhaust its own rate limit
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    if mongo == "mock":
+        import motor.motor_asyncio
+        from mongomock_motor import AsyncMongoMockClient
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+        os.environ["MONGO_URL"] = "mongodb://mongomock"
+    else:
+        os.environ["MONGO_URL"] = mongo
+
+    from server import app
+    return app
+
+async def run(args):
+    state = BenchmarkState(args.seed)
+    state.png = make_png()
+    mix = parse_mix(args.mix)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    app = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30)
+    else:
+        app = load_app(args.mongo)
+        await app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=30)
+
+    try:
+        async with client:
+            await seed(client, state, args.seed_memos)
+
+            samples = []
+            remaining = [args.requests] if args.requests else None
+            start = time.perf_counter()
+            deadline = start + args.duration if not args.requests else float("inf")
+            await asyncio.gather(*[
+                worker(client, state, mix, deadline, remaining, samples)
+                for _ in range(args.concurrency)
+            ])
+            elapsed = time.perf_counter() - start
+    finally:
+        if app is not None:
+            await app.router.shutdown()
+
+    return {
+        "label": args.label,
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "config": {
+            "target": args.url or f"in-process ({'mongomock' if args.mongo == 'mock' else 'mongodb'})",
+            "concurrency": args.concurrency,
+            "duration_s": args.duration if not args.requests else None,
+            "requests": args.requests,
+            "mix": mix,
+            "seed_memos": args.seed_memos,
+            "seed": args.seed,
+        },
+        "elapsed_s": round(elapsed, 3),
+        **summarize(samples, elapsed),
+    }
+
+def print_report(result, baseline=None):
+    header = f"{'operation':<10} {'count':>7} {'err':>5} {'thr':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(result["operations"].items()) + [("overall", result["overall"])]
+    for name, stats in rows:
+        line = (f"{name:<10} {stats['count']:>7} {stats['errors']:>5} {stats.get('throttled', 0):>5} {stats['rps']:>9.1f} "
+                f"{stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}")
+        if baseline:
+            base = baseline["overall"] if name == "overall" else baseline["operations"].get(name)
+            if base and base.get("p95_ms"):
+                change = (stats["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100
+                line += f"   p95 {change:+.1f}% vs baseline"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--mongo", default="mock", help='"mock" for mongomock-motor or a MongoDB URL (in-process only)')
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests instead of --duration")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weighted operation mix (default: {DEFAULT_MIX})")
+    parser.add_argument("--seed-memos", type=int, default=500, help="Memos created before measuring")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    parser.add_argument("--label", default="", help="Label stored with the results")
+    parser.add_argument("--output", help="Write results JSON to this file")
+    parser.add_argument("--compare", help="Previous results JSON to compare p95 latency against")
+    parser.add_argument("--serialization", action="store_true",
+                        help="Only compare response serialization CPU for large memo lists")
+    args = parser.parse_args()
+
+    if args.serialization:
+        result = benchmark_serialization([50, 500, 1000, 5000], rounds=20)
+        if args.output:
+            Path(args.output).write_text(json.dumps(result, indent=2))
+        return
+
+    result = asyncio.run(run(args))
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(result, baseline)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
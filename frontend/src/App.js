@@ -6,7 +6,7 @@ import Layout from './components/Layout';
 import MemoList from './components/MemoList';
 import MemoModal from './components/MemoModal';
 import NotificationSystem from './components/NotificationSystem';
-import { memoApi } from './services/api';
+import { memoApi, eventsApi } from './services/api';
 import { useToast } from './hooks/use-toast';
 import "./App.css";
 
@@ -15,6 +15,8 @@ function AppContent() {
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [editingMemo, setEditingMemo] = useState(null);
   const [isLoading, setIsLoading] = useState(true);
+  const [hasMore, setHasMore] = useState(false);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const { toast } = useToast();
 
   // Load memos on component mount
@@ -22,11 +24,27 @@ function AppContent() {
     loadMemos();
   }, []);
 
+  // Apply memo changes pushed by the server (e.g. from other tabs)
+  useEffect(() => {
+    const upsert = (memo) => setMemos(prev => (
+      prev.some(m => m.id === memo.id)
+        ? prev.map(m => m.id === memo.id ? memo : m)
+        : [memo, ...prev]
+    ));
+    return eventsApi.subscribe({
+      'memo.created': upsert,
+      'memo.updated': upsert,
+      'memo.deleted': ({ id }) => setMemos(prev => prev.filter(m => m.id !== id)),
+      'resync': () => loadMemos(),
+    });
+  }, []);
+
   const loadMemos = async () => {
     try {
       setIsLoading(true);
       const data = await memoApi.getMemos();
-      setMemos(data);
+      setMemos(data.memos);
+      setHasMore(data.hasMore);
     } catch (error) {
       toast({
         title: "Error",
@@ -38,6 +56,27 @@ function AppContent() {
     }
   };
 
+  const loadMoreMemos = async () => {
+    try {
+      setIsLoadingMore(true);
+      const data = await memoApi.loadMoreMemos();
+      // Keep memos added locally or by server events since the last load
+      setMemos(prev => {
+        const known = new Set(prev.map(m => m.id));
+        return prev.concat(data.memos.filter(m => !known.has(m.id)));
+      });
+      setHasMore(data.hasMore);
+    } catch (error) {
+      toast({
+        title: "Error",
+        description: error.message,
+        variant: "destructive"
+      });
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   const handleCreateMemo = () => {
     setEditingMemo(null);
     setIsModalOpen(true);
@@ -132,6 +171,9 @@ function AppContent() {
           onEdit={handleEditMemo}
           onDelete={handleDeleteMemo}
           onToggleAlarm={handleToggleAlarm}
+          hasMore={hasMore}
+          isLoadingMore={isLoadingMore}
+          onLoadMore={loadMoreMemos}
         />
         
         <MemoModal
@@ -25,7 +25,7 @@ const MemoCard = ({ memo, onEdit, onDelete, onToggleAlarm }) => {
     return diff > 0 && diff <= 24 * 60 * 60 * 1000; // Within 24 hours
   };
 
-  const getImageUrl = (imageFilename) => {
+  const getImageUrl = (imageFilename, width) => {
     if (!imageFilename) return null;
     
     // If it's already a full URL, return as is
@@ -34,7 +34,7 @@ const MemoCard = ({ memo, onEdit, onDelete, onToggleAlarm }) => {
     }
     
     // Otherwise, construct the API URL
-    return imageApi.getImageUrl(imageFilename);
+    return imageApi.getImageUrl(imageFilename, width);
   };
 
   return (
@@ -60,8 +60,9 @@ const MemoCard = ({ memo, onEdit, onDelete, onToggleAlarm }) => {
         {memo.image && (
           <div className="mb-3 rounded-lg overflow-hidden">
             <img 
-              src={getImageUrl(memo.image)} 
+              src={getImageUrl(memo.image, 640)} 
               alt="Memo" 
+              loading="lazy"
               className="w-full h-32 object-cover hover:scale-105 transition-transform duration-300"
               onError={(e) => {
                 e.target.style.display = 'none';
@@ -1,30 +1,65 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import { Search, Filter, Grid3X3, List, SortAsc } from 'lucide-react';
 import { Input } from './ui/input';
 import { Button } from './ui/button';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from './ui/select';
 import { Badge } from './ui/badge';
 import MemoCard from './MemoCard';
+import { memoApi } from '../services/api';
 
-const MemoList = ({ memos, onEdit, onDelete, onToggleAlarm }) => {
+// Wait for typing to pause before asking the server
+const SEARCH_DELAY_MS = 250;
+
+const MemoList = ({ memos, onEdit, onDelete, onToggleAlarm, hasMore, isLoadingMore, onLoadMore }) => {
   const [searchQuery, setSearchQuery] = useState('');
   const [filterType, setFilterType] = useState('all');
   const [sortBy, setSortBy] = useState('recent');
   const [viewMode, setViewMode] = useState('grid');
+  // Server-side results for the current query, which cover memos that are not loaded yet
+  const [searchResults, setSearchResults] = useState(null);
+  const [searchError, setSearchError] = useState(null);
+
+  const query = searchQuery.trim();
+
+  useEffect(() => {
+    if (!query) {
+      setSearchResults(null);
+      setSearchError(null);
+      return undefined;
+    }
+    let cancelled = false;
+    const filters = {
+      type: filterType === 'text' || filterType === 'image' ? filterType : undefined,
+      alarm: filterType === 'alarm' ? true : undefined,
+    };
+    // Re-run when memos change so edits show up in the results
+    const timer = setTimeout(() => {
+      memoApi.searchMemos(query, filters)
+        .then(result => {
+          if (!cancelled) {
+            setSearchResults(result);
+            setSearchError(null);
+          }
+        })
+        .catch(error => {
+          if (!cancelled) setSearchError(error.message);
+        });
+    }, SEARCH_DELAY_MS);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [query, filterType, memos]);
 
-  // Filter and sort memos
-  const filteredMemos = memos
-    .filter(memo => {
-      const matchesSearch = memo.title.toLowerCase().includes(searchQuery.toLowerCase()) ||
-                          memo.content.toLowerCase().includes(searchQuery.toLowerCase());
-      
-      const matchesFilter = filterType === 'all' || 
-                          (filterType === 'text' && !memo.image) ||
-                          (filterType === 'image' && memo.image) ||
-                          (filterType === 'alarm' && memo.alarm?.enabled);
-      
-      return matchesSearch && matchesFilter;
-    })
+  // Without a query, filtering and sorting apply to the memos loaded so far
+  const searching = Boolean(query);
+  const filteredMemos = (searching ? (searchResults?.memos || []) : memos)
+    .filter(memo => (
+      searching || filterType === 'all' ||
+      (filterType === 'text' && !memo.image) ||
+      (filterType === 'image' && memo.image) ||
+      (filterType === 'alarm' && memo.alarm?.enabled)
+    ))
     .sort((a, b) => {
       switch (sortBy) {
         case 'recent':
@@ -111,21 +146,41 @@ const MemoList = ({ memos, onEdit, onDelete, onToggleAlarm }) => {
       {/* Stats */}
       <div className="flex space-x-4 text-sm">
         <Badge variant="secondary" className="flex items-center space-x-1">
-          <span>Total: {memos.length}</span>
+          <span>{hasMore ? 'Loaded' : 'Total'}: {memos.length}</span>
         </Badge>
         <Badge variant="secondary" className="flex items-center space-x-1">
-          <span>Alarms: {alarmCount}</span>
+          <span>{hasMore ? 'Alarms in loaded' : 'Alarms'}: {alarmCount}</span>
         </Badge>
         <Badge variant="secondary" className="flex items-center space-x-1">
-          <span>With Images: {imageCount}</span>
+          <span>{hasMore ? 'With images in loaded' : 'With Images'}: {imageCount}</span>
         </Badge>
         <Badge variant="secondary" className="flex items-center space-x-1">
-          <span>Found: {filteredMemos.length}</span>
+          <span>
+            {searching
+              ? `Found: ${searchResults ? searchResults.total : '...'}`
+              : `${hasMore ? 'Shown of loaded' : 'Shown'}: ${filteredMemos.length}`}
+          </span>
         </Badge>
       </div>
 
+      {searching && searchResults && searchResults.total > searchResults.memos.length && (
+        <p className="text-sm text-muted-foreground">
+          Showing the best {searchResults.memos.length} of {searchResults.total} matches
+        </p>
+      )}
+      {!searching && hasMore && (filterType !== 'all' || sortBy !== 'recent') && (
+        <p className="text-sm text-muted-foreground">
+          Filters and sorting apply to loaded memos; load more or search to cover all of them
+        </p>
+      )}
+      {searchError && (
+        <p className="text-sm text-destructive">{searchError}</p>
+      )}
+
       {/* Memo Grid/List */}
-      {filteredMemos.length === 0 ? (
+      {searching && !searchResults && !searchError ? (
+        <p className="text-center py-12 text-muted-foreground">Searching...</p>
+      ) : filteredMemos.length === 0 ? (
         <div className="text-center py-12">
           <div className="w-16 h-16 bg-gradient-to-br from-gray-100 to-gray-200 dark:from-gray-800 dark:to-gray-700 rounded-full flex items-center justify-center mx-auto mb-4">
             <Search className="w-8 h-8 text-muted-foreground" />
@@ -155,6 +210,14 @@ const MemoList = ({ memos, onEdit, onDelete, onToggleAlarm }) => {
           ))}
         </div>
       )}
+
+      {hasMore && (
+        <div className="flex justify-center">
+          <Button variant="outline" onClick={onLoadMore} disabled={isLoadingMore}>
+            {isLoadingMore ? 'Loading...' : 'Load more'}
+          </Button>
+        </div>
+      )}
     </div>
   );
 };
@@ -1,58 +1,54 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Bell, X } from 'lucide-react';
 import { Button } from './ui/button';
 import { Card, CardContent } from './ui/card';
 import { useToast } from '../hooks/use-toast';
+import { eventsApi, memoApi } from '../services/api';
 
 const NotificationSystem = ({ memos }) => {
   const [notifications, setNotifications] = useState([]);
   const { toast } = useToast();
+  const memosRef = useRef(memos);
+  memosRef.current = memos;
 
+  // Alarms are scheduled on the server and pushed when they come due
   useEffect(() => {
-    const checkAlarms = () => {
-      const now = new Date();
-      const activeNotifications = [];
-
-      memos.forEach(memo => {
-        if (memo.alarm?.enabled && memo.alarm.time) {
-          const alarmTime = new Date(memo.alarm.time);
-          const timeDiff = alarmTime.getTime() - now.getTime();
-          
-          // Show notification if alarm is within 1 minute
-          if (timeDiff <= 60000 && timeDiff > 0) {
-            const existingNotif = notifications.find(n => n.memoId === memo.id);
-            if (!existingNotif) {
-              activeNotifications.push({
-                id: `notif-${memo.id}-${Date.now()}`,
-                memoId: memo.id,
-                title: memo.title,
-                message: `Reminder: ${memo.title}`,
-                time: alarmTime.toISOString(),
-                read: false,
-                created: now.toISOString()
-              });
-            }
+    return eventsApi.subscribe({
+      'alarm.due': async ({ memo_id, time }) => {
+        const due = new Date(time.endsWith('Z') ? time : `${time}Z`);
+        let memo = memosRef.current.find(m => m.id === memo_id);
+        if (!memo) {
+          // Not among the loaded pages: look it up by its alarm time, which the server indexes
+          try {
+            const matches = await memoApi.queryMemos({
+              alarm_after: due.toISOString(),
+              alarm_before: new Date(due.getTime() + 1).toISOString(),
+            });
+            memo = matches.find(m => m.id === memo_id);
+          } catch (error) {
+            return;
           }
         }
-      });
+        if (!memo) return;
 
-      if (activeNotifications.length > 0) {
-        setNotifications(prev => [...prev, ...activeNotifications]);
-        activeNotifications.forEach(notif => {
-          toast({
-            title: "⏰ Time Note Reminder",
-            description: notif.message,
-            duration: 5000
-          });
+        const notification = {
+          id: `notif-${memo.id}-${Date.now()}`,
+          memoId: memo.id,
+          title: memo.title,
+          message: `Reminder: ${memo.title}`,
+          time: due.toISOString(),
+          read: false,
+          created: new Date().toISOString()
+        };
+        setNotifications(prev => [...prev, notification]);
+        toast({
+          title: "⏰ Time Note Reminder",
+          description: notification.message,
+          duration: 5000
         });
       }
-    };
-
-    const interval = setInterval(checkAlarms, 30000); // Check every 30 seconds
-    checkAlarms(); // Initial check
-
-    return () => clearInterval(interval);
-  }, [memos, notifications, toast]);
+    });
+  }, [toast]);
 
   const dismissNotification = (id) => {
     setNotifications(prev => prev.filter(n => n.id !== id));
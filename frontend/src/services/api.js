@@ -11,19 +11,121 @@ const api = axios.create({
   },
 });
 
+// Memos loaded so far (the first pages, newest first), the collection version
+// they reflect and the cursor of the next page, for delta refreshes
+let memoSnapshot = null;
+
+const parseVersion = (etag) => {
+  const match = /"memos-(\d+)"/.exec(etag || '');
+  return match ? Number(match[1]) : null;
+};
+
+const newestFirst = (a, b) => (
+  a.created_at === b.created_at ? (a.id < b.id ? 1 : -1) : (a.created_at < b.created_at ? 1 : -1)
+);
+
+const snapshotResult = () => ({
+  memos: [...memoSnapshot.memos],
+  hasMore: Boolean(memoSnapshot.nextCursor),
+});
+
 // Memo API functions
 export const memoApi = {
-  // Get all memos
+  // Get the first page of memos; after the first load only the changes since the last one are fetched
   async getMemos() {
     try {
+      if (memoSnapshot && memoSnapshot.version !== null) {
+        const response = await api.get('/memos', {
+          params: { since: memoSnapshot.version },
+          headers: { 'If-None-Match': `"memos-${memoSnapshot.version}"` },
+          validateStatus: (status) => status === 200 || status === 304,
+        });
+        if (response.status === 304) {
+          return snapshotResult();
+        }
+        const delta = response.data;
+        if (!delta.resync) {
+          const changed = new Set([...delta.deleted, ...delta.memos.map(m => m.id)]);
+          const loaded = memoSnapshot.memos.filter(m => !changed.has(m.id));
+          // Changed memos older than the loaded pages arrive with their page instead
+          const oldest = memoSnapshot.memos[memoSnapshot.memos.length - 1];
+          const inWindow = delta.memos.filter(m => (
+            !memoSnapshot.nextCursor || !oldest || newestFirst(m, oldest) <= 0
+          ));
+          const memos = loaded.concat(inWindow);
+          memos.sort(newestFirst);
+          memoSnapshot = { ...memoSnapshot, version: delta.version, memos };
+          return snapshotResult();
+        }
+      }
+
       const response = await api.get('/memos');
-      return response.data;
+      memoSnapshot = {
+        version: parseVersion(response.headers['etag']),
+        memos: response.data,
+        nextCursor: response.headers['x-next-cursor'] || null,
+      };
+      return snapshotResult();
     } catch (error) {
       console.error('Failed to fetch memos:', error);
       throw new Error('Failed to fetch memos');
     }
   },
 
+  // Load the next page of memos after the ones already loaded
+  async loadMoreMemos() {
+    if (!memoSnapshot || !memoSnapshot.nextCursor) {
+      return memoSnapshot ? snapshotResult() : { memos: [], hasMore: false };
+    }
+    try {
+      const response = await api.get('/memos', {
+        params: { cursor: memoSnapshot.nextCursor },
+      });
+      const loaded = new Set(memoSnapshot.memos.map(m => m.id));
+      memoSnapshot = {
+        ...memoSnapshot,
+        memos: memoSnapshot.memos.concat(response.data.filter(m => !loaded.has(m.id))),
+        nextCursor: response.headers['x-next-cursor'] || null,
+      };
+      return snapshotResult();
+    } catch (error) {
+      console.error('Failed to load more memos:', error);
+      throw new Error('Failed to load more memos');
+    }
+  },
+
+  // Get the memos matching server-side filters, e.g. { alarm_after, alarm_before } for upcoming alarms
+  async queryMemos(filters) {
+    try {
+      const memos = [];
+      let cursor = null;
+      do {
+        const response = await api.get('/memos', {
+          params: cursor ? { ...filters, cursor } : filters,
+        });
+        memos.push(...response.data);
+        cursor = response.headers['x-next-cursor'] || null;
+      } while (cursor);
+      return memos;
+    } catch (error) {
+      console.error('Failed to query memos:', error);
+      throw new Error(error.response?.data?.detail || 'Failed to query memos');
+    }
+  },
+
+  // Full-text search over every memo on the server, best matches first; filters are { type, alarm }
+  async searchMemos(query, filters = {}) {
+    try {
+      const response = await api.get('/memos/search', {
+        params: { q: query, limit: 100, ...filters },
+      });
+      return { total: response.data.total, memos: response.data.results.map(hit => hit.memo) };
+    } catch (error) {
+      console.error('Failed to search memos:', error);
+      throw new Error(error.response?.data?.detail || 'Failed to search memos');
+    }
+  },
+
   // Create a new memo
   async createMemo(memoData) {
     try {
@@ -69,6 +171,36 @@ export const memoApi = {
   }
 };
 
+// Live event stream (memo changes and due alarms), shared by all subscribers
+let eventSource = null;
+let eventSubscribers = 0;
+
+export const eventsApi = {
+  // Subscribe to server events; returns a function that unsubscribes
+  subscribe(handlers) {
+    if (!eventSource) {
+      eventSource = new EventSource(`${API_BASE}/events`);
+    }
+    eventSubscribers += 1;
+
+    const source = eventSource;
+    const listeners = Object.entries(handlers).map(([event, handler]) => {
+      const listener = (e) => handler(JSON.parse(e.data));
+      source.addEventListener(event, listener);
+      return [event, listener];
+    });
+
+    return () => {
+      listeners.forEach(([event, listener]) => source.removeEventListener(event, listener));
+      eventSubscribers -= 1;
+      if (eventSubscribers === 0) {
+        source.close();
+        eventSource = null;
+      }
+    };
+  }
+};
+
 // Image API functions
 export const imageApi = {
   // Upload image file
@@ -110,9 +242,10 @@ export const imageApi = {
     }
   },
 
-  // Get image URL
-  getImageUrl(filename) {
-    return `${API_BASE}/images/${filename}`;
+  // Get image URL, optionally for a resized variant about `width` pixels wide
+  getImageUrl(filename, width) {
+    const url = `${API_BASE}/images/${filename}`;
+    return width ? `${url}?w=${width}` : url;
   }
 };
 
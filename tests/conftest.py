@@ -0,0 +1,41 @@
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Backend modules import each other by bare name (e.g. ``from cache import ...``)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+def load_database_module():
+    """Import database.py (and the server it hangs off) against mongomock-motor, like backend_benchmark"""
+    if "database" not in sys.modules:
+        pytest.importorskip("mongomock_motor")
+        import motor.motor_asyncio
+        from mongomock_motor import AsyncMongoMockClient
+
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+        os.environ["MONGO_URL"] = "mongodb://mongomock"
+        os.environ.setdefault("DB_NAME", "time_notes_test")
+        os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="time-notes-test-"))
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+        import server  # noqa: F401  (database imports its db handle)
+    import database
+    return database
+
+@pytest.fixture
+def memo_db():
+    """A MemoDatabase over empty collections with its own in-memory cache and search index"""
+    database = load_database_module()
+    from cache import InMemoryCache, MemoCache
+
+    memo_db = database.MemoDatabase(MemoCache(InMemoryCache()))
+
+    async def reset():
+        for collection in (memo_db.collection, memo_db.counters, memo_db.tombstones):
+            await collection.delete_many({})
+
+    asyncio.run(reset())
+    return memo_db
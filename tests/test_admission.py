@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import AdmissionMiddleware, Policy, RateLimiter, TokenBucket
+
+def test_bucket_allows_a_burst_then_refills_at_its_rate():
+    bucket = TokenBucket(rate=2.0, capacity=3, now=0.0)
+    assert [bucket.take(0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take(0.0) == pytest.approx(0.5)
+
+    # Half a second refills one token
+    assert bucket.take(0.5) == 0.0
+    assert bucket.take(0.5) > 0
+
+def test_bucket_never_holds_more_than_its_capacity():
+    bucket = TokenBucket(rate=10.0, capacity=2, now=0.0)
+    bucket.take(0.0)
+    bucket.take(0.0)
+    assert [bucket.take(3600.0) for _ in range(3)][:2] == [0.0, 0.0]
+    assert bucket.tokens < 1
+
+def test_limiter_keeps_one_bucket_per_key_and_drops_the_least_recent():
+    limiter = RateLimiter(max_buckets=2)
+    policy = Policy(per_minute=60, burst=1, max_in_flight=1)
+    assert limiter.check(("a", "GET", "/api/memos"), policy) == 0
+    assert limiter.check(("a", "GET", "/api/memos"), policy) > 0
+    assert limiter.check(("b", "GET", "/api/memos"), policy) == 0
+    limiter.check(("a", "GET", "/api/memos"), policy)
+    limiter.check(("c", "GET", "/api/memos"), policy)
+    assert len(limiter) == 2
+    # b was least recently seen, so it starts over with a full bucket
+    assert limiter.check(("b", "GET", "/api/memos"), policy) == 0
+
+@pytest.mark.parametrize("method,path,expected", [
+    ("GET", "/api/memos", "read"),
+    ("HEAD", "/api/images/a.png", "read"),
+    ("PUT", "/api/memos/1", "write"),
+    ("POST", "/api/upload-image", "upload"),
+    ("GET", "/api/health", None),
+    ("GET", "/api/events", None),
+    ("OPTIONS", "/api/memos", None),
+    ("GET", "/docs", None),
+])
+def test_requests_are_classified(method, path, expected):
+    assert AdmissionMiddleware.classify(method, path) == expected
+
+def test_requests_timing_out_in_the_queue_give_their_slot_back(monkeypatch):
+    monkeypatch.setattr(admission, "QUEUE_TIMEOUT", 0.01)
+    statuses = []
+
+    async def app(scope, receive, send):
+        await asyncio.sleep(0.05)
+        await send({"type": "http.response.start", "status": 200})
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    async def scenario():
+        middleware = AdmissionMiddleware(app)
+        middleware.slots["read"] = asyncio.Semaphore(1)
+        scope = {"type": "http", "method": "GET", "path": "/api/memos", "headers": [], "client": ("10.0.0.1", 1)}
+        await asyncio.gather(*(middleware(scope, None, send) for _ in range(4)))
+        return middleware.slots["read"]
+
+    slots = asyncio.run(scenario())
+    assert sorted(statuses) == [200, 503, 503, 503]
+    assert not slots.locked()
@@ -0,0 +1,81 @@
+import asyncio
+
+MISSING_ID = "000000000000000000000000"
+
+def new_memo(title):
+    return {"title": title, "content": "At nine", "image": None, "alarm": {"enabled": False, "time": None}, "type": "text"}
+
+def statuses(results):
+    return [r["status"] for r in results]
+
+def test_ordered_batch_stops_at_the_first_miss(memo_db):
+    async def scenario():
+        kept = await memo_db.create_memo(new_memo("Kept"))
+        results = await memo_db.bulk_write([
+            {"op": "update", "id": kept["id"], "data": {"title": "Edited"}},
+            {"op": "delete", "id": MISSING_ID},
+            {"op": "delete", "id": kept["id"]},
+            {"op": "create", "data": new_memo("Never")},
+        ], ordered=True)
+        assert statuses(results) == ["ok", "not_found", "skipped", "skipped"]
+        assert results[0]["memo"]["title"] == "Edited"
+        assert (await memo_db.get_memo_by_id(kept["id"]))["title"] == "Edited"
+        assert await memo_db.collection.count_documents({}) == 1
+
+    asyncio.run(scenario())
+
+def test_unordered_batch_carries_on_past_a_miss(memo_db):
+    async def scenario():
+        kept = await memo_db.create_memo(new_memo("Kept"))
+        results = await memo_db.bulk_write([
+            {"op": "delete", "id": MISSING_ID},
+            {"op": "update", "id": kept["id"], "data": {"title": "Edited"}},
+            {"op": "create", "data": new_memo("Added")},
+        ], ordered=False)
+        assert statuses(results) == ["not_found", "ok", "ok"]
+        assert results[1]["memo"]["title"] == "Edited"
+        # Two writes ran, so the batch took two versions
+        assert await memo_db.current_version() == 3
+
+    asyncio.run(scenario())
+
+def test_memos_deleted_under_the_batch_are_not_found(memo_db, monkeypatch):
+    async def scenario():
+        edited = await memo_db.create_memo(new_memo("Edited elsewhere"))
+        dropped = await memo_db.create_memo(new_memo("Dropped elsewhere"))
+        other = await memo_db.create_memo(new_memo("Other"))
+        lookup = memo_db._find_by_ids
+
+        async def lookup_then_delete(ids):
+            found = await lookup(ids)
+            await memo_db.delete_memo(edited["id"])
+            await memo_db.delete_memo(dropped["id"])
+            return found
+
+        monkeypatch.setattr(memo_db, "_find_by_ids", lookup_then_delete)
+        results = await memo_db.bulk_write([
+            {"op": "update", "id": edited["id"], "data": {"title": "Too late"}},
+            {"op": "delete", "id": dropped["id"]},
+            {"op": "update", "id": other["id"], "data": {"title": "Applied"}},
+        ], ordered=False)
+        assert statuses(results) == ["not_found", "not_found", "ok"]
+        assert await memo_db.get_memo_by_id(edited["id"]) is None
+        assert (await memo_db.get_memo_by_id(other["id"]))["title"] == "Applied"
+
+    asyncio.run(scenario())
+
+def test_repeated_deletes_of_one_memo_delete_it_once(memo_db):
+    async def scenario():
+        memo = await memo_db.create_memo(new_memo("Twice"))
+        results = await memo_db.bulk_write([
+            {"op": "delete", "id": memo["id"]},
+            {"op": "delete", "id": memo["id"]},
+            {"op": "update", "id": memo["id"], "data": {"title": "After"}},
+        ], ordered=False)
+        assert statuses(results) == ["ok", "not_found", "not_found"]
+        assert await memo_db.get_memo_by_id(memo["id"]) is None
+        assert await memo_db.cache.get_memo(memo["id"]) is None
+        assert memo_db.search_index.search("twice")[0] == 0
+        assert (await memo_db.tombstones.find_one({"_id": memo["id"]}))["version"] == 2
+
+    asyncio.run(scenario())
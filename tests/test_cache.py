@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from cache import InMemoryCache, MemoCache, RedisCache, decode_value, encode_value
+
+fakeredis = pytest.importorskip("fakeredis")
+
+MEMO = {
+    "id": "m1",
+    "title": "Dentist",
+    "alarm": {"enabled": True, "time": datetime(2026, 3, 1, 9, 30)},
+    "created_at": datetime(2026, 2, 1, 8, 0, 0, 123000),
+    "version": 7,
+}
+
+def test_values_round_trip_through_json():
+    assert decode_value(encode_value(MEMO)) == MEMO
+    assert decode_value(encode_value(([MEMO], "cursor"))) == [[MEMO], "cursor"]
+
+def test_values_are_not_pickled():
+    raw = encode_value(MEMO)
+    assert raw.startswith(b"{")
+    with pytest.raises(TypeError):
+        encode_value({"value": object()})
+
+def test_redis_cache_shares_memos_and_pages():
+    async def scenario():
+        client = fakeredis.aioredis.FakeRedis()
+        writer = MemoCache(RedisCache(client))
+        reader = MemoCache(RedisCache(client))
+
+        await writer.set_memo(MEMO)
+        await writer.set_page(3, "full:50:", ([MEMO], None))
+        assert await reader.get_memo("m1") == MEMO
+        memos, next_cursor = await reader.get_page(3, "full:50:")
+        assert memos == [MEMO] and next_cursor is None
+        assert await reader.get_page(4, "full:50:") is None
+
+        await writer.invalidate_memo("m1")
+        assert await reader.get_memo("m1") is None
+        assert reader.stats()["hits"] == 2
+
+    asyncio.run(scenario())
+
+def test_redis_cache_ignores_foreign_keys_outside_its_prefix():
+    async def scenario():
+        client = fakeredis.aioredis.FakeRedis()
+        await client.set("memo:m1", b"garbage")
+        cache = RedisCache(client, prefix="time-notes:")
+        assert await cache.get("memo:m1") is None
+
+    asyncio.run(scenario())
+
+def test_in_memory_cache_evicts_least_recently_used():
+    async def scenario():
+        cache = InMemoryCache(max_entries=2)
+        await cache.set("a", 1)
+        await cache.set("b", 2)
+        await cache.get("a")
+        await cache.set("c", 3)
+        assert await cache.get("b") is None
+        assert await cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,178 @@
+import asyncio
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+
+from change_stream import SLOT_TIMEOUT, SYNC_STATE_TTL_SECONDS, ChangeFeed, MemoChange
+
+def recording_feed():
+    feed = ChangeFeed(name="test")
+    changes = []
+
+    async def listener(change):
+        changes.append(change)
+
+    feed.add_listener(listener)
+    return feed, changes
+
+def test_default_name_is_shared_by_the_workers_of_a_host(monkeypatch):
+    monkeypatch.delenv("MEMO_CHANGE_STREAM_NAME", raising=False)
+    assert ChangeFeed().name == socket.gethostname()
+    monkeypatch.setenv("MEMO_CHANGE_STREAM_NAME", "api")
+    assert ChangeFeed().name == "api"
+
+def sync_state():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient().time_notes_test.sync_state
+
+async def claim(state, name="api"):
+    feed = ChangeFeed(name=name)
+    feed._state = state
+    return feed, await feed._claim_slot()
+
+async def start_idle(feed, state, monkeypatch):
+    """Start streaming as if MongoDB supported change streams, without tailing one"""
+    async def supported(collection):
+        return True
+
+    async def idle():
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(feed, "_supports_change_streams", supported)
+    monkeypatch.setattr(feed, "_run", idle)
+    await feed.start(state.database.memos, state, mode="auto")
+    return feed
+
+def test_live_workers_get_their_own_slots():
+    async def scenario():
+        state = sync_state()
+        first, _ = await claim(state)
+        second, _ = await claim(state)
+        other_host, _ = await claim(state, name="web")
+        assert (first.slot, second.slot, other_host.slot) == (0, 1, 0)
+        assert first._state_id == "memos:api:0"
+
+    asyncio.run(scenario())
+
+def test_restarted_worker_resumes_a_released_slot(monkeypatch):
+    async def scenario():
+        state = sync_state()
+        first = await start_idle(ChangeFeed(name="api"), state, monkeypatch)
+        first._token = {"_data": "after-42"}
+        first._token_dirty = True
+        await first.stop()
+
+        restarted, token = await claim(state)
+        assert restarted.slot == 0 and token == {"_data": "after-42"}
+
+    asyncio.run(scenario())
+
+def test_slots_of_workers_that_stopped_heartbeating_are_taken_over():
+    async def scenario():
+        state = sync_state()
+        crashed, _ = await claim(state)
+        stale = datetime.utcnow() - SLOT_TIMEOUT - timedelta(seconds=1)
+        await state.update_one({"_id": crashed._state_id}, {"$set": {"heartbeat_at": stale}})
+
+        replacement, _ = await claim(state)
+        assert replacement.slot == 0
+        # The stalled worker can no longer write to the slot it lost
+        crashed._token = {"_data": "stale"}
+        await crashed._save_token(force=True)
+        assert (await state.find_one({"_id": "memos:api:0"})).get("token") is None
+
+    asyncio.run(scenario())
+
+def test_start_expires_idle_slots_with_a_ttl_index(monkeypatch):
+    async def scenario():
+        state = sync_state()
+        feed = await start_idle(ChangeFeed(name="api"), state, monkeypatch)
+        try:
+            assert feed.streaming and feed.slot == 0
+            index = (await state.index_information())["updated_at_1"]
+            assert index["expireAfterSeconds"] == SYNC_STATE_TTL_SECONDS
+        finally:
+            await feed.stop()
+        assert (await state.find_one({"_id": "memos:api:0"}))["owner"] is None
+
+    asyncio.run(scenario())
+
+def test_in_memory_bus_publishes_local_writes():
+    async def scenario():
+        feed, changes = recording_feed()
+        await feed.record("update", "m1", {"id": "m1"})
+        assert changes == [MemoChange("update", "m1", {"id": "m1"}, local=True)]
+
+        # While streaming, writes arrive from MongoDB instead
+        feed.streaming = True
+        await feed.record("delete", "m1")
+        assert len(changes) == 1
+
+    asyncio.run(scenario())
+
+def test_failing_listener_does_not_stop_the_others():
+    async def scenario():
+        feed = ChangeFeed(name="test")
+        seen = []
+
+        async def broken(change):
+            raise RuntimeError("boom")
+
+        async def working(change):
+            seen.append(change.memo_id)
+
+        feed.add_listener(broken)
+        feed.add_listener(working)
+        await feed.record("insert", "m1", {"id": "m1"})
+        assert seen == ["m1"]
+
+    asyncio.run(scenario())
+
+def test_start_falls_back_without_change_stream_support():
+    class Database:
+        async def command(self, name):
+            return {"isWritablePrimary": True}  # standalone server: no setName
+
+    class Collection:
+        database = Database()
+        name = "memos"
+
+    async def scenario():
+        feed, changes = recording_feed()
+        await feed.start(Collection(), state_collection=None, mode="auto")
+        assert not feed.streaming
+        await feed.record("insert", "m1", {"id": "m1"})
+        assert len(changes) == 1
+
+        await feed.start(Collection(), state_collection=None, mode="off")
+        assert not feed.streaming
+
+    asyncio.run(scenario())
+
+def test_dispatch_maps_stream_events_to_memo_changes():
+    async def scenario():
+        feed, changes = recording_feed()
+        feed._token = {"_data": "token"}
+        document = {"_id": "m1", "title": "Dentist"}
+
+        await feed._dispatch({"operationType": "insert", "fullDocument": document})
+        await feed._dispatch({"operationType": "update", "fullDocument": document})
+        await feed._dispatch({"operationType": "replace", "fullDocument": document})
+        # Deleted before the update lookup: its delete event follows
+        await feed._dispatch({"operationType": "update", "fullDocument": None})
+        await feed._dispatch({"operationType": "delete", "documentKey": {"_id": "m1"}})
+        await feed._dispatch({"operationType": "invalidate"})
+
+        memo = {"title": "Dentist", "id": "m1"}
+        assert changes == [
+            MemoChange("insert", "m1", memo),
+            MemoChange("update", "m1", memo),
+            MemoChange("update", "m1", memo),
+            MemoChange("delete", "m1"),
+            MemoChange("resync"),
+        ]
+        assert not any(change.local for change in changes)
+        assert feed._token is None
+
+    asyncio.run(scenario())
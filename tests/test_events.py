@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+from change_stream import MemoChange
+from events import EventHub, format_sse
+
+def frames(subscription):
+    queued = []
+    while not subscription.queue.empty():
+        queued.append(subscription.queue.get_nowait())
+    return queued
+
+def test_frames_are_server_sent_events():
+    frame = format_sse("memo.deleted", {"id": "m1"})
+    assert frame == 'event: memo.deleted\ndata: {"id":"m1"}\n\n'
+
+def test_every_subscriber_gets_each_event():
+    async def scenario():
+        hub = EventHub()
+        first, second = hub.subscribe(), hub.subscribe()
+        await hub.memo_changed(MemoChange("insert", "m1", {"id": "m1", "title": "Dentist"}))
+        await hub.memo_changed(MemoChange("delete", "m1"))
+        assert frames(first) == frames(second) == [
+            format_sse("memo.created", {"id": "m1", "title": "Dentist"}),
+            format_sse("memo.deleted", {"id": "m1"}),
+        ]
+
+    asyncio.run(scenario())
+
+def test_slow_subscriber_is_dropped_with_a_resync():
+    async def scenario():
+        hub = EventHub(queue_size=3)
+        slow, reading = hub.subscribe(), hub.subscribe()
+        for i in range(3):
+            hub.memo_deleted(f"m{i}")
+            reading.queue.get_nowait()
+        # The fourth frame does not fit the slow client's queue
+        hub.memo_deleted("m3")
+
+        assert slow.dropped and not reading.dropped
+        assert len(hub) == 1
+        resync, end = frames(slow)
+        assert resync.startswith("event: resync\n")
+        assert json.loads(resync.split("data: ")[1]) == {"reason": "slow consumer"}
+        assert end is None
+        assert frames(reading) == [format_sse("memo.deleted", {"id": "m3"})]
+
+        # Later events only reach the subscribers that kept up
+        hub.memo_deleted("m4")
+        assert slow.queue.empty()
+
+    asyncio.run(scenario())
+
+def test_stream_ends_for_a_dropped_client_and_unsubscribes():
+    async def scenario():
+        hub = EventHub(queue_size=2)
+        stream = hub.stream()
+        assert await stream.__anext__() == "retry: 3000\n\n"
+        # Subscribed once the stream has started; nobody reads while three events arrive
+        for i in range(3):
+            hub.memo_deleted(f"m{i}")
+        received = [frame async for frame in stream]
+        assert len(received) == 1 and received[0].startswith("event: resync\n")
+        assert len(hub) == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+
+from storage import LocalFileStorage
+
+def test_calls_are_bounded_by_workers_and_pending_slots():
+    async def scenario():
+        io = LocalFileStorage(max_workers=2, max_pending=3)
+        gate = threading.Event()
+        lock = threading.Lock()
+        running = []
+        peak = [0]
+
+        def blocking(i):
+            with lock:
+                running.append(i)
+                peak[0] = max(peak[0], len(running))
+            gate.wait(5)
+            with lock:
+                running.remove(i)
+            return i
+
+        submitted = []
+        submit = io.executor.submit
+
+        def counting_submit(fn, *args):
+            submitted.append(fn)
+            return submit(fn, *args)
+
+        io.executor.submit = counting_submit
+        calls = [asyncio.create_task(io.run(blocking, i)) for i in range(6)]
+        await asyncio.sleep(0.1)
+        # Two calls run, one more waits in the pool's queue, the rest wait in the event loop
+        assert peak[0] == 2
+        assert len(submitted) == 3
+
+        gate.set()
+        assert await asyncio.gather(*calls) == list(range(6))
+        assert peak[0] == 2 and len(submitted) == 6
+        io.executor.shutdown()
+
+    asyncio.run(scenario())
+
+def test_cancelled_waiters_give_back_their_slot():
+    async def scenario():
+        io = LocalFileStorage(max_workers=1, max_pending=1)
+        gate = threading.Event()
+        busy = asyncio.create_task(io.run(gate.wait, 5))
+        await asyncio.sleep(0.05)
+        waiting = asyncio.create_task(io.run(lambda: "never"))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        gate.set()
+        assert await busy is True
+        # The slot held by the finished call is free again
+        assert await asyncio.wait_for(io.run(lambda: "next"), timeout=1) == "next"
+        io.executor.shutdown()
+
+    asyncio.run(scenario())
+
+def test_files_and_stats_go_through_the_pool(tmp_path):
+    async def scenario():
+        io = LocalFileStorage(max_workers=1, max_pending=2)
+        path = tmp_path / "note.txt"
+        async with io.open(path, "wb") as f:
+            await f.write(b"At nine")
+        async with io.open(path) as f:
+            assert await f.read() == b"At nine"
+        assert (await io.stat(path)).st_size == 7
+        assert await io.stat(tmp_path / "missing.txt") is None
+        assert await io.remove(path) and not await io.remove(path)
+        io.executor.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,33 @@
+import pytest
+
+from http_cache import etag_matches, parse_range
+
+ETAG = '"abc123-10-ff"'
+
+@pytest.mark.parametrize("header,expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=900-5000", (900, 999)),
+    (" Bytes = 0-0", (0, 0)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range(header, 1000) == expected
+
+@pytest.mark.parametrize("header", ["items=0-99", "bytes=0-9,20-29", "bytes=abc", "bytes=-", "bytes=a-9", "bytes=5"])
+def test_unsupported_or_malformed_ranges_are_ignored(header):
+    assert parse_range(header, 1000) is None
+
+@pytest.mark.parametrize("header,size", [("bytes=1000-", 1000), ("bytes=50-10", 1000), ("bytes=-0", 1000), ("bytes=-10", 0)])
+def test_unsatisfiable_ranges_raise(header, size):
+    with pytest.raises(ValueError):
+        parse_range(header, size)
+
+def test_etag_matching_is_weak_and_accepts_lists():
+    assert etag_matches(ETAG, ETAG)
+    assert etag_matches(f"W/{ETAG}", ETAG)
+    assert etag_matches(f'"other", {ETAG}', ETAG)
+    assert etag_matches(" * ", ETAG)
+    assert not etag_matches('"other"', ETAG)
+    assert not etag_matches("", ETAG)
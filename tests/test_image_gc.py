@@ -0,0 +1,115 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from storage import LocalStorageBackend
+
+GRACE = 60.0
+
+@pytest.fixture
+def image_gc(memo_db):
+    """The image_gc module, imported once database.py is loaded against mongomock"""
+    import image_gc
+    return image_gc
+
+def store(root, name, age=0.0):
+    path = root / name
+    path.write_bytes(b"image bytes")
+    modified = time.time() - age
+    os.utime(path, (modified, modified))
+    return path
+
+def collector(image_gc, root, referenced=()):
+    deleted = []
+
+    async def find_referenced(keys):
+        return set(keys) & set(referenced)
+
+    async def delete(key):
+        deleted.append(key)
+        return True
+
+    gc = image_gc.ImageGarbageCollector(
+        LocalStorageBackend(root), find_referenced, delete,
+        staging_dir=root, grace=GRACE, batch_size=2, deletes_per_second=1000
+    )
+    return gc, deleted
+
+def test_sweep_deletes_old_unreferenced_files_and_stale_parts(image_gc, tmp_path):
+    store(tmp_path, "orphan.png", age=2 * GRACE)
+    store(tmp_path, "attached.png", age=2 * GRACE)
+    store(tmp_path, "fresh.png")
+    store(tmp_path, ".crashed-upload.part", age=2 * GRACE)
+    store(tmp_path, ".uploading.part")
+    gc, deleted = collector(image_gc, tmp_path, referenced={"attached.png"})
+
+    assert asyncio.run(gc.sweep()) == 2
+    assert deleted == ["orphan.png"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == [".uploading.part", "attached.png", "fresh.png"]
+
+def test_enqueued_images_are_checked_only_while_running(image_gc, tmp_path):
+    store(tmp_path, "detached.png", age=2 * GRACE)
+    gc, deleted = collector(image_gc, tmp_path)
+
+    async def scenario():
+        gc.enqueue("detached.png")
+        assert await gc.collect_pending() == 0
+
+        gc._task = asyncio.create_task(asyncio.sleep(3600))  # as if started
+        gc.enqueue("detached.png")
+        gc.enqueue("never-stored.png")
+        assert await gc.collect_pending() == 1
+        await gc.stop()
+
+    asyncio.run(scenario())
+    assert deleted == ["detached.png"]
+
+def test_files_touched_after_listing_are_kept(image_gc, tmp_path):
+    path = store(tmp_path, "reused.png", age=2 * GRACE)
+    gc, deleted = collector(image_gc, tmp_path)
+
+    async def scenario():
+        listed = [(key, modified) async for page in gc.backend.list_keys() for key, modified in page]
+        # A deduplicated upload restarts the grace period between the listing and the delete
+        assert await gc.backend.touch("reused.png")
+        return await gc._collect(listed)
+
+    assert asyncio.run(scenario()) == 0
+    assert path.exists() and deleted == []
+
+def test_delete_if_older_puts_back_a_file_touched_while_it_was_moved(tmp_path, monkeypatch):
+    path = store(tmp_path, "reused.png", age=2 * GRACE)
+    backend = LocalStorageBackend(tmp_path)
+    replace = backend.io.replace
+
+    async def touched_while_moving(source, target):
+        await replace(source, target)
+        if source == path:
+            os.utime(target)
+
+    monkeypatch.setattr(backend.io, "replace", touched_while_moving)
+    assert not asyncio.run(backend.delete_if_older("reused.png", time.time() - GRACE))
+    assert [p.name for p in tmp_path.iterdir()] == ["reused.png"]
+    assert not asyncio.run(backend.delete_if_older("missing.png", time.time()))
+
+def test_deduplicated_upload_of_a_collected_file_is_stored_again(image_gc, tmp_path, monkeypatch):
+    import file_handler
+
+    monkeypatch.setattr(file_handler, "CONTENT_ADDRESSED_UPLOADS", True)
+    monkeypatch.setattr(file_handler, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(file_handler, "image_storage", LocalStorageBackend(tmp_path))
+    monkeypatch.setattr(file_handler.image_variants, "schedule", lambda filename: None)
+
+    async def upload():
+        async def chunks():
+            yield b"image bytes"
+        temp = await file_handler.FileHandler.write_temp_file(chunks(), "too large")
+        return await file_handler.FileHandler.commit_temp_file(temp, "photo.png")
+
+    first = asyncio.run(upload())
+    (tmp_path / first).unlink()  # collected before the second upload touched it
+    assert asyncio.run(upload()) == first
+    assert (tmp_path / first).read_bytes() == b"image bytes"
+    assert [p.name for p in tmp_path.iterdir()] == [first]
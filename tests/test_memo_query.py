@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from memo_query import (
+    DEFAULT_CURSOR_PLAN,
+    MemoFilters,
+    UnindexedQueryError,
+    build_memo_query,
+    decode_cursor,
+    encode_cursor,
+)
+
+NOW = datetime(2026, 3, 1, 9, 30, 0, 250000)
+
+def test_cursor_is_bound_to_its_query_plan():
+    cursor = encode_cursor(NOW, ObjectId(), "alarm_enabled_time_id")
+    assert decode_cursor(cursor, "alarm_enabled_time_id")[0] == NOW
+    with pytest.raises(ValueError, match="different filters"):
+        decode_cursor(cursor)
+    with pytest.raises(ValueError, match="different filters"):
+        decode_cursor(encode_cursor(NOW, ObjectId()), "updated_at_id_desc")
+
+def test_unfiltered_query_uses_the_newest_first_plan():
+    query = build_memo_query()
+    assert query.plan.index == DEFAULT_CURSOR_PLAN
+    assert query.filter == {}
+    assert query.sort == [("created_at", -1), ("_id", -1)]
+
+def test_each_filter_combination_picks_its_index():
+    by_type = build_memo_query(MemoFilters(type="image", created_after=NOW))
+    assert by_type.plan.index == "type_created_at_id_desc"
+    assert by_type.filter == {"type": "image", "created_at": {"$gte": NOW}}
+
+    updated = build_memo_query(MemoFilters(updated_before=NOW))
+    assert updated.plan.index == "updated_at_id_desc"
+    assert updated.filter == {"updated_at": {"$lt": NOW}}
+
+    alarms = build_memo_query(MemoFilters(alarm_after=NOW))
+    assert alarms.plan.index == "alarm_enabled_time_id"
+    assert alarms.filter == {"alarm.enabled": True, "alarm.time": {"$gte": NOW}}
+    assert alarms.sort == [("alarm.time", 1), ("_id", 1)]
+
+    # Enabled alarms without a time have no place in the alarm order
+    assert build_memo_query(MemoFilters(alarm_enabled=True)).filter == {"alarm.enabled": True, "alarm.time": {"$ne": None}}
+
+@pytest.mark.parametrize("filters", [
+    MemoFilters(created_after=NOW, updated_after=NOW),
+    MemoFilters(alarm_enabled=False),
+    MemoFilters(type="text", alarm_enabled=True),
+    MemoFilters(type="text", updated_after=NOW),
+])
+def test_unindexed_combinations_are_rejected(filters):
+    with pytest.raises(UnindexedQueryError):
+        build_memo_query(filters)
+
+def test_after_continues_from_a_position_in_sort_order():
+    last_id = ObjectId()
+    ascending = build_memo_query(MemoFilters(alarm_after=NOW)).after(NOW, last_id)
+    assert ascending["$and"][0] == {"alarm.enabled": True, "alarm.time": {"$gte": NOW}}
+    assert ascending["$and"][1]["$or"] == [
+        {"alarm.time": {"$gt": NOW}},
+        {"alarm.time": NOW, "_id": {"$gt": last_id}},
+    ]
+
+    descending = build_memo_query().after(NOW, last_id)
+    assert descending["created_at"] == {"$lte": NOW}
+    assert descending["$or"][1] == {"created_at": NOW, "_id": {"$lt": last_id}}
+
+def test_position_reads_nested_sort_fields():
+    query = build_memo_query(MemoFilters(alarm_enabled=True))
+    assert query.position({"alarm": {"enabled": True, "time": NOW}}) == NOW
+    assert query.position({}) is None
+
+def test_cache_key_lists_only_set_filters():
+    assert MemoFilters().is_empty()
+    assert MemoFilters(type="text", alarm_after=NOW).cache_key() == f"alarm_after={NOW.isoformat()},type=text"
@@ -0,0 +1,48 @@
+import asyncio
+
+MISSING_ID = "000000000000000000000000"
+
+def new_memo(title="Dentist", image=None):
+    return {"title": title, "content": "At nine", "image": image, "alarm": {"enabled": False, "time": None}, "type": "text"}
+
+def test_update_returns_the_stored_document_and_the_replaced_image(memo_db):
+    async def scenario():
+        memo = await memo_db.create_memo(new_memo(image="old.png"))
+        # Written by another worker: the returned memo must include it
+        await memo_db.collection.update_one({}, {"$set": {"content": "At ten"}})
+
+        updated, replaced = await memo_db.update_memo_and_replaced_image(memo["id"], {"image": "new.png"})
+        assert replaced == "old.png"
+        assert (updated["id"], updated["image"], updated["content"]) == (memo["id"], "new.png", "At ten")
+        assert updated["version"] == 2
+        assert (await memo_db.cache.get_memo(memo["id"]))["content"] == "At ten"
+
+        updated, replaced = await memo_db.update_memo_and_replaced_image(memo["id"], {"title": "Dentist at ten"})
+        assert replaced is None and updated["image"] == "new.png"
+        assert await memo_db.update_memo_and_replaced_image(MISSING_ID, {"image": None}) == (None, None)
+
+    asyncio.run(scenario())
+
+def test_toggle_alarm_flips_on_the_server_and_returns_the_result(memo_db):
+    async def scenario():
+        memo = await memo_db.create_memo(new_memo())
+        toggled = await memo_db.toggle_alarm(memo["id"])
+        assert toggled["alarm"]["enabled"] is True and toggled["version"] == 2
+        assert (await memo_db.toggle_alarm(memo["id"]))["alarm"]["enabled"] is False
+
+        # A memo stored without an alarm counts as disabled
+        await memo_db.collection.update_one({}, {"$unset": {"alarm": ""}})
+        assert (await memo_db.toggle_alarm(memo["id"]))["alarm"]["enabled"] is True
+        assert await memo_db.toggle_alarm(MISSING_ID) is None
+
+    asyncio.run(scenario())
+
+def test_delete_returns_the_deleted_memo(memo_db):
+    async def scenario():
+        memo = await memo_db.create_memo(new_memo())
+        deleted = await memo_db.delete_memo(memo["id"])
+        assert deleted["id"] == memo["id"] and deleted["title"] == "Dentist"
+        assert await memo_db.cache.get_memo(memo["id"]) is None
+        assert await memo_db.delete_memo(memo["id"]) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from memo_query import decode_cursor, encode_cursor, keyset_query
+
+NOW = datetime(2026, 3, 1, 9, 30, 0, 250000)
+
+def test_cursor_round_trip_keeps_the_id_type():
+    oid = ObjectId()
+    assert decode_cursor(encode_cursor(NOW, oid)) == (NOW, oid)
+    assert decode_cursor(encode_cursor(NOW, "legacy-uuid")) == (NOW, "legacy-uuid")
+
+def test_cursor_is_opaque_url_safe_text():
+    cursor = encode_cursor(NOW, ObjectId())
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "e30", "eyJ0IjoiYmFkIn0"])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
+
+def test_keyset_query_breaks_ties_on_id():
+    last_id = ObjectId()
+    assert keyset_query("created_at", NOW, last_id) == {
+        "created_at": {"$lte": NOW},
+        "$or": [
+            {"created_at": {"$lt": NOW}},
+            {"created_at": NOW, "_id": {"$lt": last_id}},
+        ],
+    }
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from storage import S3StorageBackend, create_storage_backend
+
+moto = pytest.importorskip("moto")
+boto3 = pytest.importorskip("boto3")
+
+BUCKET = "time-notes-test"
+
+@pytest.fixture
+def s3_env(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("IMAGE_STORAGE", "s3")
+    monkeypatch.setenv("S3_BUCKET", BUCKET)
+    monkeypatch.setenv("S3_PREFIX", "images/")
+    monkeypatch.setenv("S3_REGION", "us-east-1")
+    monkeypatch.delenv("S3_PUBLIC_BASE_URL", raising=False)
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        yield
+
+def staged(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+def test_put_exists_download_and_delete(s3_env, tmp_path):
+    async def scenario():
+        backend = create_storage_backend(tmp_path)
+        assert isinstance(backend, S3StorageBackend)
+        await backend.prepare()
+
+        source = staged(tmp_path, "upload.part", b"\x89PNG image bytes")
+        await backend.put_file("a.png", source, "image/png")
+        assert not source.exists()  # the staging file is consumed
+        assert await backend.exists("a.png")
+        assert not await backend.exists("missing.png")
+
+        head = backend.client.head_object(Bucket=BUCKET, Key="images/a.png")
+        assert head["ContentType"] == "image/png"
+        assert "immutable" in head["CacheControl"]
+
+        target = tmp_path / "copy.png"
+        await backend.download_to("a.png", target)
+        assert target.read_bytes() == b"\x89PNG image bytes"
+
+        await backend.delete("a.png")
+        assert not await backend.exists("a.png")
+        assert await backend.modified("a.png") is None
+
+    asyncio.run(scenario())
+
+def test_largest_upload_is_stored_in_one_piece(s3_env, tmp_path):
+    from file_handler import MAX_FILE_SIZE
+
+    async def scenario():
+        backend = create_storage_backend(tmp_path)
+        data = bytes(range(256)) * (MAX_FILE_SIZE // 256)
+        await backend.put_file("big.jpg", staged(tmp_path, "big.part", data), "image/jpeg")
+
+        head = backend.client.head_object(Bucket=BUCKET, Key="images/big.jpg")
+        assert head["ContentLength"] == len(data)
+        # Multipart uploads get an ETag suffixed with the part count
+        assert "-" not in head["ETag"]
+
+    asyncio.run(scenario())
+
+def test_list_keys_pages_through_top_level_objects(s3_env, tmp_path):
+    async def scenario():
+        backend = create_storage_backend(tmp_path)
+        for name in ("a.png", "b.png", "c.png", "variants/a-320.webp"):
+            await backend.put_file(name, staged(tmp_path, "f.part", b"x"))
+
+        pages = [page async for page in backend.list_keys(page_size=2)]
+        assert [len(page) for page in pages] == [2, 1]
+        assert sorted(key for page in pages for key, _ in page) == ["a.png", "b.png", "c.png"]
+
+    asyncio.run(scenario())
+
+def test_download_url_is_presigned_and_reused(s3_env, tmp_path):
+    async def scenario():
+        backend = create_storage_backend(tmp_path)
+        url = await backend.download_url("a.png")
+        assert "images/a.png" in url and "Signature" in url
+        assert await backend.download_url("a.png") == url
+
+    asyncio.run(scenario())
+
+def test_touch_refreshes_modified_time(s3_env, tmp_path):
+    async def scenario():
+        backend = create_storage_backend(tmp_path)
+        await backend.put_file("a.png", staged(tmp_path, "a.part", b"x"), "image/png")
+        before = await backend.modified("a.png")
+        await asyncio.sleep(1.1)
+        assert await backend.touch("a.png")
+        assert await backend.modified("a.png") > before
+        head = backend.client.head_object(Bucket=BUCKET, Key="images/a.png")
+        assert head["ContentType"] == "image/png"
+
+    asyncio.run(scenario())
+
+def test_touch_and_delete_if_older_on_missing_objects(s3_env, tmp_path):
+    async def scenario():
+        backend = create_storage_backend(tmp_path)
+        assert not await backend.touch("gone.png")
+        assert not await backend.delete_if_older("gone.png", cutoff=float("inf"))
+
+        await backend.put_file("a.png", staged(tmp_path, "a.part", b"x"), "image/png")
+        assert not await backend.delete_if_older("a.png", cutoff=0)
+        assert await backend.delete_if_older("a.png", cutoff=float("inf"))
+        assert not await backend.exists("a.png")
+
+    asyncio.run(scenario())
@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from scheduler import MISSED_ALARM_GRACE, AlarmScheduler, to_utc_naive
+
+def in_ms(milliseconds):
+    return datetime.utcnow() + timedelta(milliseconds=milliseconds)
+
+def test_alarm_times_are_normalized_to_naive_utc():
+    assert to_utc_naive("2026-03-01T09:30:00Z") == datetime(2026, 3, 1, 9, 30)
+    assert to_utc_naive(datetime(2026, 3, 1, 10, 30, tzinfo=timezone(timedelta(hours=1)))) == datetime(2026, 3, 1, 9, 30)
+    assert to_utc_naive(None) is None
+
+def test_next_due_skips_rescheduled_and_removed_alarms():
+    async def scenario():
+        scheduler = AlarmScheduler()
+        first, second, third = in_ms(60000), in_ms(120000), in_ms(180000)
+        scheduler.schedule("a", first)
+        scheduler.schedule("b", second)
+        scheduler.schedule("a", third)  # moved: its first heap entry is stale
+        assert scheduler.next_due() == (second, "b")
+
+        scheduler.unschedule("b")
+        assert scheduler.next_due() == (third, "a")
+        assert len(scheduler) == 1
+
+    asyncio.run(scenario())
+
+def test_sync_follows_the_memo_alarm():
+    async def scenario():
+        scheduler = AlarmScheduler()
+        due = in_ms(60000)
+        scheduler.sync({"id": "a", "alarm": {"enabled": True, "time": due}})
+        assert scheduler.next_due() == (due, "a")
+        scheduler.sync({"id": "a", "alarm": {"enabled": False, "time": due}})
+        assert scheduler.next_due() is None
+
+    asyncio.run(scenario())
+
+def test_alarms_past_the_grace_window_are_dropped():
+    async def scenario():
+        scheduler = AlarmScheduler()
+        scheduler.schedule("late", datetime.utcnow() - MISSED_ALARM_GRACE - timedelta(seconds=1))
+        assert len(scheduler) == 0
+
+    asyncio.run(scenario())
+
+def test_due_alarms_fire_once_even_if_the_memo_is_edited_later():
+    async def scenario():
+        scheduler = AlarmScheduler()
+        fired = []
+
+        async def listener(memo_id, alarm_time):
+            fired.append((memo_id, alarm_time))
+
+        scheduler.add_listener(listener)
+        scheduler.start()
+        try:
+            soon, later = in_ms(20), in_ms(60)
+            scheduler.schedule("a", later)
+            scheduler.schedule("b", soon)
+            await asyncio.sleep(0.15)
+            assert fired == [("b", soon), ("a", later)]
+
+            # Editing the title re-syncs the unchanged alarm time
+            scheduler.sync({"id": "a", "alarm": {"enabled": True, "time": later}})
+            await asyncio.sleep(0.05)
+            assert len(fired) == 2 and len(scheduler) == 0
+
+            # A new time is a new alarm
+            again = in_ms(10)
+            scheduler.sync({"id": "a", "alarm": {"enabled": True, "time": again}})
+            await asyncio.sleep(0.05)
+            assert fired[-1] == ("a", again)
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,70 @@
+from search import MemoSearchIndex, tokenize
+
+def memo(memo_id, title, content="", memo_type="text", alarm=False):
+    return {"id": memo_id, "title": title, "content": content, "type": memo_type, "alarm": {"enabled": alarm}}
+
+def build(*memos):
+    index = MemoSearchIndex()
+    for item in memos:
+        index.upsert(item)
+    return index
+
+def ids(result):
+    return [memo_id for memo_id, _ in result[1]]
+
+def test_tokenize_lowercases_words():
+    assert tokenize("Call Mom, re: the Café!") == ["call", "mom", "re", "the", "café"]
+    assert tokenize(None) == []
+
+def test_rarer_and_more_frequent_terms_rank_higher():
+    index = build(
+        memo("a", "Groceries", "milk eggs bread"),
+        memo("b", "Milk run", "milk milk and more milk"),
+        memo("c", "Dentist", "appointment at nine"),
+    )
+    total, ranked = index.search("milk")
+    assert total == 2
+    assert [memo_id for memo_id, _ in ranked] == ["b", "a"]
+    assert ranked[0][1] > ranked[1][1] > 0
+
+def test_title_matches_outweigh_content_matches():
+    index = build(
+        memo("content", "Shopping", "remember the dentist"),
+        memo("title", "Dentist", "remember the shopping"),
+    )
+    assert ids(index.search("dentist")) == ["title", "content"]
+
+def test_every_term_must_match_and_the_last_one_as_a_prefix():
+    index = build(
+        memo("a", "Dentist appointment"),
+        memo("b", "Dentist"),
+        memo("c", "Appointment with the bank"),
+    )
+    assert ids(index.search("dentist appoint")) == ["a"]
+    # Only the last term is a prefix
+    assert index.search("dent appointment") == (0, [])
+
+def test_filters_and_pagination():
+    index = build(
+        memo("a", "Call about the car", alarm=True),
+        memo("b", "Call the bank", memo_type="image"),
+        memo("c", "Call grandma call her twice"),
+    )
+    assert ids(index.search("call", memo_type="image")) == ["b"]
+    assert ids(index.search("call", alarm_enabled=True)) == ["a"]
+
+    total, first = index.search("call", limit=2)
+    _, rest = index.search("call", limit=2, offset=2)
+    assert total == 3 and len(first) == 2 and len(rest) == 1
+    assert {memo_id for memo_id, _ in first + rest} == {"a", "b", "c"}
+
+def test_upsert_replaces_and_remove_forgets():
+    index = build(memo("a", "Old title"))
+    index.upsert(memo("a", "New title"))
+    assert index.search("old") == (0, [])
+    assert ids(index.search("new")) == ["a"]
+
+    index.remove("a")
+    assert len(index) == 0
+    assert index.search("new") == (0, [])
+    assert index._vocabulary == []
@@ -0,0 +1,150 @@
+import asyncio
+import base64
+
+import pytest
+from fastapi import HTTPException
+
+import file_handler
+from file_handler import Base64StreamDecoder, Base64TooLarge, FileHandler, iter_multipart_fields
+from storage import LocalStorageBackend
+
+IMAGE = bytes(range(256)) * 4
+
+def decode_in_chunks(text: bytes, chunk_size: int, max_size: int = 1 << 20) -> bytes:
+    decoder = Base64StreamDecoder(max_size)
+    decoded = b"".join(decoder.feed(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size))
+    return decoded + decoder.finish()
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 4096])
+def test_decodes_base64_fed_in_any_chunking(chunk_size):
+    encoded = base64.b64encode(IMAGE)
+    assert decode_in_chunks(encoded, chunk_size) == IMAGE
+
+@pytest.mark.parametrize("chunk_size", [2, 5, 4096])
+def test_strips_a_data_url_header_split_across_chunks(chunk_size):
+    encoded = b"data:image/png;base64," + base64.b64encode(IMAGE)
+    assert decode_in_chunks(encoded, chunk_size) == IMAGE
+
+def test_ignores_whitespace_and_missing_padding():
+    encoded = base64.b64encode(IMAGE[:10]).rstrip(b"=")
+    wrapped = b"\n".join(encoded[i:i + 4] for i in range(0, len(encoded), 4))
+    assert decode_in_chunks(wrapped, 3) == IMAGE[:10]
+
+def test_short_input_is_decoded_on_finish():
+    assert decode_in_chunks(b"YWJj", 4) == b"abc"
+    assert decode_in_chunks(b"da", 1) == base64.b64decode(b"da==")
+
+def test_rejects_oversized_truncated_and_invalid_data():
+    with pytest.raises(Base64TooLarge):
+        decode_in_chunks(base64.b64encode(IMAGE), 64, max_size=len(IMAGE) - 10)
+    with pytest.raises(ValueError, match="Truncated"):
+        decode_in_chunks(b"YWJjZ", 64)
+    with pytest.raises(ValueError):
+        decode_in_chunks(b"not*base64!", 64)
+    with pytest.raises(ValueError, match="data URL"):
+        decode_in_chunks(b"data:" + b"x" * 300, 64)
+
+class StreamingRequest:
+    """The parts of starlette's Request that iter_multipart_fields reads"""
+
+    def __init__(self, body: bytes, content_type: str, chunk_size: int = 7, content_length=None):
+        self.headers = {"content-type": content_type}
+        if content_length is not None:
+            self.headers["content-length"] = str(content_length)
+        self._chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        self.chunks_read = 0
+
+    async def stream(self):
+        for chunk in self._chunks:
+            self.chunks_read += 1
+            yield chunk
+
+def multipart_body(fields, boundary="x-boundary", filenames=None):
+    parts = []
+    for name, value in fields:
+        disposition = f"form-data; name=\"{name}\""
+        if filenames and name in filenames:
+            disposition += f"; filename=\"{filenames[name]}\""
+        parts.append(
+            f"--{boundary}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + value + b"\r\n"
+        )
+    return b"".join(parts) + f"--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+def collect(request):
+    async def scenario():
+        fields = {}
+        async for name, data in iter_multipart_fields(request):
+            fields[name] = fields.get(name, b"") + data
+        return fields
+
+    return asyncio.run(scenario())
+
+def test_multipart_fields_are_streamed_in_order():
+    body, content_type = multipart_body([("filename", b"photo.jpg"), ("image_data", b"QUJD" * 50)])
+    assert collect(StreamingRequest(body, content_type)) == {"filename": b"photo.jpg", "image_data": b"QUJD" * 50}
+
+def test_empty_fields_are_still_announced():
+    body, content_type = multipart_body([("image_data", b"")])
+    assert collect(StreamingRequest(body, content_type)) == {"image_data": b""}
+
+def test_non_multipart_bodies_are_rejected():
+    with pytest.raises(HTTPException) as error:
+        collect(StreamingRequest(b"{}", "application/json"))
+    assert error.value.status_code == 400
+
+def test_file_fields_report_their_filename():
+    body, content_type = multipart_body([("note", b"hi"), ("file", IMAGE)], filenames={"file": "photo.png"})
+    filenames = {}
+
+    async def scenario():
+        async for name, _ in iter_multipart_fields(StreamingRequest(body, content_type), filenames):
+            if name == "file":
+                return dict(filenames)
+
+    assert asyncio.run(scenario()) == {"file": "photo.png"}
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_handler, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(file_handler, "image_storage", LocalStorageBackend(tmp_path))
+    monkeypatch.setattr(file_handler.image_variants, "schedule", lambda filename: None)
+    return tmp_path
+
+def upload(request):
+    return asyncio.run(FileHandler.save_uploaded_file(request))
+
+def upload_error(request):
+    with pytest.raises(HTTPException) as error:
+        upload(request)
+    return error.value
+
+def test_uploaded_file_is_streamed_to_storage(upload_dir):
+    body, content_type = multipart_body([("file", IMAGE)], filenames={"file": "photo.png"})
+    filename = upload(StreamingRequest(body, content_type, chunk_size=100))
+    assert filename.endswith(".png")
+    assert (upload_dir / filename).read_bytes() == IMAGE
+
+def test_declared_oversized_upload_is_rejected_before_reading(upload_dir):
+    body, content_type = multipart_body([("file", IMAGE)], filenames={"file": "photo.png"})
+    request = StreamingRequest(body, content_type, content_length=file_handler.MAX_UPLOAD_REQUEST_SIZE + 1)
+    assert upload_error(request).status_code == 400
+    assert request.chunks_read == 0
+
+def test_oversized_upload_without_length_stops_at_the_limit(upload_dir, monkeypatch):
+    monkeypatch.setattr(file_handler, "MAX_FILE_SIZE", 100)
+    body, content_type = multipart_body([("file", IMAGE)], filenames={"file": "photo.png"})
+    request = StreamingRequest(body, content_type, chunk_size=50)
+    assert upload_error(request).status_code == 400
+    assert request.chunks_read < len(request._chunks)
+    assert list(upload_dir.iterdir()) == []
+
+def test_upload_type_and_missing_fields_are_rejected(upload_dir):
+    body, content_type = multipart_body([("file", IMAGE)], filenames={"file": "script.sh"})
+    assert "Invalid file type" in upload_error(StreamingRequest(body, content_type)).detail
+
+    body, content_type = multipart_body([("image", IMAGE)], filenames={"image": "photo.png"})
+    assert upload_error(StreamingRequest(body, content_type)).status_code == 422
+
+    body, content_type = multipart_body([("file", b"")], filenames={"file": "photo.png"})
+    assert upload_error(StreamingRequest(body, content_type)).detail == "Field file is empty"
+    assert list(upload_dir.iterdir()) == []
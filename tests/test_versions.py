@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime, timedelta
+
+MISSING_ID = "000000000000000000000000"
+
+def new_memo(title="Dentist"):
+    return {"title": title, "content": "At nine", "image": None, "alarm": {"enabled": False, "time": None}, "type": "text"}
+
+def test_every_write_advances_the_version(memo_db):
+    async def scenario():
+        assert await memo_db.current_version() == 0
+        memo = await memo_db.create_memo(new_memo())
+        assert memo["version"] == 1
+        await memo_db.update_memo(memo["id"], {"title": "Dentist at nine"})
+        await memo_db.toggle_alarm(memo["id"])
+        await memo_db.delete_memo(memo["id"])
+        assert await memo_db.current_version() == 4
+
+    asyncio.run(scenario())
+
+def test_writes_to_missing_memos_leave_the_version_alone(memo_db):
+    async def scenario():
+        await memo_db.create_memo(new_memo())
+        assert await memo_db.update_memo(MISSING_ID, {"title": "Gone"}) is None
+        assert await memo_db.toggle_alarm(MISSING_ID) is None
+        assert await memo_db.delete_memo(MISSING_ID) is None
+        assert await memo_db.current_version() == 1
+        assert await memo_db.counters.find_one({"_id": "memos"}) == {"_id": "memos", "seq": 1}
+
+    asyncio.run(scenario())
+
+def test_a_miss_keeps_its_versions_once_another_write_allocated_after_it(memo_db):
+    async def scenario():
+        async with memo_db._versioned_write() as missed:
+            async with memo_db._versioned_write() as other:
+                assert other.first == missed.first + 1
+            missed.unused()
+        counter = await memo_db.counters.find_one({"_id": "memos"})
+        assert counter == {"_id": "memos", "seq": 2}
+
+    asyncio.run(scenario())
+
+def test_versions_of_unfinished_writes_are_not_advertised(memo_db):
+    async def scenario():
+        await memo_db.create_memo(new_memo())
+        async with memo_db._versioned_write(3) as slow:
+            assert slow.first == 2
+            # A later write that finished first is still hidden behind the slow one
+            await memo_db.create_memo(new_memo("Later"))
+            assert await memo_db.current_version() == 1
+            counter = await memo_db.counters.find_one({"_id": "memos"})
+            assert counter["seq"] == 5
+        assert await memo_db.current_version() == 5
+
+    asyncio.run(scenario())
+
+def test_expired_leases_are_ignored_and_pruned(memo_db):
+    async def scenario():
+        await memo_db.create_memo(new_memo())
+        # Left behind by a worker that died mid-write an hour ago
+        started = int((datetime.utcnow() - timedelta(hours=1)).timestamp() * 1000)
+        await memo_db.counters.update_one({"_id": "memos"}, {"$set": {f"lease_{started}_dead": 1}})
+        assert await memo_db.current_version() == 1
+
+        await memo_db.prune_tombstones()
+        assert await memo_db.counters.find_one({"_id": "memos"}) == {"_id": "memos", "seq": 1}
+
+    asyncio.run(scenario())
+
+def test_delta_reports_changes_and_tombstones_after_a_version(memo_db):
+    async def scenario():
+        kept = await memo_db.create_memo(new_memo("Kept"))
+        dropped = await memo_db.create_memo(new_memo("Dropped"))
+        await memo_db.update_memo(kept["id"], {"title": "Kept and edited"})
+        await memo_db.delete_memo(dropped["id"])
+
+        delta = await memo_db.changes_since(2)
+        assert delta["version"] == 4 and not delta["resync"]
+        assert [memo["title"] for memo in delta["memos"]] == ["Kept and edited"]
+        assert delta["deleted"] == [dropped["id"]]
+        assert await memo_db.changes_since(4) == {"version": 4, "memos": [], "deleted": [], "resync": False}
+        assert (await memo_db.changes_since(5))["resync"]
+
+    asyncio.run(scenario())
+
+def test_racing_tombstones_keep_the_newest_version(memo_db):
+    async def scenario():
+        await memo_db._write_tombstones([("m1", 7)])
+        await memo_db._write_tombstones([("m1", 5)])
+        assert (await memo_db.tombstones.find_one({"_id": "m1"}))["version"] == 7
+
+    asyncio.run(scenario())
+
+def test_deltas_older_than_pruned_tombstones_ask_for_a_resync(memo_db):
+    async def scenario():
+        memo = await memo_db.create_memo(new_memo())
+        await memo_db.delete_memo(memo["id"])
+        await memo_db.create_memo(new_memo("Newer"))
+        assert await memo_db.prune_tombstones(max_age=timedelta(seconds=-1)) == 1
+
+        assert (await memo_db.changes_since(0))["resync"]
+        delta = await memo_db.changes_since(2)
+        assert not delta["resync"] and [memo["title"] for memo in delta["memos"]] == ["Newer"]
+
+    asyncio.run(scenario())